@@ -0,0 +1,145 @@
+"""Admission control for heavy admin and bulk routes.
+
+Admin reports, catalog cleanups and cascading subject updates share the
+event loop and the Mongo pool with student logins and material fetches.
+Each heavy route class therefore gets a gate:
+
+* at most ``concurrency`` requests of the class run at once;
+* up to ``max_queue`` more wait, first come first served, for at most
+  ``timeout`` seconds;
+* anything beyond that is turned away at once with ``503`` and
+  ``Retry-After``, before it has touched the database.
+
+Rejections are counted in ``admission_rejections_total{route_class,reason}``
+(``queue_full`` / ``timeout``); in-flight and queued requests and the time
+spent waiting for a slot are exported per class as well.
+
+Limits come from ``ADMISSION_<CLASS>_CONCURRENCY`` / ``_QUEUE`` /
+``_TIMEOUT``. A concurrency of ``0`` turns the gate off.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Mapping, Tuple
+
+from fastapi import HTTPException
+
+from metrics import REGISTRY
+
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    'admission_rejections_total', 'Requests turned away by admission control.', ('route_class', 'reason'))
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    'admission_in_flight', 'Requests holding an admission slot.', ('route_class',))
+ADMISSION_QUEUED = REGISTRY.gauge(
+    'admission_queued', 'Requests waiting for an admission slot.', ('route_class',))
+ADMISSION_WAIT = REGISTRY.histogram(
+    'admission_wait_seconds', 'Time spent waiting for an admission slot.', ('route_class',))
+
+# (concurrency, queue, timeout seconds) per route class
+DEFAULT_LIMITS: Dict[str, Tuple[int, int, float]] = {
+    # Admin lists and reports
+    'admin': (4, 16, 5.0),
+    # Cleanups, imports, bulk grants, rollup refreshes and cascading renames
+    'bulk': (1, 2, 10.0),
+}
+
+
+class AdmissionGate:
+    def __init__(self, route_class: str, concurrency: int, max_queue: int, timeout: float):
+        self.route_class = route_class
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        # Futures rather than an asyncio.Semaphore: nothing here is bound to one event loop
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        if self.concurrency <= 0:
+            return
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self._report()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject('queue_full')
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._report()
+        start = time.perf_counter()
+        try:
+            # release() hands its slot straight to the waiter, so active stays unchanged
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            if not self._handed_over(waiter):
+                self._reject('timeout')
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot that arrived at the same moment
+            if self._handed_over(waiter):
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            ADMISSION_WAIT.observe(self.route_class, value=time.perf_counter() - start)
+            self._report()
+
+    def release(self):
+        if self.concurrency <= 0:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._report()
+                return
+        self.active -= 1
+        self._report()
+
+    @staticmethod
+    def _handed_over(waiter: asyncio.Future) -> bool:
+        return waiter.done() and not waiter.cancelled()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTIONS.inc(self.route_class, reason)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Too many {self.route_class} requests in progress, retry shortly",
+            headers={'Retry-After': str(max(1, math.ceil(self.timeout)))},
+        )
+
+    def _report(self):
+        ADMISSION_IN_FLIGHT.set(self.route_class, value=self.active)
+        ADMISSION_QUEUED.set(self.route_class, value=len(self._waiters))
+
+    def snapshot(self) -> dict:
+        return {
+            'concurrency': self.concurrency,
+            'max_queue': self.max_queue,
+            'timeout': self.timeout,
+            'in_flight': self.active,
+            'queued': len(self._waiters),
+        }
+
+
+def gates_from_env(environ: Mapping[str, str]) -> Dict[str, AdmissionGate]:
+    gates = {}
+    for route_class, (concurrency, queue, timeout) in DEFAULT_LIMITS.items():
+        prefix = f"ADMISSION_{route_class.upper()}"
+        gates[route_class] = AdmissionGate(
+            route_class,
+            concurrency=int(environ.get(f"{prefix}_CONCURRENCY", str(concurrency))),
+            max_queue=int(environ.get(f"{prefix}_QUEUE", str(queue))),
+            timeout=float(environ.get(f"{prefix}_TIMEOUT", str(timeout))),
+        )
+    return gates
@@ -0,0 +1,157 @@
+"""Buffered audit log of admin mutations and authentication events.
+
+Handlers call ``AuditLog.record()``. It appends the event to an in-memory
+queue and returns at once, without a database round trip. A background task
+writes the queue to ``audit_log`` with ``insert_many``:
+
+* as soon as ``batch_size`` events are waiting, or
+* every ``flush_interval`` seconds, whichever comes first.
+
+Memory is bounded. When the queue already holds ``max_queue`` events, new
+ones are dropped and counted in ``audit_events_total{result="dropped"}``, so
+a Mongo outage can't grow the worker without limit. A failed batch goes back
+to the front of the queue, as far as there's room. ``stop()`` flushes what is
+left on shutdown.
+
+Every event records when it happened (``at``, a BSON date), the action, the
+actor, the target, and the client IP and route of the request. A TTL index
+on ``at`` expires events after ``AUDIT_RETENTION_DAYS``.
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+from starlette.requests import Request
+
+from metrics import REGISTRY
+from rate_limit import client_ip
+from slow_queries import current_scope
+
+logger = logging.getLogger(__name__)
+
+AUDIT_EVENTS = REGISTRY.counter(
+    'audit_events_total', 'Audit events by outcome (queued, written, dropped).', ('result',))
+AUDIT_QUEUE = REGISTRY.gauge('audit_queue_depth', 'Audit events waiting to be written.')
+AUDIT_FLUSH_DURATION = REGISTRY.histogram('audit_flush_duration_seconds', 'Time to write one audit batch.')
+
+DUPLICATE_KEY = 11000
+
+
+class AuditLog:
+    def __init__(self, collection=None, batch_size: int = 500, flush_interval: float = 2.0,
+                 max_queue: int = 10_000, retention_days: int = 180):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.retention_days = retention_days
+        self.queue: Deque[Dict[str, Any]] = deque()
+        self.dropped = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, action: str, actor: Optional[str], target: Optional[str] = None, **details):
+        """Queue one event; never blocks and never raises."""
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            AUDIT_EVENTS.inc('dropped')
+            return
+        event: Dict[str, Any] = {
+            'at': datetime.now(timezone.utc),
+            'action': action,
+            'actor': actor,
+            'target': target,
+        }
+        scope = current_scope.get()
+        if scope is not None:
+            event['ip'] = client_ip(Request(scope))
+            event['route'] = f"{scope.get('method', '')} {scope.get('path', '')}"
+        if details:
+            event['details'] = details
+        self.queue.append(event)
+        AUDIT_EVENTS.inc('queued')
+        AUDIT_QUEUE.set(value=len(self.queue))
+        if len(self.queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write everything queued so far, one batch at a time; returns the number written."""
+        written = 0
+        while self.queue and self.collection is not None:
+            batch: List[Dict[str, Any]] = []
+            while self.queue and len(batch) < self.batch_size:
+                batch.append(self.queue.popleft())
+            # insert_many gives each event its _id, so a retried batch can't write duplicates
+            try:
+                with AUDIT_FLUSH_DURATION.time():
+                    await self.collection.insert_many(batch, ordered=False)
+                failed = []
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except BulkWriteError as e:
+                # Duplicate keys are events an earlier, seemingly failed attempt already wrote
+                failed = [batch[error['index']] for error in e.details.get('writeErrors', [])
+                          if error.get('code') != DUPLICATE_KEY]
+                logger.error(f"Audit log flush failed for {len(failed)} events")
+            except Exception as e:
+                logger.error(f"Audit log flush failed: {str(e)}")
+                failed = batch
+            written += len(batch) - len(failed)
+            AUDIT_EVENTS.inc('written', amount=len(batch) - len(failed))
+            if failed:
+                self._requeue(failed)
+                break
+        AUDIT_QUEUE.set(value=len(self.queue))
+        return written
+
+    def _requeue(self, events: List[Dict[str, Any]]):
+        room = max(self.max_queue - len(self.queue), 0)
+        keep = events[:room]
+        self.queue.extendleft(reversed(keep))
+        lost = len(events) - len(keep)
+        if lost:
+            self.dropped += lost
+            AUDIT_EVENTS.inc('dropped', amount=lost)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()  # bound to the running loop
+            self._task = asyncio.create_task(self._run(), name='audit-log')
+
+    async def stop(self):
+        """Stop the writer and flush what is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index('at', expireAfterSeconds=self.retention_days * 86400)
+        await self.collection.create_index([('actor', 1), ('at', -1)])
+        await self.collection.create_index([('action', 1), ('at', -1)])
+
+
+def audit_log_from_env(environ) -> AuditLog:
+    return AuditLog(
+        batch_size=int(environ.get('AUDIT_BATCH_SIZE', '500')),
+        flush_interval=float(environ.get('AUDIT_FLUSH_INTERVAL', '2')),
+        max_queue=int(environ.get('AUDIT_MAX_QUEUE', '10000')),
+        retention_days=int(environ.get('AUDIT_RETENTION_DAYS', '180')),
+    )
@@ -0,0 +1,196 @@
+"""Blocking-call watchdog for the event loop.
+
+A synchronous call inside an ``async def`` handler (bcrypt, the Razorpay SDK,
+a large ``json`` dump) stops every other request on the worker until it
+returns. asyncio's debug mode reports these, but it slows everything down and
+isn't meant for production. This watchdog is cheap enough to leave on:
+
+* a task on the loop refreshes a heartbeat every ``interval``;
+* a daemon thread checks it just as often. When the heartbeat is more than
+  ``threshold`` late, the loop is stuck in synchronous code. The thread then
+  grabs the loop thread's stack from ``sys._current_frames()``. From that
+  stack it takes the route handler (the outermost ``server.py`` frame), the
+  code that blocked (the innermost frame of our own code), and the request
+  being served (from the ``QueryContextMiddleware`` frame).
+
+A ``sample_rate`` fraction of stalls is captured. Captures are grouped by
+handler and stack, and the last ``max_reports`` groups are kept for
+``GET /api/admin/diagnostics``. Each new group is also logged with its stack.
+"""
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+
+from metrics import REGISTRY
+from slow_queries import QueryContextMiddleware
+
+logger = logging.getLogger(__name__)
+
+BLOCKING_CALLS = REGISTRY.counter(
+    'event_loop_blocking_calls_total', 'Synchronous sections that held the event loop past the threshold.',
+    ('handler',))
+
+BACKEND_DIR = Path(__file__).resolve().parent
+ROUTES_FILE = str(BACKEND_DIR / 'server.py')
+# Innermost frames kept per captured stack
+STACK_LIMIT = 25
+OUTSIDE_HANDLERS = '(outside route handlers)'
+
+
+class BlockingWatchdog:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.02, sample_rate: float = 1.0,
+                 max_reports: int = 100):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.max_reports = max_reports
+        self.beat = time.monotonic()
+        self.stalls = 0
+        self.reports: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name='blocking-watchdog')
+        self._thread = threading.Thread(target=self._watch, name='blocking-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread.join(timeout=1)
+        self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        seen_beat = None
+        key = None
+        while not self._stop.wait(self.interval):
+            beat = self.beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold:
+                continue
+            if beat != seen_beat:
+                # A new stall
+                seen_beat = beat
+                self.stalls += 1
+                key = self.capture(blocked) if random.random() < self.sample_rate else None
+            elif key is not None:
+                self._extend(key, blocked)
+
+    def capture(self, blocked: float) -> Optional[Tuple[str, str]]:
+        """Record the loop thread's current stack; returns the report key."""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame)
+        handler, blocked_in = blocking_site(stack)
+        route = current_request(frame)
+        lines = traceback.format_list(stack[-STACK_LIMIT:])
+        key = (handler, ''.join(lines[-5:]))
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            report = self.reports.pop(key, None)
+            new = report is None
+            if new:
+                report = {'handler': handler, 'blocked_in': blocked_in, 'route': route, 'count': 0, 'max_ms': 0.0,
+                          'first_seen': now, 'stack': [line.rstrip() for line in lines]}
+            report['count'] += 1
+            report['route'] = route or report['route']
+            report['last_ms'] = round(blocked * 1000, 1)
+            report['max_ms'] = max(report['max_ms'], report['last_ms'])
+            report['last_seen'] = now
+            self.reports[key] = report
+            while len(self.reports) > self.max_reports:
+                self.reports.popitem(last=False)
+        BLOCKING_CALLS.inc(handler)
+        if new:
+            logger.warning(
+                f"Event loop blocked for {blocked * 1000:.0f}+ ms in {blocked_in} via {handler} "
+                f"({route or 'no request'}):\n"
+                + ''.join(lines)
+            )
+        return key
+
+    def _extend(self, key: Tuple[str, str], blocked: float):
+        with self._lock:
+            report = self.reports.get(key)
+            if report is not None:
+                report['last_ms'] = round(blocked * 1000, 1)
+                report['max_ms'] = max(report['max_ms'], report['last_ms'])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reports = sorted(self.reports.values(), key=lambda r: r['last_seen'], reverse=True)
+            reports = [dict(r) for r in reports]
+        return {
+            'enabled': self._task is not None,
+            'threshold_ms': round(self.threshold * 1000, 1),
+            'sample_rate': self.sample_rate,
+            'stalls': self.stalls,
+            'reports': reports,
+        }
+
+
+def blocking_site(stack: traceback.StackSummary) -> Tuple[str, str]:
+    """``(handler, blocked_in)``: the outermost route frame and the innermost frame of our code."""
+    ours = [f for f in stack if f.filename.startswith(str(BACKEND_DIR))]
+    routes = [f for f in ours if f.filename == ROUTES_FILE]
+    # e.g. request validation or a middleware, before any handler runs
+    handler = frame_name(routes[0]) if routes else OUTSIDE_HANDLERS
+    innermost = ours[-1] if ours else stack[-1] if stack else None
+    return handler, frame_name(innermost) if innermost else 'unknown'
+
+
+def frame_name(frame: traceback.FrameSummary) -> str:
+    return f"{Path(frame.filename).stem}.{frame.name}"
+
+
+def current_request(frame) -> Optional[str]:
+    """``METHOD path`` of the request whose middleware frame is on the stack."""
+    middleware = QueryContextMiddleware.__call__.__code__
+    while frame is not None:
+        if frame.f_code is middleware:
+            scope = frame.f_locals.get('scope') or {}
+            return f"{scope.get('method', '')} {scope.get('path', '')}".strip() or None
+        frame = frame.f_back
+    return None
+
+
+def watchdog_from_env(environ: Mapping[str, str]) -> Optional[BlockingWatchdog]:
+    """The watchdog when ``BLOCKING_WATCHDOG`` is enabled, else None."""
+    if environ.get('BLOCKING_WATCHDOG', 'false').lower() != 'true':
+        return None
+    return BlockingWatchdog(
+        threshold=float(environ.get('BLOCKING_THRESHOLD_MS', '100')) / 1000,
+        interval=float(environ.get('BLOCKING_CHECK_INTERVAL_MS', '20')) / 1000,
+        sample_rate=float(environ.get('BLOCKING_SAMPLE_RATE', '1')),
+        max_reports=int(environ.get('BLOCKING_MAX_REPORTS', '100')),
+    )
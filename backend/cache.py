@@ -0,0 +1,80 @@
+"""Small in-process cache for shared, public response bodies.
+
+Catalog reads such as ``/api/subjects`` and ``/api/updates`` return the same
+JSON to every student. Entries are stored already serialized and
+precompressed (see ``compression.PrecompressedBody``), so a hit does no
+database, serialization or compression work. Concurrent misses for the
+same key share one load. Admin writes call ``invalidate()``; the TTL is
+only a safety net.
+
+Keys carry version stamps (``subjects:{stamp}``), so each write leaves the
+previous key behind. Every ``set`` therefore drops expired entries, and then
+the least recently used ones beyond ``max_entries``.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from coalesce import SingleFlight
+from compression import PrecompressedBody
+from fast_json import dumps
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = 30.0, minimum_size: int = 1024, max_entries: int = 256):
+        self.ttl = ttl
+        self.minimum_size = minimum_size
+        self.max_entries = max_entries
+        # Least recently used first
+        self._entries: OrderedDict[str, Tuple[float, PrecompressedBody]] = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.flight = SingleFlight('response_cache')
+
+    def get(self, key: str) -> Optional[PrecompressedBody]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, content: Any) -> PrecompressedBody:
+        body = PrecompressedBody(dumps(content), minimum_size=self.minimum_size)
+        now = time.monotonic()
+        for expired in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[expired]
+        self._entries[key] = (now + self.ttl, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return body
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> PrecompressedBody:
+        body = self.get(key)
+        if body is not None:
+            self.hits += 1
+            return body
+        self.misses += 1
+        # Concurrent misses for one key share a single load
+        return await self.flight.do(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> PrecompressedBody:
+        generation = self._generation
+        content = await loader()
+        if generation != self._generation:
+            # Invalidated while loading: serve the result but don't cache it
+            return PrecompressedBody(dumps(content), minimum_size=self.minimum_size)
+        return self.set(key, content)
+
+    def invalidate(self, *prefixes: str):
+        """Drop every entry whose key starts with one of ``prefixes`` (all if none)."""
+        self._generation += 1
+        if not prefixes:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if k.startswith(prefixes)]:
+            del self._entries[key]
@@ -0,0 +1,438 @@
+"""Bulk catalog import for subjects and materials.
+
+``POST /api/admin/import`` takes a CSV or JSON upload and reads the request
+body as a stream. Rows are parsed and validated one at a time and written in
+ordered ``bulk_write`` batches of upserts, so memory use depends on the batch
+size, not on the size of the file.
+
+Every row names its ``kind``: ``subject`` or ``material``.
+
+* Subjects are keyed by their slug ID (see ``make_subject_id``).
+* Materials are keyed by ``id`` when one is given. Otherwise they are keyed
+  by ``(subject_id, title)``, so importing the same file twice does not
+  create duplicates.
+
+A material may name its subject directly (``subject_id``) or by ``board``,
+``class_name`` and ``subject_name``. The subject must already exist or appear
+earlier in the same file.
+
+Accepted formats:
+
+* CSV with a header row (``text/csv``);
+* JSON Lines, one object per line (``application/x-ndjson``);
+* a JSON array of objects (``application/json``), decoded incrementally.
+  A malformed object is reported as a row error and decoding resumes after
+  it; at most ``MAX_ROW_CHARS`` are buffered for one row.
+
+An upsert only ``$set``s the fields a row provides. Defaults such as
+``is_visible`` apply to new documents only, so a row that leaves a field
+out never resets it on an existing subject or material.
+
+Row numbers in the error report count data rows from 1 and skip the CSV
+header.
+"""
+import codecs
+import csv
+import json
+import re
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError, field_validator
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import ensure_unique_index
+
+FORMATS = ('csv', 'ndjson', 'json')
+# A JSON array row still open after this many characters is reported and skipped
+MAX_ROW_CHARS = 1 << 20
+NEXT_OBJECT = re.compile(r',\s*\{')
+SCALAR_END = re.compile(r'[,\]]')
+
+
+class ImportFormatError(Exception):
+    """The upload as a whole cannot be read (bad format, bad header...)."""
+
+
+class SubjectRow(BaseModel):
+    board: str
+    class_name: str
+    subject_name: str
+    price: int
+    duration_months: int = 6
+    is_visible: bool = True
+
+    @field_validator('board', 'class_name', 'subject_name')
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError('must not be blank')
+        return value
+
+
+class MaterialRow(BaseModel):
+    id: Optional[str] = None
+    subject_id: Optional[str] = None
+    board: Optional[str] = None
+    class_name: Optional[str] = None
+    subject_name: Optional[str] = None
+    title: str
+    type: str
+    link: str
+    description: str = ""
+
+    @field_validator('title', 'link')
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError('must not be blank')
+        return value
+
+    @field_validator('type')
+    @classmethod
+    def known_type(cls, value: str) -> str:
+        value = value.strip().lower()
+        if value not in ('pdf', 'video'):
+            raise ValueError("must be 'pdf' or 'video'")
+        return value
+
+
+def detect_format(content_type: str, requested: Optional[str] = None) -> str:
+    if requested:
+        if requested not in FORMATS:
+            raise ImportFormatError(f"Unknown import format: {requested}")
+        return requested
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/jsonlines'):
+        return 'ndjson'
+    if content_type == 'application/json':
+        return 'json'
+    raise ImportFormatError("Send text/csv, application/x-ndjson or application/json, or pass ?format=")
+
+
+async def _text_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    pending = ''
+    async for text in _text_chunks(chunks):
+        pending += text
+        *complete, pending = pending.split('\n')
+        for line in complete:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+async def csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """``(row_number, row, parse_error)`` for each CSV record after the header."""
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    quotes = 0
+    number = 0
+    async for line in _lines(chunks):
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue  # a quoted field spans lines
+        fields = next(csv.reader(record), [])
+        record, quotes = [], 0
+        if not any(f.strip() for f in fields):
+            continue
+        if header is None:
+            header = [f.strip().lower() for f in fields]
+            if 'kind' not in header:
+                raise ImportFormatError("CSV header must include a 'kind' column")
+            continue
+        number += 1
+        if len(fields) > len(header):
+            yield number, None, f"expected {len(header)} columns, got {len(fields)}"
+            continue
+        # Empty cells mean "use the default"
+        yield number, {k: v for k, v in zip(header, fields) if v != ''}, None
+    if record:
+        number += 1
+        yield number, None, 'unterminated quoted field'
+
+
+async def ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    number = 0
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'expected a JSON object'
+            continue
+        yield number, row, None
+
+
+def _value_end(text: str, start: int) -> int:
+    """Index just past the JSON value starting at ``start``, or -1 if ``text`` doesn't close it yet.
+
+    Only brackets and strings are tracked, which is enough to tell a
+    malformed row from one whose bytes haven't all arrived.
+    """
+    if text[start] not in '{[':
+        match = SCALAR_END.search(text, start)
+        return match.start() if match else -1
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return -1
+
+
+async def json_array_rows(chunks: AsyncIterator[bytes],
+                          max_row_chars: int = MAX_ROW_CHARS) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Objects of a top-level JSON array, decoded as the bytes arrive."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    skipping = False  # after a row too long to buffer, until the next ``,{``
+    number = 0
+
+    def skip(chars: str):
+        nonlocal position
+        while position < len(buffer) and buffer[position] in chars:
+            position += 1
+
+    def resync() -> bool:
+        """Move to the next ``,{``; False (keeping a trailing comma) if it hasn't arrived yet."""
+        nonlocal position
+        match = NEXT_OBJECT.search(buffer, position)
+        if match:
+            position = match.start() + 1
+            return True
+        tail = buffer.rstrip(' \t\r\n')
+        position = len(tail) - 1 if tail.endswith(',') else len(buffer)
+        return False
+
+    async for text in _text_chunks(chunks):
+        buffer = buffer[position:] + text
+        position = 0
+        while True:
+            if skipping:
+                if not resync():
+                    break
+                skipping = False
+            skip(' \t\r\n')
+            if not started:
+                if position >= len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise ImportFormatError('Expected a JSON array of rows')
+                started = True
+                position += 1
+                continue
+            skip(' \t\r\n,')
+            if position >= len(buffer) or buffer[position] == ']':
+                break
+            try:
+                row, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                end = _value_end(buffer, position)
+                if end == -1 and len(buffer) - position <= max_row_chars:
+                    break  # incomplete row, wait for more bytes
+                number += 1
+                if end == -1:
+                    yield number, None, f"row is malformed or longer than {max_row_chars} characters"
+                    skipping = True
+                else:
+                    yield number, None, f"invalid JSON: {getattr(e, 'msg', e)}"
+                    position = end
+                continue
+            position = end
+            number += 1
+            if isinstance(row, dict):
+                yield number, row, None
+            else:
+                yield number, None, 'expected a JSON object'
+    rest = buffer[position:].strip()
+    if not started or not (skipping or rest.startswith(']')):
+        raise ImportFormatError(f"Malformed JSON array after row {number}")
+
+
+async def ensure_indexes(db):
+    """Indexes behind the upsert keys, so each upsert is a point lookup."""
+    await ensure_unique_index(db.subjects, 'id')
+    await db.materials.create_index('id')
+    await db.materials.create_index([('subject_id', 1), ('title', 1)])
+
+
+PARSERS = {'csv': csv_rows, 'ndjson': ndjson_rows, 'json': json_array_rows}
+
+
+def _defaults(row: BaseModel) -> dict:
+    """Defaults of the fields ``row`` left out, for ``$setOnInsert``."""
+    return {
+        name: field.default for name, field in type(row).model_fields.items()
+        if name not in row.model_fields_set and not field.is_required() and field.default is not None
+    }
+
+
+def _error_message(error: ValidationError) -> str:
+    return '; '.join(
+        f"{'.'.join(str(p) for p in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+
+class CatalogImporter:
+    """Validate rows and upsert them in ordered batches."""
+
+    def __init__(self, db, subject_id_for: Callable[[str, str, str], str],
+                 batch_size: int = 1000, max_rows: int = 50_000, max_errors: int = 1000):
+        self.db = db
+        self.subject_id_for = subject_id_for
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.max_errors = max_errors
+        self.known_subjects: set = set()
+        self.errors: List[dict] = []
+        self.error_count = 0
+        self.rows = 0
+        self.truncated = False
+        self.counts = {
+            'subjects': {'inserted': 0, 'updated': 0},
+            'materials': {'inserted': 0, 'updated': 0},
+        }
+        # Pending writes per collection: (row_number, operation)
+        self._batches: Dict[str, List[Tuple[int, UpdateOne]]] = {'subjects': [], 'materials': []}
+
+    def error(self, row: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'error': message})
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str) -> dict:
+        self.known_subjects = set(await self.db.subjects.distinct('id'))
+        async for number, row, parse_error in PARSERS[fmt](chunks):
+            if self.rows >= self.max_rows:
+                self.truncated = True
+                break
+            self.rows += 1
+            if parse_error:
+                self.error(number, parse_error)
+                continue
+            self.add(number, row)
+            if len(self._batches['subjects']) + len(self._batches['materials']) >= self.batch_size:
+                await self.flush()
+        await self.flush()
+        return self.report()
+
+    def add(self, number: int, row: dict):
+        kind = str(row.get('kind', '')).strip().lower()
+        fields = {k: v for k, v in row.items() if k != 'kind'}
+        try:
+            if kind == 'subject':
+                self._add_subject(number, SubjectRow(**fields))
+            elif kind == 'material':
+                self._add_material(number, MaterialRow(**fields))
+            else:
+                self.error(number, "kind must be 'subject' or 'material'")
+        except ValidationError as e:
+            self.error(number, _error_message(e))
+
+    def _add_subject(self, number: int, subject: SubjectRow):
+        subject_id = self.subject_id_for(subject.board, subject.class_name, subject.subject_name)
+        self.known_subjects.add(subject_id)
+        self._batches['subjects'].append((number, UpdateOne(
+            {'id': subject_id},
+            {'$set': {'id': subject_id, **subject.model_dump(exclude_unset=True)}, '$setOnInsert': _defaults(subject)},
+            upsert=True,
+        )))
+
+    def _add_material(self, number: int, material: MaterialRow):
+        subject_id = material.subject_id
+        if not subject_id:
+            if not (material.board and material.class_name and material.subject_name):
+                self.error(number, 'material needs subject_id or board, class_name and subject_name')
+                return
+            subject_id = self.subject_id_for(
+                material.board.strip(), material.class_name.strip(), material.subject_name.strip())
+        if subject_id not in self.known_subjects:
+            self.error(number, f"unknown subject: {subject_id}")
+            return
+        fields = {
+            'subject_id': subject_id,
+            **material.model_dump(include={'title', 'type', 'link', 'description'}, exclude_unset=True),
+        }
+        defaults = _defaults(material)
+        if material.id:
+            operation = UpdateOne(
+                {'id': material.id}, {'$set': {'id': material.id, **fields}, '$setOnInsert': defaults}, upsert=True)
+        else:
+            operation = UpdateOne(
+                {'subject_id': subject_id, 'title': material.title},
+                {'$set': fields, '$setOnInsert': {'id': f"mat-{str(uuid.uuid4())[:8]}", **defaults}},
+                upsert=True,
+            )
+        self._batches['materials'].append((number, operation))
+
+    async def flush(self):
+        # Subjects first, so materials in the same batch find their subject
+        for collection in ('subjects', 'materials'):
+            batch, self._batches[collection] = self._batches[collection], []
+            while batch:
+                batch = await self._write(collection, batch)
+
+    async def _write(self, collection: str, batch: List[Tuple[int, UpdateOne]]) -> List[Tuple[int, UpdateOne]]:
+        """Write ``batch`` in order; on a failed row, report it and return the rest."""
+        try:
+            result = await self.db[collection].bulk_write([op for _, op in batch], ordered=True)
+            self._count(collection, result.bulk_api_result)
+            return []
+        except BulkWriteError as e:
+            details = e.details
+            self._count(collection, details)
+            failed = details['writeErrors'][0]
+            self.error(batch[failed['index']][0], failed.get('errmsg', 'write failed'))
+            return batch[failed['index'] + 1:]
+
+    def _count(self, collection: str, result: dict):
+        self.counts[collection]['inserted'] += result.get('nUpserted', 0)
+        self.counts[collection]['updated'] += result.get('nModified', 0)
+
+    def report(self) -> dict:
+        return {
+            'rows': self.rows,
+            'truncated': self.truncated,
+            'subjects': self.counts['subjects'],
+            'materials': self.counts['materials'],
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
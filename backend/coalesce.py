@@ -0,0 +1,75 @@
+"""Request coalescing ("single flight") for hot read paths.
+
+When an announcement goes out, thousands of students request the same
+subjects, updates or material list at the same moment. ``SingleFlight.do``
+runs the loader once per key; every concurrent caller with the same key
+awaits that one in-flight call and gets its result, or its exception.
+Nothing is cached: once the call finishes the key is forgotten, and the next
+caller starts a new one.
+
+The semantics are cancellation-safe:
+
+* a cancelled caller stops waiting, but the shared call keeps running for
+  the other callers (it runs in its own task behind ``asyncio.shield``);
+* when the last caller is cancelled, the shared call is cancelled too and
+  the key is released at once, so a later caller never joins a dying call.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from metrics import REGISTRY
+
+COALESCED_CALLS = REGISTRY.counter(
+    'coalesced_calls_total', 'Calls through a single-flight group, by role.', ('group', 'role'))
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def waiters(self, key: Hashable) -> int:
+        """Callers currently waiting on ``key`` (0 when nothing is in flight)."""
+        call = self._calls.get(key)
+        return call.waiters if call else 0
+
+    def in_flight(self) -> Dict[Hashable, int]:
+        return {key: call.waiters for key, call in self._calls.items()}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(loader()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+            COALESCED_CALLS.inc(self.name, 'leader')
+        else:
+            COALESCED_CALLS.inc(self.name, 'shared')
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left to receive the result
+                call.task.cancel()
+                self._release(key, call)
+
+    def _finished(self, key: Hashable, call: _Call):
+        self._release(key, call)
+        if not call.task.cancelled():
+            call.task.exception()  # retrieved here, so an unawaited failure isn't logged as lost
+
+    def _release(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
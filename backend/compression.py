@@ -0,0 +1,203 @@
+"""Negotiated response compression.
+
+``CompressionMiddleware`` compresses JSON / text responses with brotli (when the
+``brotli`` package is installed) or gzip, depending on the client's
+``Accept-Encoding``, once they pass a minimum size. Responses that already carry
+a ``Content-Encoding`` — such as precompressed cache hits built with
+``PrecompressedBody`` — are passed through untouched, so they cost no
+compression work at all.
+"""
+import gzip
+import zlib
+from typing import Dict, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript')
+
+
+def choose_encoding(accept_encoding: str, available: Sequence[str] = SUPPORTED_ENCODINGS) -> Optional[str]:
+    """Pick the preferred encoding from an ``Accept-Encoding`` header.
+
+    Honours q-values (``q=0`` means "not acceptable"); ties are broken by the
+    order of ``available``, so brotli wins over gzip.
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._br = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == 'br':
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data)
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+# ============= Precompressed bodies =============
+
+class PrecompressedBody:
+    """A serialized body stored together with its compressed variants.
+
+    Build it once when a cache entry is filled; every hit then just picks the
+    matching variant. Cache fills run on the event loop, so the levels match the
+    middleware's moderate defaults rather than the slow maximums.
+    """
+
+    __slots__ = ('raw', 'variants', 'media_type')
+
+    def __init__(
+        self,
+        raw: bytes,
+        media_type: str = 'application/json',
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ):
+        self.raw = raw
+        self.media_type = media_type
+        self.variants: Dict[str, bytes] = {}
+        if len(raw) >= minimum_size:
+            for encoding in SUPPORTED_ENCODINGS:
+                self.variants[encoding] = compress(raw, encoding, gzip_level=gzip_level, brotli_quality=brotli_quality)
+
+    def response(self, accept_encoding: str, headers: Dict[str, str] = None) -> Response:
+        headers = dict(headers or {})
+        headers['Vary'] = 'Accept-Encoding'
+        encoding = choose_encoding(accept_encoding, tuple(self.variants))
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+        return Response(self.raw, media_type=self.media_type, headers=headers)
+
+
+# ============= Middleware =============
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: Optional[str], send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+        self.compressor: Optional[_StreamCompressor] = None
+
+    async def send(self, message: Message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            headers = Headers(raw=message['headers'])
+            content_type = headers.get('content-type', '')
+            compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+            if compressible and 'accept-encoding' not in headers.get('vary', '').lower():
+                MutableHeaders(raw=message['headers']).add_vary_header('Accept-Encoding')
+            self.passthrough = (
+                not compressible
+                or self.encoding is None
+                or 'content-encoding' in headers
+                or message.get('status', 200) in (204, 304)
+            )
+            return
+
+        if message['type'] != 'http.response.body':
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self._flush_start()
+                await self._send(message)
+                return
+            self.compressor = _StreamCompressor(
+                self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality
+            )
+            headers = MutableHeaders(raw=self.start_message['headers'])
+            headers['Content-Encoding'] = self.encoding
+            if more_body:
+                del headers['Content-Length']
+            compressed = self.compressor.chunk(body, final=not more_body)
+            if not more_body:
+                headers['Content-Length'] = str(len(compressed))
+            await self._flush_start()
+            await self._send({'type': 'http.response.body', 'body': compressed, 'more_body': more_body})
+            return
+
+        compressed = self.compressor.chunk(body, final=not more_body)
+        await self._send({'type': 'http.response.body', 'body': compressed, 'more_body': more_body})
+
+    async def _flush_start(self):
+        if self.start_message is not None:
+            await self._send(self.start_message)
+            self.start_message = None
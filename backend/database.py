@@ -0,0 +1,157 @@
+"""MongoDB client configuration and read routing.
+
+Pool sizing, wait-queue timeout and wire compression come from the
+environment instead of driver defaults. Reads are routed per route class:
+
+* ``primary`` handle (default ``db``) — auth, payments, subscriptions and all
+  writes, which need read-your-writes;
+* ``catalog`` — public catalog reads (subjects, updates, material lists);
+* ``analytics`` — admin reporting (stats, user / subscription / payment lists).
+
+Catalog and analytics default to ``secondaryPreferred`` with bounded
+staleness, so on a replica set they move off the primary; on a standalone
+server they simply read from it.
+
+Admin reporting and bulk writes go through a second, smaller client
+(``admin_client_options``), so a long cleanup or report can hold at most
+``ADMIN_MONGO_MAX_POOL_SIZE`` connections and never drains the pool that
+student requests check out from.
+
+``ensure_unique_index`` backs insert-and-catch-DuplicateKeyError handlers.
+When existing duplicates block one, ``unique_enforced`` tells those handlers
+to check for an existing document first.
+"""
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from pymongo.errors import OperationFailure
+
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primarypreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondarypreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# Smallest value the driver accepts for maxStalenessSeconds
+MIN_MAX_STALENESS = 90
+DUPLICATE_KEY = 11000
+# IndexOptionsConflict / IndexKeySpecsConflict: a plain index on the field already exists
+INDEX_CONFLICT = (85, 86)
+
+# "<db>.<collection>.<field>" keys whose unique index could not be built
+_unenforced: Set[str] = set()
+
+
+def mongo_client_options(environ: Mapping[str, str]) -> Dict[str, object]:
+    """Keyword arguments for ``AsyncIOMotorClient`` from ``MONGO_*`` variables."""
+    options: Dict[str, object] = {
+        'maxPoolSize': int(environ.get('MONGO_MAX_POOL_SIZE', '100')),
+        'minPoolSize': int(environ.get('MONGO_MIN_POOL_SIZE', '0')),
+        'waitQueueTimeoutMS': int(environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        'serverSelectionTimeoutMS': int(environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000')),
+    }
+    if environ.get('MONGO_MAX_IDLE_TIME_MS'):
+        options['maxIdleTimeMS'] = int(environ['MONGO_MAX_IDLE_TIME_MS'])
+    compressors = environ.get('MONGO_COMPRESSORS', '')
+    if compressors:
+        options['compressors'] = compressors
+        if 'zlib' in compressors and environ.get('MONGO_ZLIB_LEVEL'):
+            options['zlibCompressionLevel'] = int(environ['MONGO_ZLIB_LEVEL'])
+    return options
+
+
+def admin_client_options(environ: Mapping[str, str]) -> Dict[str, object]:
+    """Options for the admin / bulk client: the same settings with its own pool budget."""
+    options = mongo_client_options(environ)
+    options['maxPoolSize'] = int(environ.get('ADMIN_MONGO_MAX_POOL_SIZE', '10'))
+    options['minPoolSize'] = 0
+    options['waitQueueTimeoutMS'] = int(
+        environ.get('ADMIN_MONGO_WAIT_QUEUE_TIMEOUT_MS', str(options['waitQueueTimeoutMS'])))
+    return options
+
+
+def read_preference_from_env(environ: Mapping[str, str], route_class: str, default: str = 'secondaryPreferred'):
+    """Read preference for a route class from ``<CLASS>_READ_PREFERENCE`` / ``<CLASS>_MAX_STALENESS_SECONDS``."""
+    prefix = route_class.upper()
+    mode = environ.get(f"{prefix}_READ_PREFERENCE", default).replace('_', '').lower()
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference for {route_class}: {mode}")
+    preference = READ_PREFERENCES[mode]
+    if preference is Primary:
+        return Primary()
+    staleness = int(environ.get(f"{prefix}_MAX_STALENESS_SECONDS", str(MIN_MAX_STALENESS)))
+    if staleness != -1:
+        staleness = max(staleness, MIN_MAX_STALENESS)
+    return preference(max_staleness=staleness)
+
+
+def routed_databases(client, db_name: str, environ: Mapping[str, str]):
+    """``(primary, catalog, analytics)`` handles onto the same database."""
+    primary = client.get_database(db_name, read_preference=Primary())
+    catalog = client.get_database(db_name, read_preference=read_preference_from_env(environ, 'catalog'))
+    analytics = client.get_database(db_name, read_preference=read_preference_from_env(environ, 'analytics'))
+    return primary, catalog, analytics
+
+
+def _unique_key(collection, field: str) -> str:
+    return f"{collection.full_name}.{field}"
+
+
+def unique_enforced(collection, field: str) -> bool:
+    """Whether the unique index on ``field`` exists, so inserts may rely on DuplicateKeyError."""
+    return _unique_key(collection, field) not in _unenforced
+
+
+async def duplicate_values(collection, field: str, match: Optional[dict] = None,
+                           limit: int = 20) -> List[Tuple[Any, int]]:
+    """Up to ``limit`` values of ``field`` held by more than one document, with their counts."""
+    pipeline = [
+        {'$match': match or {}},
+        {'$group': {'_id': f"${field}", 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$limit': limit},
+    ]
+    return [(group['_id'], group['count']) async for group in collection.aggregate(pipeline, allowDiskUse=True)]
+
+
+async def ensure_unique_index(collection, field: str, **options) -> bool:
+    """Unique index on ``field``, replacing an older plain one; returns whether it exists.
+
+    ``options`` are passed on to ``create_index`` (e.g. ``partialFilterExpression``).
+    Existing duplicates block the build. The app still starts: the duplicate
+    values are logged for cleanup, a plain index keeps lookups fast, and
+    ``unique_enforced`` reports False so create handlers check first. The
+    next startup after the cleanup builds the unique index.
+    """
+    key = _unique_key(collection, field)
+    try:
+        await collection.create_index(field, unique=True, **options)
+        _unenforced.discard(key)
+        return True
+    except OperationFailure as e:
+        if e.code == DUPLICATE_KEY:
+            _unenforced.add(key)
+            duplicates = await duplicate_values(collection, field, options.get('partialFilterExpression'))
+            listed = ', '.join(f"{value!r} ({count}x)" for value, count in duplicates)
+            logger.error(
+                f"Duplicate {collection.name}.{field} values prevent its unique index; "
+                f"checking before inserts until they are cleaned up and the app restarts: {listed}"
+            )
+            await collection.create_index(field, **options)
+            return False
+        if e.code not in INDEX_CONFLICT:
+            raise
+    await collection.drop_index(f"{field}_1")
+    return await ensure_unique_index(collection, field, **options)
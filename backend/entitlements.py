@@ -0,0 +1,287 @@
+"""Entitlements: one document per (user, subject) saying until when access runs.
+
+``subscriptions`` stays the history of purchases and grants. Each purchase
+used to become its own access record, so a student who renewed had several
+documents for one subject, and every access check had to sort them.
+Access is now decided by ``entitlements``, unique on
+``(user_email, subject_id)``, and checking it is a single point lookup.
+
+* A purchase or grant extends ``end_date`` from the later of now and the
+  current end, so renewing early never loses days.
+* Each extension is applied once per source (order id or grant batch), kept
+  in ``sources``. The verify call and the Razorpay webhook for the same
+  payment therefore count once between them.
+* Writes are conditional on the ``end_date`` they read (compare-and-set). A
+  concurrent extension makes the write fail with a duplicate key on the
+  unique index; it is then read again and retried, so no extension is lost.
+
+``backfill`` derives entitlements from completed subscriptions. The first run
+scans them all. Later runs only look at subscriptions written since the
+previous run, which picks up what older workers wrote during a rolling
+deploy. ``$max`` / ``$addToSet`` make re-running harmless.
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import ensure_unique_index
+
+logger = logging.getLogger(__name__)
+
+# The entitlement carries the fields of the purchase or grant that last extended it, so access checks
+# answer with the same shape a subscription document had
+SUBSCRIPTION_FIELDS = ('id', 'order_id', 'subject_name', 'price', 'duration_months', 'payment_status')
+ENTITLEMENT_PROJECTION = {'_id': 0, 'sources': 0, 'updated_at': 0}
+MAX_ATTEMPTS = 5
+DUPLICATE_KEY = 11000
+# Re-scan subscriptions written shortly before the last backfill started
+BACKFILL_OVERLAP = timedelta(hours=1)
+
+Pair = Tuple[str, str]  # (user_email, subject_id)
+
+
+def is_active(entitlement: Optional[dict], now: Optional[datetime] = None) -> bool:
+    if not entitlement:
+        return False
+    return datetime.fromisoformat(entitlement['end_date']) > (now or datetime.now(timezone.utc))
+
+
+def extension(current: Optional[dict], user_email: str, subject_id: str, days: int, source: str,
+              now: datetime, fields: dict) -> Tuple[dict, dict, datetime, bool]:
+    """``(filter, update, starts, running)`` pushing ``current``'s end ``days`` further, conditional on its end.
+
+    ``running`` says whether ``current`` was still active, so the new period starts at its end.
+    """
+    running = is_active(current, now)
+    starts = datetime.fromisoformat(current['end_date']) if running else now
+    query = {
+        'user_email': user_email,
+        'subject_id': subject_id,
+        # Compare-and-set; a missing document may only be inserted (the unique index rejects a lost race)
+        'end_date': current['end_date'] if current else {'$exists': False},
+    }
+    update = {
+        '$set': {'end_date': (starts + timedelta(days=days)).isoformat(), 'updated_at': now.isoformat(), **fields},
+        '$addToSet': {'sources': source},
+        '$setOnInsert': {'start_date': now.isoformat(), 'created_at': now.isoformat()},
+    }
+    return query, update, starts, running
+
+
+async def extend(collection, user_email: str, subject_id: str, days: int, source: str,
+                 **fields) -> Tuple[dict, Optional[datetime], bool]:
+    """Extend one entitlement once per ``source``.
+
+    Returns the entitlement, the start of the added period (None when
+    ``source`` had already been applied) and whether the entitlement was
+    still running when it was extended.
+    """
+    key = {'user_email': user_email, 'subject_id': subject_id}
+    for _ in range(MAX_ATTEMPTS):
+        current = await collection.find_one(key, {'_id': 0})
+        if current and source in current.get('sources', []):
+            return current, None, False
+        now = datetime.now(timezone.utc)
+        query, update, starts, running = extension(current, user_email, subject_id, days, source, now, fields)
+        try:
+            await collection.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            continue  # another extension got in first; read it and try again
+        # The write matched what was read, so the new document follows from it
+        entitlement = {**(current or {**key, **update['$setOnInsert']}), **update['$set']}
+        entitlement['sources'] = [*entitlement.get('sources', []), source]
+        return entitlement, starts, running
+    raise RuntimeError(f"Entitlement for {user_email} / {subject_id} kept changing; gave up after {MAX_ATTEMPTS} attempts")
+
+
+async def extend_many(collection, pairs: Iterable[Pair], days: Dict[str, int], source: str,
+                      fields: Dict[str, dict], dry_run: bool = False) -> Dict[Pair, Tuple[bool, str]]:
+    """Extend many entitlements in one bulk write.
+
+    ``days`` and ``fields`` are per subject id. Returns, per pair, whether a
+    running entitlement was extended (rather than a new period started) and
+    the new end date. Pairs that lose a race are retried one by one
+    through ``extend``.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    current = {}
+    if pairs:
+        async for entitlement in collection.find({
+            'user_email': {'$in': list({email for email, _ in pairs})},
+            'subject_id': {'$in': list({subject_id for _, subject_id in pairs})},
+        }, {'_id': 0}):
+            current[(entitlement['user_email'], entitlement['subject_id'])] = entitlement
+
+    now = datetime.now(timezone.utc)
+    operations = []
+    results: Dict[Pair, Tuple[bool, str]] = {}
+    for email, subject_id in pairs:
+        entitlement = current.get((email, subject_id))
+        query, update, _, running = extension(
+            entitlement, email, subject_id, days[subject_id], source, now, fields[subject_id])
+        operations.append(UpdateOne(query, update, upsert=True))
+        results[(email, subject_id)] = (running, update['$set']['end_date'])
+    if not operations or dry_run:
+        return results
+
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY for error in errors):
+            raise
+        for error in errors:
+            email, subject_id = pairs[error['index']]
+            entitlement, _, running = await extend(collection, email, subject_id, days[subject_id], source,
+                                                   **fields[subject_id])
+            results[(email, subject_id)] = (running, entitlement['end_date'])
+    return results
+
+
+async def move_subject(collection, old_id: str, new_id: str):
+    """Follow a subject id rename."""
+    try:
+        await collection.update_many({'subject_id': old_id}, {'$set': {'subject_id': new_id}})
+    except DuplicateKeyError:
+        # Users entitled under both ids keep the new one; the old documents stay behind for review
+        logger.warning(f"Some entitlements for {old_id} already exist under {new_id}; left them in place")
+
+
+async def _upsert(collection, operations: List[UpdateOne]) -> int:
+    """Idempotent upserts; ones that raced another worker's insert are simply run again."""
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY for error in errors):
+            raise
+        await collection.bulk_write([operations[error['index']] for error in errors], ordered=False)
+    return len(operations)
+
+
+async def active_subject_ids(collection, user_email: str) -> List[str]:
+    now = datetime.now(timezone.utc).isoformat()
+    cursor = collection.find({'user_email': user_email, 'end_date': {'$gt': now}}, {'_id': 0, 'subject_id': 1})
+    return [e['subject_id'] async for e in cursor]
+
+
+class ActiveSubjects:
+    """Each user's active subject ids, kept for ``ttl`` seconds (at most ``max_users`` users).
+
+    For hot paths that can live with a slightly old answer, such as the
+    viewer's event beacons. A subject that isn't in the kept set loads it
+    again, so a purchase counts at once; a lapsed one is noticed within
+    ``ttl``. Access checks keep reading ``entitlements`` directly.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_users: int = 10_000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: OrderedDict[str, Tuple[float, FrozenSet[str]]] = OrderedDict()
+
+    async def includes(self, collection, user_email: str, subject_ids: Iterable[str]) -> FrozenSet[str]:
+        """The ``subject_ids`` the user is entitled to."""
+        wanted = set(subject_ids)
+        entry = self._entries.get(user_email)
+        if entry is not None and entry[0] > time.monotonic() and wanted <= entry[1]:
+            self._entries.move_to_end(user_email)
+            return frozenset(wanted)
+        active = frozenset(await active_subject_ids(collection, user_email))
+        self._entries[user_email] = (time.monotonic() + self.ttl, active)
+        self._entries.move_to_end(user_email)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return active & wanted
+
+    def forget(self):
+        """Drop every kept set, e.g. when switching databases."""
+        self._entries.clear()
+
+
+async def dedupe_order_history(db, batch_size: int = 1000) -> int:
+    """Keep the first history document of each order id; returns how many were removed.
+
+    Before history was upserted by order id, the verify call and the webhook
+    each inserted a document for the same payment. Entitlements count each
+    order once (``sources``), so the extra copies carry nothing.
+    """
+    pipeline = [
+        {'$match': {'order_id': {'$exists': True}}},
+        {'$sort': {'created_at': 1, '_id': 1}},
+        {'$group': {'_id': '$order_id', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ]
+    removed = 0
+    extra = []
+    async for group in db.subscriptions.aggregate(pipeline, allowDiskUse=True):
+        extra.extend(group['ids'][1:])
+        if len(extra) >= batch_size:
+            removed += (await db.subscriptions.delete_many({'_id': {'$in': extra}})).deleted_count
+            extra = []
+    if extra:
+        removed += (await db.subscriptions.delete_many({'_id': {'$in': extra}})).deleted_count
+    if removed:
+        logger.info(f"Removed {removed} duplicate purchase history documents")
+    return removed
+
+
+async def ensure_indexes(db):
+    await db.entitlements.create_index([('user_email', 1), ('subject_id', 1)], unique=True)
+    # Purchase history is upserted by order id from both verify and the webhook; grants have none.
+    # Databases written before that hold duplicates, which would block the unique index.
+    if not (await db.subscriptions.index_information()).get('order_id_1', {}).get('unique'):
+        await dedupe_order_history(db)
+    await ensure_unique_index(db.subscriptions, 'order_id', partialFilterExpression={'order_id': {'$exists': True}})
+    # Incremental backfills look for recently written subscriptions
+    await db.subscriptions.create_index('created_at')
+    await db.subscriptions.create_index('updated_at')
+
+
+async def backfill(db, batch_size: int = 1000) -> int:
+    """Derive entitlements from completed subscriptions; returns the number of upserts."""
+    started = datetime.now(timezone.utc)
+    state = await db.migrations.find_one({'_id': 'entitlements'})
+    query: dict = {'payment_status': 'completed'}
+    if state:
+        since = (datetime.fromisoformat(state['last_run']) - BACKFILL_OVERLAP).isoformat()
+        query['$or'] = [{'created_at': {'$gte': since}}, {'updated_at': {'$gte': since}}]
+
+    written = 0
+    batch = []
+    fields = {'_id': 0, 'user_email': 1, 'subject_id': 1, 'start_date': 1, 'end_date': 1,
+              **dict.fromkeys(SUBSCRIPTION_FIELDS, 1)}
+    # Latest-ending last, so its fields are the ones left on the entitlement
+    async for subscription in db.subscriptions.find(query, fields).sort('end_date', 1):
+        source = subscription.get('order_id') or subscription.get('id')
+        update = {
+            '$max': {'end_date': subscription['end_date']},
+            '$setOnInsert': {
+                'start_date': subscription.get('start_date', subscription['end_date']),
+                'created_at': started.isoformat(),
+            },
+        }
+        details = {name: subscription[name] for name in SUBSCRIPTION_FIELDS if name in subscription}
+        if details:
+            update['$set'] = details
+        if source:
+            update['$addToSet'] = {'sources': source}
+        batch.append(UpdateOne(
+            {'user_email': subscription['user_email'], 'subject_id': subscription['subject_id']},
+            update, upsert=True,
+        ))
+        if len(batch) >= batch_size:
+            written += await _upsert(db.entitlements, batch)
+            batch = []
+    if batch:
+        written += await _upsert(db.entitlements, batch)
+
+    await db.migrations.update_one(
+        {'_id': 'entitlements'}, {'$set': {'last_run': started.isoformat()}}, upsert=True)
+    if written:
+        logger.info(f"Backfilled {written} entitlements from subscriptions")
+    return written
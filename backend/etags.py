@@ -0,0 +1,163 @@
+"""Conditional GETs: weak ETags derived from version stamps.
+
+A version stamp is a short random token that is replaced after every write
+to the data it covers:
+
+* collection stamps (``subjects``, ``updates``, ``materials``,
+  ``subscriptions``) live in the ``versions`` collection, one document per
+  name, and are cached per worker for ``ttl`` seconds;
+* per-user subscription stamps live on the user document as
+  ``subscriptions_stamp``, which ``get_current_user`` loads anyway.
+
+An endpoint builds its ETag from the stamps *before* reading any data. If the
+client's ``If-None-Match`` matches, the endpoint answers 304 without loading
+or serializing a single document. Because stamps are read before the data, a
+write that lands in between can only make a response look older than it is.
+The next request then gets a 200, never a stale 304.
+
+Catalog reads may go to any secondary, so the stamp and the data can come
+from different members, and the data's member may be further behind. A fresh
+stamp paired with older data would then be served, and cached, as current.
+``VersionStamps`` therefore remembers the cluster and operation time at which
+each stamp was read. Data guarded by stamps is read in a causally consistent
+session advanced to those times (``reading``). The member serving the data
+then waits until it has applied everything the stamp's member had, including
+the write the stamp was bumped for. When the handle reads from the primary
+there is nothing to wait for, and no session is started.
+
+Stamps are random rather than counters, so a dropped ``versions`` collection
+can't bring back an ETag a client still holds.
+"""
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.read_preferences import Primary
+from starlette.requests import Request
+from starlette.responses import Response
+
+from metrics import REGISTRY
+
+CONDITIONAL_GETS = REGISTRY.counter(
+    'conditional_get_total', 'Conditional GET outcomes by endpoint.', ('endpoint', 'result'))
+
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+
+def new_stamp() -> str:
+    return secrets.token_hex(6)
+
+
+def public_cache_control(edge_max_age: int, stale_while_revalidate: int) -> str:
+    """Browsers revalidate every time (cheap with ETags); the CDN edge may reuse for ``edge_max_age``."""
+    return f"public, max-age=0, s-maxage={edge_max_age}, stale-while-revalidate={stale_while_revalidate}"
+
+
+def make_etag(*parts: str) -> str:
+    return 'W/"' + '-'.join(parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of ``etag`` against an ``If-None-Match`` header value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def validator_headers(etag: str, cache_control: str) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': cache_control}
+
+
+def not_modified(request: Request, endpoint: str, etag: str, cache_control: str) -> Optional[Response]:
+    """A 304 response if the client already holds ``etag``, else None."""
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        CONDITIONAL_GETS.inc(endpoint, 'not_modified')
+        return Response(status_code=304, headers=validator_headers(etag, cache_control))
+    CONDITIONAL_GETS.inc(endpoint, 'full')
+    return None
+
+
+class VersionStamps:
+    def __init__(self, db=None, ttl: float = 30.0):
+        self.db = db
+        self.ttl = ttl
+        self._cached: Dict[str, Tuple[float, str]] = {}
+        # (cluster time, operation time) of the latest read of each stamp; only ever moves forward
+        self._read_at: Dict[str, Tuple[Any, Any]] = {}
+
+    @property
+    def causal(self) -> bool:
+        """Whether reads may go to secondaries, so data reads must wait for the stamps' times."""
+        return self.db.read_preference != Primary()
+
+    async def get(self, name: str) -> str:
+        entry = self._cached.get(name)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        if self.causal:
+            async with await self.db.client.start_session(causal_consistency=True) as session:
+                doc = await self._load(name, session)
+                previous = self._read_at.get(name)
+                # Keep the latest: a member further behind may answer a later read
+                if previous is None or session.operation_time > previous[1]:
+                    self._read_at[name] = (session.cluster_time, session.operation_time)
+        else:
+            doc = await self._load(name, None)
+        self._cached[name] = (time.monotonic() + self.ttl, doc['stamp'])
+        return doc['stamp']
+
+    async def _load(self, name: str, session) -> dict:
+        doc = await self.db.versions.find_one({'_id': name}, session=session)
+        if doc is None:
+            # Created on first use, so every worker agrees on it
+            doc = await self.db.versions.find_one_and_update(
+                {'_id': name},
+                {'$setOnInsert': {'stamp': new_stamp()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+        return doc
+
+    @asynccontextmanager
+    async def reading(self, *names: str):
+        """A session for reading the data guarded by ``names``, at least as new as their stamps (None if not needed)."""
+        if not self.causal:
+            yield None
+            return
+        async with await self.db.client.start_session(causal_consistency=True) as session:
+            for name in names:
+                read_at = self._read_at.get(name)
+                if read_at is not None:
+                    cluster_time, operation_time = read_at
+                    if cluster_time is not None:
+                        session.advance_cluster_time(cluster_time)
+                    if operation_time is not None:
+                        session.advance_operation_time(operation_time)
+            yield session
+
+    async def bump(self, *names: str):
+        """Publish new stamps for ``names``; call after the write has completed."""
+        for name in names:
+            await self.db.versions.update_one({'_id': name}, {'$set': {'stamp': new_stamp()}}, upsert=True)
+            # Re-read rather than cache: a lagging secondary must not pair the new stamp with old data
+            self._cached.pop(name, None)
+
+    def forget(self, *names: str):
+        """Drop cached stamps (all if none given), e.g. after another worker's write."""
+        if not names:
+            self._cached.clear()
+            return
+        for name in names:
+            self._cached.pop(name, None)
@@ -0,0 +1,66 @@
+"""Fast JSON responses for trusted, internally-projected data.
+
+FastAPI validates every return value against ``response_model`` and then runs
+it through ``jsonable_encoder`` and the stdlib ``json`` module. For documents we
+read from Mongo with an explicit projection that already matches the model,
+that work is redundant. ``trusted()`` wraps such data in a response that is
+serialized directly (with ``orjson`` when available), which FastAPI passes
+through untouched. Request bodies are still validated as usual.
+
+Set ``JSON_RESPONSE_CLASS=json`` to fall back to the stdlib encoder.
+"""
+import json
+import os
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class StdlibJSONResponse(JSONResponse):
+    """Compact stdlib JSON, used when orjson is unavailable or disabled."""
+
+    def render(self, content: Any) -> bytes:
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def _select_response_class() -> Type[JSONResponse]:
+    choice = os.environ.get('JSON_RESPONSE_CLASS', 'orjson').lower()
+    if choice == 'orjson' and orjson is not None:
+        return OrjsonResponse
+    return StdlibJSONResponse
+
+
+FastJSONResponse = _select_response_class()
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize with the configured encoder (used for cached bodies)."""
+    return FastJSONResponse(content).body
+
+
+def trusted(content: Any, status_code: int = 200, headers: Dict[str, str] = None) -> JSONResponse:
+    """Return ``content`` without response-model validation.
+
+    Only use this for data we produced ourselves, e.g. Mongo documents read
+    with ``model_projection()`` of the declared response model.
+    """
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def model_projection(model: Type[BaseModel]) -> Dict[str, int]:
+    """Mongo projection selecting exactly the fields of ``model``."""
+    projection = {'_id': 0}
+    for name in model.model_fields:
+        projection[name] = 1
+    return projection
@@ -0,0 +1,103 @@
+"""Cross-worker cache invalidation over MongoDB change streams.
+
+Every worker keeps its own in-process caches. When an admin edits a subject
+in one worker, the others must drop their copies too. ``InvalidationBus``
+watches the database for changes to the subscribed collections and calls
+the registered callbacks in *every* worker, including the one that made the
+write (a second invalidation there is harmless).
+
+Change streams need a replica set or sharded cluster. On a standalone server
+the bus logs a warning and stops; caches then rely on their TTL.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_EVENTS = REGISTRY.counter(
+    'cache_invalidation_events_total', 'Change-stream events received by the invalidation bus.', ('collection',))
+
+# Server error codes meaning "change streams are not available here"
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40324, 136)
+# ChangeStreamFatalError / ChangeStreamHistoryLost: the resume token is useless
+RESUME_TOKEN_LOST = (280, 286)
+
+
+class InvalidationBus:
+    def __init__(self, max_backoff: float = 30.0):
+        self.max_backoff = max_backoff
+        self._callbacks: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self.running = False
+
+    def subscribe(self, collection: str, callback: Callable[[dict], None]):
+        """Call ``callback(change_event)`` whenever ``collection`` changes."""
+        self._callbacks[collection].append(callback)
+
+    def start(self, db):
+        if self._task is None and self._callbacks:
+            self._task = asyncio.create_task(self._run(db), name='invalidation-bus')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.running = False
+
+    def dispatch(self, change: dict):
+        collection = change.get('ns', {}).get('coll')
+        INVALIDATION_EVENTS.inc(collection or '')
+        for callback in self._callbacks.get(collection, ()):
+            try:
+                callback(change)
+            except Exception as e:
+                logger.error(f"Invalidation callback for {collection} failed: {str(e)}")
+
+    def invalidate_all(self):
+        for collection in list(self._callbacks):
+            self.dispatch({'ns': {'coll': collection}, 'operationType': 'invalidate'})
+
+    async def _run(self, db):
+        pipeline = [
+            {'$match': {'ns.coll': {'$in': sorted(self._callbacks)}}},
+            {'$project': {'ns': 1, 'operationType': 1, 'documentKey': 1}},
+        ]
+        backoff = 1.0
+        while True:
+            try:
+                async with db.watch(pipeline, resume_after=self._resume_token) as stream:
+                    self.running = True
+                    backoff = 1.0
+                    logger.info(f"Invalidation bus watching {sorted(self._callbacks)}")
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self.dispatch(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams unavailable (not a replica set); caches fall back to their TTL")
+                    self.running = False
+                    return
+                if e.code in RESUME_TOKEN_LOST:
+                    self._resume_token = None
+                logger.error(f"Invalidation bus error: {str(e)}")
+            except PyMongoError as e:
+                logger.error(f"Invalidation bus error: {str(e)}")
+            self.running = False
+            # Without a resume token missed events can't be replayed, so drop everything
+            if self._resume_token is None:
+                self.invalidate_all()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,195 @@
+"""Write-behind counters of material views and viewing sessions.
+
+The material viewer reports two kinds of events:
+
+* ``view`` — a student opened a note or video;
+* ``session`` — the student closed it again, with the seconds it was open.
+
+A database write per event would double the load on our hottest path.
+Instead each worker adds events to in-memory counters keyed by
+(material, UTC day). Every ``interval`` seconds it flushes them as one
+unordered ``bulk_write`` of ``$inc`` upserts into ``material_views_daily``.
+Workers never overwrite each other's counts, because ``$inc`` is additive.
+
+Each flush first looks up the pending materials in one ``$in`` query and
+drops counters whose material doesn't exist or is filed under another
+subject, so made-up ids never reach the collection.
+
+At most ``max_keys`` (material, day) counters are held between flushes.
+Events for new keys beyond that are dropped and counted. A failed flush
+merges its counts back, so they go out with the next one.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MATERIAL_VIEW_EVENTS = REGISTRY.counter(
+    'material_view_events_total', 'Material viewer events by kind and outcome.', ('kind', 'result'))
+
+EVENT_KINDS = ('view', 'session')
+COUNTERS = ('views', 'sessions', 'seconds')
+# A tab left open overnight shouldn't count as hours of study
+MAX_SESSION_SECONDS = 4 * 3600
+
+Key = Tuple[str, str, str]  # (material_id, day, subject_id)
+
+
+class MaterialViewCounter:
+    def __init__(self, collection=None, materials=None, interval: float = 30.0, max_keys: int = 50_000):
+        self.collection = collection
+        # The catalog's materials, to validate pending keys against (None: every key is kept)
+        self.materials = materials
+        self.interval = interval
+        self.max_keys = max_keys
+        self.pending: Dict[Key, Dict[str, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, material_id: str, subject_id: str, kind: str, seconds: float = 0.0) -> bool:
+        """Count one event in memory; False if it was dropped."""
+        key = (material_id, datetime.now(timezone.utc).date().isoformat(), subject_id)
+        counts = self.pending.get(key)
+        if counts is None:
+            if len(self.pending) >= self.max_keys:
+                MATERIAL_VIEW_EVENTS.inc(kind, 'dropped')
+                return False
+            counts = self.pending[key] = dict.fromkeys(COUNTERS, 0)
+        if kind == 'view':
+            counts['views'] += 1
+        else:
+            counts['sessions'] += 1
+            counts['seconds'] += min(max(seconds, 0.0), MAX_SESSION_SECONDS)
+        MATERIAL_VIEW_EVENTS.inc(kind, 'counted')
+        return True
+
+    def reject(self, kind: str):
+        """Count an event for a subject the caller isn't entitled to; it is not recorded."""
+        MATERIAL_VIEW_EVENTS.inc(kind, 'rejected')
+
+    async def flush(self) -> int:
+        """Write the pending counters; returns the number of (material, day) upserts."""
+        if not self.pending or self.collection is None:
+            return 0
+        pending, self.pending = self.pending, {}
+        try:
+            pending = await self._known(pending)
+        except asyncio.CancelledError:
+            self._merge(pending)
+            raise
+        except Exception as e:
+            logger.error(f"Material view flush failed: {str(e)}")
+            self._merge(pending)
+            return 0
+        if not pending:
+            return 0
+        operations = [
+            UpdateOne(
+                {'material_id': material_id, 'day': day},
+                {
+                    '$inc': {name: value for name, value in counts.items() if value},
+                    '$setOnInsert': {'subject_id': subject_id},
+                },
+                upsert=True,
+            )
+            for (material_id, day, subject_id), counts in pending.items()
+        ]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except asyncio.CancelledError:
+            self._merge(pending)
+            raise
+        except Exception as e:
+            logger.error(f"Material view flush failed: {str(e)}")
+            self._merge(pending)
+            return 0
+        return len(operations)
+
+    async def _known(self, pending: Dict[Key, Dict[str, float]]) -> Dict[Key, Dict[str, float]]:
+        """The counters whose material exists under their subject; the others are counted as rejected."""
+        if self.materials is None:
+            return pending
+        subjects = {}
+        async for material in self.materials.find(
+            {'id': {'$in': list({material_id for material_id, _, _ in pending})}}, {'_id': 0, 'id': 1, 'subject_id': 1}
+        ):
+            subjects[material['id']] = material['subject_id']
+        known = {}
+        for key, counts in pending.items():
+            material_id, _, subject_id = key
+            if subjects.get(material_id) == subject_id:
+                known[key] = counts
+                continue
+            if counts['views']:
+                MATERIAL_VIEW_EVENTS.inc('view', 'rejected', amount=counts['views'])
+            if counts['sessions']:
+                MATERIAL_VIEW_EVENTS.inc('session', 'rejected', amount=counts['sessions'])
+        return known
+
+    def _merge(self, pending: Dict[Key, Dict[str, float]]):
+        for key, counts in pending.items():
+            current = self.pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for name, value in counts.items():
+                current[name] += value
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='material-views')
+
+    async def stop(self):
+        """Stop the flusher and write what is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([('material_id', 1), ('day', 1)], unique=True)
+        await self.collection.create_index([('day', 1), ('subject_id', 1)])
+
+
+async def view_report(db, start: date, end: date, subject_id: Optional[str] = None, limit: int = 50) -> dict:
+    """Materials ranked by views between ``start`` and ``end`` (inclusive)."""
+    match: Dict[str, object] = {'day': {'$gte': start.isoformat(), '$lte': end.isoformat()}}
+    if subject_id:
+        match['subject_id'] = subject_id
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': '$material_id',
+            'subject_id': {'$first': '$subject_id'},
+            **{name: {'$sum': f"${name}"} for name in COUNTERS},
+        }},
+        {'$sort': {'views': -1, '_id': 1}},
+        {'$limit': limit},
+    ]
+    rows = []
+    async for row in db.material_views_daily.aggregate(pipeline):
+        rows.append({'material_id': row.pop('_id'), **row})
+
+    titles: Dict[str, dict] = {}
+    if rows:
+        async for material in db.materials.find(
+            {'id': {'$in': [r['material_id'] for r in rows]}}, {'_id': 0, 'id': 1, 'title': 1, 'type': 1}
+        ):
+            titles[material['id']] = material
+    for row in rows:
+        material = titles.get(row['material_id'], {})
+        row['title'] = material.get('title')
+        row['type'] = material.get('type')
+        row['average_session_seconds'] = round(row['seconds'] / row['sessions'], 1) if row['sessions'] else 0
+    return {'from': start.isoformat(), 'to': end.isoformat(), 'materials': rows}
@@ -0,0 +1,296 @@
+"""Process-local metrics in Prometheus text format.
+
+A deliberately small registry (counters, gauges, histograms with labels) so
+we don't need an extra dependency. Updates are a dict lookup plus a few
+additions under a lock; pymongo event listeners call in from driver threads,
+so every metric is thread safe.
+
+Collected here:
+
+* per-route request count and latency (``MetricsMiddleware``)
+* Mongo command durations by collection / command (``MongoCommandMetrics``)
+* connection pool checkout waits (``MongoPoolMetrics``)
+* bcrypt and Razorpay call durations (``timed()`` around the calls)
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, *labels: str, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._values[labels] = series
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._values.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._values.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """Register a callback yielding ready-made exposition lines at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by route and status.', ('method', 'route', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route'))
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command durations.', ('collection', 'command'))
+MONGO_COMMAND_FAILURES = REGISTRY.counter(
+    'mongodb_command_failures_total', 'Failed MongoDB commands.', ('collection', 'command'))
+MONGO_POOL_WAIT = REGISTRY.histogram(
+    'mongodb_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.')
+MONGO_POOL_CHECKOUT_FAILURES = REGISTRY.counter(
+    'mongodb_pool_checkout_failures_total', 'Failed connection checkouts.', ('reason',))
+BCRYPT_DURATION = REGISTRY.histogram(
+    'bcrypt_duration_seconds', 'bcrypt hash / verify durations.', ('operation',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0))
+RAZORPAY_DURATION = REGISTRY.histogram(
+    'razorpay_call_duration_seconds', 'Razorpay SDK call durations.', ('operation', 'outcome'))
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str):
+    """Time a block, adding an ``ok`` / ``error`` outcome as the last label."""
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        histogram.observe(*labels, outcome, value=time.perf_counter() - start)
+
+
+# ============= HTTP =============
+
+class MetricsMiddleware:
+    """Per-route request counts and latency, labelled by the route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            method = scope['method']
+            HTTP_REQUESTS.inc(method, path, str(status))
+            HTTP_LATENCY.observe(method, path, value=time.perf_counter() - start)
+
+
+# ============= MongoDB =============
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Command durations by collection and command name."""
+
+    def __init__(self):
+        self._collections: Dict[Tuple[int, int], str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        self._collections[(event.request_id, event.operation_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.request_id, event.operation_id), '')
+        MONGO_COMMAND_DURATION.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.request_id, event.operation_id), '')
+        MONGO_COMMAND_DURATION.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.inc(collection, event.command_name)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Time between checkout start and a connection being handed out.
+
+    The driver runs a checkout on a single thread, so a thread-local start
+    time is enough to pair the two events.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        start = getattr(self._local, 'start', None)
+        if start is not None:
+            MONGO_POOL_WAIT.observe(value=time.perf_counter() - start)
+            self._local.start = None
+
+    def connection_check_out_failed(self, event):
+        self._local.start = None
+        MONGO_POOL_CHECKOUT_FAILURES.inc(str(event.reason))
+
+    # Remaining pool events are not interesting here
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
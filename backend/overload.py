@@ -0,0 +1,152 @@
+"""Event-loop lag sampling and load shedding.
+
+A saturated worker (bcrypt rounds, the synchronous Razorpay SDK, a large
+admin list being serialized) doesn't fail; every request just queues on the
+loop until clients time out. ``LoopLagMonitor`` measures that directly: it
+sleeps for ``interval`` and records how late it woke up. While a sample is
+over ``threshold`` (and for ``hold`` seconds after the last one) the worker
+counts as overloaded.
+
+``OverloadMiddleware`` then answers low-priority requests (admin lists and
+reports, bulk admin jobs, updates polling, viewer beacons) with ``503`` and
+``Retry-After`` before any work is done, so the loop's time goes to everything
+else. Payment verification, the Razorpay webhook and the admin diagnostics
+endpoint are never shed, whatever the configured routes.
+"""
+import asyncio
+import logging
+import time
+from typing import Iterable, Mapping, Optional, Sequence, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = REGISTRY.gauge('event_loop_lag_seconds', 'Most recent event-loop lag sample.')
+LOOP_LAG_SAMPLES = REGISTRY.histogram(
+    'event_loop_lag_sample_seconds', 'Event-loop lag samples.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+OVERLOAD_SHED = REGISTRY.counter(
+    'overload_shed_requests_total', 'Requests shed with 503 while the event loop was lagging.', ('route',))
+
+# (method, path prefix) of requests that may be shed
+LOW_PRIORITY: Tuple[Tuple[str, str], ...] = (
+    ('GET', '/api/admin/'),
+    ('POST', '/api/admin/cleanup-subjects'),
+    ('POST', '/api/admin/import'),
+    ('POST', '/api/admin/analytics/refresh'),
+    ('GET', '/api/updates'),
+    ('POST', '/api/materials/events'),
+)
+# Money moving, and the diagnostics needed to see why the worker is busy: never shed
+NEVER_SHED = ('/api/payments/verify', '/api/payments/webhook', '/api/admin/diagnostics')
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.2, hold: float = 2.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.hold = hold
+        self.lag = 0.0
+        self.overloaded_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def overloaded(self) -> bool:
+        return time.monotonic() < self.overloaded_until
+
+    def observe(self, lag: float):
+        self.lag = lag
+        LOOP_LAG.set(value=lag)
+        LOOP_LAG_SAMPLES.observe(value=lag)
+        if self.threshold > 0 and lag >= self.threshold:
+            if not self.overloaded:
+                logger.warning(f"Event loop lag {lag * 1000:.0f} ms; shedding low-priority requests")
+            self.overloaded_until = time.monotonic() + self.hold
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='loop-lag-monitor')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, loop.time() - start - self.interval))
+
+    def snapshot(self) -> dict:
+        return {
+            'lag_ms': round(self.lag * 1000, 1),
+            'threshold_ms': round(self.threshold * 1000, 1),
+            'overloaded': self.overloaded,
+        }
+
+
+def parse_routes(value: str) -> Tuple[Tuple[str, str], ...]:
+    """``"GET /api/admin/,POST /api/admin/import"`` into (method, prefix) pairs."""
+    routes = []
+    for item in value.split(','):
+        method, _, prefix = item.strip().partition(' ')
+        if prefix:
+            routes.append((method.upper(), prefix.strip()))
+    return tuple(routes)
+
+
+class OverloadMiddleware:
+    """Shed low-priority requests with 503 while ``monitor`` reports overload."""
+
+    def __init__(self, app: ASGIApp, monitor: LoopLagMonitor,
+                 low_priority: Sequence[Tuple[str, str]] = LOW_PRIORITY, retry_after: int = 5):
+        self.app = app
+        self.monitor = monitor
+        self.low_priority = tuple(low_priority)
+        self.retry_after = retry_after
+
+    def sheddable(self, method: str, path: str) -> Optional[str]:
+        """The matching low-priority prefix, or None."""
+        if path in NEVER_SHED:
+            return None
+        for shed_method, prefix in self.low_priority:
+            if method == shed_method and path.startswith(prefix):
+                return prefix
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'http' and self.monitor.overloaded:
+            prefix = self.sheddable(scope['method'], scope['path'])
+            if prefix is not None:
+                OVERLOAD_SHED.inc(f"{scope['method']} {prefix}")
+                response = JSONResponse(
+                    {'detail': 'Server is busy, retry shortly'},
+                    status_code=503,
+                    headers={'Retry-After': str(self.retry_after)},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def monitor_from_env(environ: Mapping[str, str]) -> LoopLagMonitor:
+    return LoopLagMonitor(
+        interval=float(environ.get('LOOP_LAG_INTERVAL_MS', '100')) / 1000,
+        threshold=float(environ.get('OVERLOAD_LAG_MS', '200')) / 1000,
+        hold=float(environ.get('OVERLOAD_HOLD_SECONDS', '2')),
+    )
+
+
+def low_priority_from_env(environ: Mapping[str, str]) -> Iterable[Tuple[str, str]]:
+    value = environ.get('OVERLOAD_SHED_ROUTES', '')
+    return parse_routes(value) if value else LOW_PRIORITY
@@ -0,0 +1,70 @@
+"""Keyset pagination and streamed JSON arrays for list endpoints.
+
+Student list endpoints return their whole result by default. Two variants
+keep large lists cheap:
+
+* pages: ``?limit=N`` returns ``{"items": [...], "next_cursor": ...}`` ordered
+  by ``id``. The next page is ``?limit=N&cursor=<next_cursor>``. The cursor
+  is the last ``id`` seen (opaque, base64url), so each page is an index
+  range scan from there. Skipped rows never have to be counted.
+* streaming: ``?stream=true`` sends a plain JSON array. Documents are
+  serialized batch by batch as the Mongo cursor yields them, so at most one
+  batch is held in memory at a time.
+"""
+import base64
+import binascii
+from typing import AsyncIterator, Optional
+
+from fast_json import dumps
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: str) -> str:
+    return base64.urlsafe_b64encode(last_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return base64.b64decode(padded, altchars=b'-_', validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+
+async def fetch_page(collection, query: dict, projection: dict, limit: int,
+                     cursor: Optional[str] = None, session=None) -> dict:
+    """One page of ``collection`` ordered by ``id``, starting after ``cursor``."""
+    if cursor:
+        query = {**query, 'id': {'$gt': decode_cursor(cursor)}}
+    # One extra document tells whether another page follows
+    docs = await collection.find(query, projection, session=session).sort('id', 1).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return {
+        'items': docs,
+        'next_cursor': encode_cursor(docs[-1]['id']) if has_more else None,
+    }
+
+
+async def stream_json_array(cursor, batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Serialize an async Mongo cursor as one JSON array, a batch at a time."""
+    yield b'['
+    batch = []
+    first = True
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            # dumps() of a list is "[a,b]"; strip the brackets and join the batches with commas
+            yield (b'' if first else b',') + dumps(batch)[1:-1]
+            first = False
+            batch = []
+    if batch:
+        yield (b'' if first else b',') + dumps(batch)[1:-1]
+    yield b']'
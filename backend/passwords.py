@@ -0,0 +1,117 @@
+"""bcrypt hashing at a configurable, calibrated cost.
+
+Every bcrypt hash records its own cost (``$2b$12$...``), so the target cost
+can change without invalidating stored hashes. After a successful login,
+``needs_rehash()`` reports hashes stored at a different cost, and the caller
+re-hashes the password it has just verified.
+
+The target comes from ``BCRYPT_ROUNDS``. Either give a number, or give
+``auto`` to benchmark this CPU at startup and pick the highest cost whose
+hash fits ``BCRYPT_TARGET_MS``. The result is clamped to
+``BCRYPT_MIN_ROUNDS``..``BCRYPT_MAX_ROUNDS``.
+"""
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, Mapping, Optional, Set
+
+import bcrypt
+
+from metrics import BCRYPT_DURATION, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_REHASHES = REGISTRY.counter(
+    'password_rehashes_total', 'Stored password hashes upgraded to the target bcrypt cost.', ('role',))
+PASSWORD_COSTS = REGISTRY.gauge(
+    'password_hash_cost_accounts', 'Stored password hashes by bcrypt cost.', ('role', 'cost'))
+
+DEFAULT_ROUNDS = 12
+# Below 10 a hash is too cheap to brute-force-protect a leaked database
+ABSOLUTE_MIN_ROUNDS = 10
+COST_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+_reported_costs: Dict[str, Set[int]] = {'user': set(), 'admin': set()}
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    match = COST_PATTERN.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+def calibrate(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """Highest cost in ``[min_rounds, max_rounds]`` whose hash takes at most ``target_ms``."""
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration-password', bcrypt.gensalt(rounds=rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > target_ms and rounds > min_rounds:
+            break
+        chosen = rounds
+        # Each extra round doubles the time; stop before a step that would blow the budget
+        if elapsed_ms * 2 > target_ms:
+            break
+    return chosen
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = DEFAULT_ROUNDS):
+        self.rounds = rounds
+
+    def hash(self, password: str) -> str:
+        with BCRYPT_DURATION.time('hash'):
+            return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        with BCRYPT_DURATION.time('verify'):
+            return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_cost(hashed) != self.rounds
+
+
+def hasher_from_env(environ: Mapping[str, str]) -> PasswordHasher:
+    setting = environ.get('BCRYPT_ROUNDS', str(DEFAULT_ROUNDS)).strip().lower()
+    min_rounds = max(int(environ.get('BCRYPT_MIN_ROUNDS', str(ABSOLUTE_MIN_ROUNDS))), ABSOLUTE_MIN_ROUNDS)
+    max_rounds = max(int(environ.get('BCRYPT_MAX_ROUNDS', '14')), min_rounds)
+    if setting == 'auto':
+        target_ms = float(environ.get('BCRYPT_TARGET_MS', '250'))
+        rounds = calibrate(target_ms, min_rounds, max_rounds)
+        logger.info(f"bcrypt cost calibrated to {rounds} for a {target_ms:.0f}ms budget")
+    else:
+        rounds = min(max(int(setting), min_rounds), max_rounds)
+    return PasswordHasher(rounds)
+
+
+async def cost_distribution(collection) -> Dict[int, int]:
+    """Number of stored hashes per bcrypt cost in ``collection``."""
+    pipeline = [
+        {'$match': {'password': {'$type': 'string'}}},
+        {'$group': {'_id': {'$substr': ['$password', 4, 2]}, 'count': {'$sum': 1}}},
+    ]
+    distribution: Dict[int, int] = {}
+    async for row in collection.aggregate(pipeline):
+        if str(row['_id']).isdigit():
+            distribution[int(row['_id'])] = row['count']
+    return distribution
+
+
+async def record_cost_distribution(db):
+    for role, collection in (('user', db.users), ('admin', db.admins)):
+        distribution = await cost_distribution(collection)
+        # Costs that no longer occur drop to zero instead of keeping their last value
+        for cost in _reported_costs[role] | set(distribution):
+            PASSWORD_COSTS.set(role, str(cost), value=distribution.get(cost, 0))
+        _reported_costs[role] |= set(distribution)
+
+
+async def report_cost_distribution(db, interval: float):
+    """Refresh ``password_hash_cost_accounts`` every ``interval`` seconds."""
+    while True:
+        try:
+            await record_cost_distribution(db)
+        except Exception as e:
+            logger.error(f"Password cost distribution failed: {str(e)}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,368 @@
+"""Rate limiting for credential endpoints.
+
+Login, registration and admin login each pay for a full bcrypt round, so a
+burst of credential-stuffing traffic can pin the CPU. The limiter here runs
+before any bcrypt work:
+
+* a token bucket per client IP, charged on every attempt;
+* a token bucket per account, charged only when a login fails, which caps
+  how fast any one account can be guessed at from everywhere;
+* a sliding-window lockout per (client IP, account) after repeated failures.
+
+None of these may let a stranger lock the owner out. Only failed logins
+drain the account bucket, lockouts are per client, and a client that logged
+in to an account successfully is trusted for it (``trust_duration``), so the
+account bucket never applies to it. Registration has no failures to count;
+its per-email bucket is charged on every attempt instead.
+
+State lives in process memory by default. For multi-worker deployments a
+shared backend can be plugged in (see ``MongoRateLimitBackend``).
+"""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rate(value: str) -> Tuple[int, float]:
+    """Parse ``"<requests>/<seconds>"`` into ``(capacity, refill_per_second)``."""
+    count, _, seconds = value.partition('/')
+    capacity = int(count)
+    period = float(seconds or 60)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"Invalid rate: {value!r}")
+    return capacity, capacity / period
+
+
+def client_ip(request: Request) -> str:
+    """Best-effort client IP.
+
+    ``X-Forwarded-For`` is only honoured when ``RATE_LIMIT_TRUST_FORWARDED`` is
+    enabled, otherwise any client could pick its own bucket.
+    """
+    if os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true':
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else 'unknown'
+
+
+# ============= Backends =============
+
+class MemoryRateLimitBackend:
+    """Per-process state, bounded to ``max_keys`` entries (LRU eviction)."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._failures: "OrderedDict[str, deque]" = OrderedDict()
+        self._locks: "OrderedDict[str, float]" = OrderedDict()
+
+    def _touch(self, store: OrderedDict, key: str):
+        store.move_to_end(key)
+        while len(store) > self.max_keys:
+            store.popitem(last=False)
+
+    async def take(self, key: str, capacity: int, refill: float, now: float) -> float:
+        """Take one token; return 0 when allowed, else seconds until a token is free."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(capacity), now]
+            self._buckets[key] = bucket
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+        bucket[1] = now
+        self._touch(self._buckets, key)
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / refill
+
+    async def peek(self, key: str, capacity: int, refill: float, now: float) -> float:
+        """Like ``take`` without taking: 0 when a token is free, else seconds until one is."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+        return 0.0 if tokens >= 1 else (1 - tokens) / refill
+
+    async def add_failure(self, key: str, window: float, now: float) -> int:
+        failures = self._failures.get(key)
+        if failures is None:
+            failures = deque()
+            self._failures[key] = failures
+        failures.append(now)
+        while failures and failures[0] <= now - window:
+            failures.popleft()
+        self._touch(self._failures, key)
+        return len(failures)
+
+    async def clear_failures(self, key: str):
+        self._failures.pop(key, None)
+
+    async def lock(self, key: str, until: float):
+        self._locks[key] = until
+        self._touch(self._locks, key)
+
+    async def locked_until(self, key: str, now: float) -> float:
+        until = self._locks.get(key, 0.0)
+        if until and until <= now:
+            del self._locks[key]
+            return 0.0
+        return until
+
+    def size(self) -> int:
+        return len(self._buckets) + len(self._failures) + len(self._locks)
+
+
+class MongoRateLimitBackend:
+    """Shared state in a Mongo collection, for deployments with several workers.
+
+    Every operation is a single atomic ``find_one_and_update`` so workers never
+    race each other. Documents expire through a TTL index on ``expires_at``.
+    """
+
+    def __init__(self, collection, ttl_seconds: int = 3600):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    async def ensure_indexes(self):
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def _expires(self, now: float):
+        return datetime.fromtimestamp(now + self.ttl_seconds, tz=timezone.utc)
+
+    async def take(self, key: str, capacity: int, refill: float, now: float) -> float:
+        refilled = {'$min': [capacity, {'$add': [
+            {'$ifNull': ['$tokens', capacity]},
+            {'$multiply': [{'$subtract': [now, {'$ifNull': ['$updated', now]}]}, refill]},
+        ]}]}
+        doc = await self.collection.find_one_and_update(
+            {'_id': f"bucket:{key}"},
+            [
+                {'$set': {'tokens': refilled, 'updated': now, 'expires_at': self._expires(now)}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc['allowed']:
+            return 0.0
+        return (1 - doc['tokens']) / refill
+
+    async def peek(self, key: str, capacity: int, refill: float, now: float) -> float:
+        doc = await self.collection.find_one({'_id': f"bucket:{key}"})
+        if doc is None:
+            return 0.0
+        tokens = min(capacity, doc['tokens'] + (now - doc['updated']) * refill)
+        return 0.0 if tokens >= 1 else (1 - tokens) / refill
+
+    async def add_failure(self, key: str, window: float, now: float) -> int:
+        doc = await self.collection.find_one_and_update(
+            {'_id': f"failures:{key}"},
+            [{'$set': {
+                'times': {'$concatArrays': [
+                    {'$filter': {
+                        'input': {'$ifNull': ['$times', []]},
+                        'cond': {'$gt': ['$$this', now - window]},
+                    }},
+                    [now],
+                ]},
+                'expires_at': self._expires(now),
+            }}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return len(doc['times'])
+
+    async def clear_failures(self, key: str):
+        await self.collection.delete_one({'_id': f"failures:{key}"})
+
+    async def lock(self, key: str, until: float):
+        await self.collection.update_one(
+            {'_id': f"lock:{key}"},
+            {'$set': {'until': until, 'expires_at': self._expires(until)}},
+            upsert=True,
+        )
+
+    async def locked_until(self, key: str, now: float) -> float:
+        doc = await self.collection.find_one({'_id': f"lock:{key}", 'until': {'$gt': now}})
+        return doc['until'] if doc else 0.0
+
+    def size(self) -> int:
+        return 0
+
+
+# ============= Limiter =============
+
+class RateLimiter:
+    """Token buckets per IP and account plus a failure lockout per (IP, account).
+
+    Typical use inside a login handler::
+
+        await limiter.check(ip)                         # raises 429 when the IP is limited
+        account = ...                                   # the account the identifier resolves to
+        await limiter.check_account(ip, account)        # raises 429 while limited for this account
+        ...
+        await limiter.record_failure(ip, account)       # on bad credentials
+        await limiter.record_success(ip, account)       # on success
+
+    Registration calls ``check(ip, email)``, which charges the email's bucket
+    on every attempt.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ip_rate: str = '30/60',
+        identifier_rate: str = '10/60',
+        lockout_threshold: int = 10,
+        lockout_window: float = 900,
+        lockout_duration: float = 900,
+        trust_duration: float = 30 * 86400,
+        backend=None,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.ip_capacity, self.ip_refill = parse_rate(ip_rate)
+        self.identifier_capacity, self.identifier_refill = parse_rate(identifier_rate)
+        self.lockout_threshold = lockout_threshold
+        self.lockout_window = lockout_window
+        self.lockout_duration = lockout_duration
+        self.trust_duration = trust_duration
+        self.backend = backend or MemoryRateLimitBackend()
+        self.enabled = enabled
+        self.counters = {
+            'allowed': 0,
+            'limited_ip': 0,
+            'limited_identifier': 0,
+            'locked_out': 0,
+            'lockouts': 0,
+            'failures': 0,
+        }
+
+    @staticmethod
+    def _normalize(identifier: Optional[str]) -> str:
+        return (identifier or '').strip().lower()
+
+    def _identifier_key(self, identifier: str) -> str:
+        return f"{self.name}:id:{identifier}"
+
+    def _account_key(self, ip: str, account: Optional[str]) -> str:
+        account = self._normalize(account)
+        return f"{self.name}:account:{ip}:{account}" if account else ''
+
+    def _trust_key(self, ip: str, account: str) -> str:
+        # A trust mark is stored like a lock: a key with an expiry
+        return f"{self.name}:trusted:{ip}:{account}"
+
+    def _reject(self, reason: str, retry_after: float):
+        self.counters[reason] += 1
+        retry_after = max(1, math.ceil(retry_after))
+        logger.warning(f"Rate limit ({self.name}): {reason}, retry after {retry_after}s")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts. Please try again later.",
+            headers={'Retry-After': str(retry_after)},
+        )
+
+    async def check(self, ip: str, identifier: Optional[str] = None):
+        """Raise ``HTTPException(429)`` if this IP, or ``identifier`` when given, is over its rate."""
+        if not self.enabled:
+            return
+        now = time.time()
+        identifier = self._normalize(identifier)
+
+        wait = await self.backend.take(f"{self.name}:ip:{ip}", self.ip_capacity, self.ip_refill, now)
+        if wait:
+            self._reject('limited_ip', wait)
+
+        if identifier:
+            wait = await self.backend.take(
+                self._identifier_key(identifier), self.identifier_capacity, self.identifier_refill, now
+            )
+            if wait:
+                self._reject('limited_identifier', wait)
+
+        self.counters['allowed'] += 1
+
+    async def check_account(self, ip: str, account: Optional[str]):
+        """Raise ``HTTPException(429)`` while this client may not try to sign in to ``account``.
+
+        ``account`` should be the canonical account (e.g. the user's email even when
+        they signed in with a phone number), so switching identifiers does not reset it.
+        A client is limited while it is locked out of the account, or while recent
+        failures (from anyone) emptied the account's bucket and it isn't trusted.
+        """
+        account = self._normalize(account)
+        if not self.enabled or not account:
+            return
+        now = time.time()
+        until = await self.backend.locked_until(self._account_key(ip, account), now)
+        if until:
+            self._reject('locked_out', until - now)
+        wait = await self.backend.peek(
+            self._identifier_key(account), self.identifier_capacity, self.identifier_refill, now
+        )
+        if wait and not await self.backend.locked_until(self._trust_key(ip, account), now):
+            self._reject('limited_identifier', wait)
+
+    async def record_failure(self, ip: str, account: Optional[str] = None):
+        if not self.enabled:
+            return
+        self.counters['failures'] += 1
+        account = self._normalize(account)
+        if not account:
+            return
+        now = time.time()
+        await self.backend.take(
+            self._identifier_key(account), self.identifier_capacity, self.identifier_refill, now
+        )
+        key = self._account_key(ip, account)
+        count = await self.backend.add_failure(key, self.lockout_window, now)
+        if count >= self.lockout_threshold:
+            await self.backend.lock(key, now + self.lockout_duration)
+            await self.backend.clear_failures(key)
+            self.counters['lockouts'] += 1
+            logger.warning(f"Rate limit ({self.name}): locked out {ip} from an account after {count} failures")
+
+    async def record_success(self, ip: str, account: Optional[str] = None):
+        if not self.enabled:
+            return
+        account = self._normalize(account)
+        if account:
+            await self.backend.clear_failures(self._account_key(ip, account))
+            await self.backend.lock(self._trust_key(ip, account), time.time() + self.trust_duration)
+
+    def metrics(self) -> dict:
+        return {
+            'name': self.name,
+            'enabled': self.enabled,
+            'tracked_keys': self.backend.size(),
+            **self.counters,
+        }
+
+
+def limiter_from_env(name: str, backend=None, **defaults) -> RateLimiter:
+    """Build a limiter whose settings can be overridden with ``<NAME>_RATE_LIMIT_*`` env vars."""
+    prefix = f"{name.upper()}_RATE_LIMIT"
+    return RateLimiter(
+        name,
+        ip_rate=os.environ.get(f"{prefix}_IP", defaults.get('ip_rate', '30/60')),
+        identifier_rate=os.environ.get(f"{prefix}_IDENTIFIER", defaults.get('identifier_rate', '10/60')),
+        lockout_threshold=int(os.environ.get(f"{prefix}_LOCKOUT_THRESHOLD", defaults.get('lockout_threshold', 10))),
+        lockout_window=float(os.environ.get(f"{prefix}_LOCKOUT_WINDOW", defaults.get('lockout_window', 900))),
+        lockout_duration=float(os.environ.get(f"{prefix}_LOCKOUT_DURATION", defaults.get('lockout_duration', 900))),
+        trust_duration=float(os.environ.get(f"{prefix}_TRUST_DURATION", defaults.get('trust_duration', 30 * 86400))),
+        backend=backend,
+        enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    )
@@ -0,0 +1,300 @@
+"""Daily analytics rollups.
+
+``payments``, ``subscriptions`` and ``users`` are folded into one document
+per (UTC day, subject, board, city) in ``analytics_daily``. Charts then read
+a few hundred small buckets instead of scanning the full history.
+
+Bucket fields:
+
+* ``revenue`` / ``payments`` — verified or captured payments;
+* ``subscriptions`` — completed subscriptions, with ``grants`` counting the
+  admin-granted ones among them;
+* ``new_users`` — registrations (these buckets have empty subject and board).
+
+A day is always recomputed as a whole from its source documents, found by
+``created_at``. The result replaces the day's buckets in one ordered bulk
+write. Refreshing a day twice is therefore harmless, and late status changes
+(a payment verified after its order was created) are picked up the next time
+that day is refreshed.
+
+Which days get refreshed:
+
+* ``schedule`` mode — the last ``recent_days`` days, every ``interval``
+  seconds;
+* ``changestream`` mode — additionally any day an insert or update touched,
+  taken from the ObjectId timestamp of the changed document;
+* first run — every day back to the oldest document (backfill).
+
+A lease in ``rollup_state`` makes sure only one worker runs the rollups at a
+time. Admins can also refresh a range from any worker, so each day is
+additionally claimed in ``rollup_state`` while it is being replaced. Two
+refreshes of the same day therefore run one after the other. Interleaved,
+the later run's cleanup could delete the buckets the other had just written.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pymongo import DeleteMany, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DURATION = REGISTRY.histogram(
+    'analytics_rollup_duration_seconds', 'Time to recompute one day of analytics rollups.')
+
+METRICS = ('revenue', 'payments', 'subscriptions', 'grants', 'new_users')
+DIMENSIONS = ('day', 'subject_id', 'board', 'city')
+SOURCES = ('payments', 'subscriptions', 'users')
+PAID_STATUSES = ['verified', 'captured']
+
+BucketKey = Tuple[str, str, str, str]
+
+# A claim on a day outlives a worker that died mid-refresh by at most this long
+DAY_CLAIM_SECONDS = 60
+
+
+class RollupBusy(RuntimeError):
+    pass
+
+
+def day_range(day: date) -> Dict[str, str]:
+    """``created_at`` filter for one UTC day (ISO strings sort chronologically)."""
+    return {'$gte': day.isoformat(), '$lt': (day + timedelta(days=1)).isoformat()}
+
+
+def parse_day(value: str) -> date:
+    return date.fromisoformat(value[:10])
+
+
+class RollupEngine:
+    def __init__(self, db, interval: float = 300.0, recent_days: int = 2,
+                 lease_seconds: Optional[float] = None, claim_timeout: float = 30.0):
+        self.db = db
+        self.claim_timeout = claim_timeout
+        self.interval = interval
+        self.recent_days = recent_days
+        self.lease_seconds = lease_seconds or max(interval * 3, 60)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.dirty: Set[date] = set()
+        self.ready = False
+        self.last_run: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ----- change events -----
+
+    def mark_dirty(self, change: dict):
+        """Invalidation-bus callback: schedule the day the changed document belongs to."""
+        key = change.get('documentKey', {}).get('_id')
+        generation_time = getattr(key, 'generation_time', None)
+        if generation_time is not None:
+            self.dirty.add(generation_time.date())
+
+    # ----- computing -----
+
+    async def compute_day(self, day: date) -> Dict[BucketKey, Dict[str, int]]:
+        window = day_range(day)
+        payments = await self.db.payments.find(
+            {'created_at': window, 'status': {'$in': PAID_STATUSES}},
+            {'_id': 0, 'user_email': 1, 'subject_id': 1, 'amount': 1}
+        ).to_list(None)
+        subscriptions = await self.db.subscriptions.find(
+            {'created_at': window, 'payment_status': 'completed'},
+            {'_id': 0, 'user_email': 1, 'subject_id': 1, 'source': 1}
+        ).to_list(None)
+        users = await self.db.users.find({'created_at': window}, {'_id': 0, 'email': 1, 'city': 1}).to_list(None)
+
+        cities = {u['email']: u.get('city', '') for u in users}
+        missing = {d['user_email'] for d in payments + subscriptions} - set(cities)
+        if missing:
+            async for u in self.db.users.find({'email': {'$in': list(missing)}}, {'_id': 0, 'email': 1, 'city': 1}):
+                cities[u['email']] = u.get('city', '')
+        subject_ids = {d['subject_id'] for d in payments + subscriptions}
+        boards = {}
+        if subject_ids:
+            async for s in self.db.subjects.find({'id': {'$in': list(subject_ids)}}, {'_id': 0, 'id': 1, 'board': 1}):
+                boards[s['id']] = s.get('board', '')
+
+        day_key = day.isoformat()
+        buckets: Dict[BucketKey, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+
+        def bucket(doc: dict) -> Dict[str, int]:
+            subject_id = doc['subject_id']
+            return buckets[(day_key, subject_id, boards.get(subject_id, ''), cities.get(doc['user_email'], ''))]
+
+        for payment in payments:
+            b = bucket(payment)
+            b['revenue'] += payment.get('amount', 0)
+            b['payments'] += 1
+        for subscription in subscriptions:
+            b = bucket(subscription)
+            b['subscriptions'] += 1
+            if subscription.get('source') == 'grant':
+                b['grants'] += 1
+        for user in users:
+            buckets[(day_key, '', '', user.get('city', ''))]['new_users'] += 1
+        return buckets
+
+    @asynccontextmanager
+    async def claim_day(self, day: date):
+        """Hold ``day`` exclusively, waiting up to ``claim_timeout`` for another refresh of it."""
+        key = {'_id': f"day:{day.isoformat()}"}
+        token = f"{self.owner}:{uuid.uuid4().hex[:6]}"
+        deadline = time.monotonic() + self.claim_timeout
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await self.db.rollup_state.find_one_and_update(
+                    {**key, 'expires_at': {'$lt': now}},
+                    {'$set': {'owner': token, 'expires_at': now + timedelta(seconds=DAY_CLAIM_SECONDS)}},
+                    upsert=True,
+                )
+                break
+            except DuplicateKeyError:
+                # Another refresh of this day is running
+                if time.monotonic() > deadline:
+                    raise RollupBusy(f"Analytics for {day.isoformat()} are being refreshed, retry shortly")
+                await asyncio.sleep(0.1)
+        try:
+            yield
+        finally:
+            await self.db.rollup_state.delete_one({**key, 'owner': token})
+
+    async def refresh_day(self, day: date) -> int:
+        """Recompute and replace one day's buckets; returns the bucket count."""
+        async with self.claim_day(day):
+            with ROLLUP_DURATION.time():
+                buckets = await self.compute_day(day)
+                run = uuid.uuid4().hex
+                now = datetime.now(timezone.utc).isoformat()
+                operations = [
+                    ReplaceOne(
+                        dict(zip(DIMENSIONS, key)),
+                        {**dict(zip(DIMENSIONS, key)), **values, 'run': run, 'updated_at': now},
+                        upsert=True,
+                    )
+                    for key, values in buckets.items()
+                ]
+                # Buckets this run didn't produce no longer have any source documents
+                operations.append(DeleteMany({'day': day.isoformat(), 'run': {'$ne': run}}))
+                await self.db.analytics_daily.bulk_write(operations, ordered=True)
+        return len(buckets)
+
+    async def refresh(self, days: Iterable[date]) -> int:
+        refreshed = 0
+        for day in sorted(set(days)):
+            await self.refresh_day(day)
+            refreshed += 1
+        self.last_run = datetime.now(timezone.utc).isoformat()
+        return refreshed
+
+    async def oldest_day(self) -> Optional[date]:
+        oldest = []
+        for source in SOURCES:
+            doc = await self.db[source].find_one(
+                {'created_at': {'$exists': True}}, {'_id': 0, 'created_at': 1}, sort=[('created_at', 1)])
+            if doc:
+                oldest.append(parse_day(doc['created_at']))
+        return min(oldest) if oldest else None
+
+    async def backfill(self):
+        today = datetime.now(timezone.utc).date()
+        start = await self.oldest_day() or today
+        days = [start + timedelta(days=i) for i in range((today - start).days + 1)]
+        logger.info(f"Backfilling analytics rollups for {len(days)} days")
+        await self.refresh(days)
+        await self.db.rollup_state.update_one(
+            {'_id': 'backfill'}, {'$set': {'completed_at': self.last_run}}, upsert=True)
+
+    async def tick(self):
+        """One scheduling round: backfill once, then recent and dirty days."""
+        if not await self.db.rollup_state.find_one({'_id': 'backfill'}):
+            self.dirty.clear()
+            await self.backfill()
+        else:
+            today = datetime.now(timezone.utc).date()
+            days = {today - timedelta(days=i) for i in range(self.recent_days)}
+            days |= self.dirty
+            self.dirty = set()
+            await self.refresh(days)
+        self.ready = True
+
+    # ----- leasing and scheduling -----
+
+    async def acquire_lease(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.rollup_state.find_one_and_update(
+                {'_id': 'lease', '$or': [{'owner': self.owner}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'owner': self.owner, 'expires_at': now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # another worker holds an unexpired lease
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='analytics-rollups')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.acquire_lease():
+                    await self.tick()
+                else:
+                    self.ready = bool(await self.db.rollup_state.find_one({'_id': 'backfill'}))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Analytics rollup failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+async def query_buckets(db, start: date, end: date, group_by: Sequence[str],
+                        filters: Optional[Dict[str, str]] = None) -> dict:
+    """Sum buckets between ``start`` and ``end`` (inclusive), grouped by ``group_by``."""
+    match: Dict[str, object] = {'day': {'$gte': start.isoformat(), '$lte': end.isoformat()}}
+    for field, value in (filters or {}).items():
+        if value:
+            match[field] = value
+    group: Dict[str, object] = {'_id': {field: f"${field}" for field in group_by} or None}
+    group.update({metric: {'$sum': f"${metric}"} for metric in METRICS})
+    pipeline: List[dict] = [{'$match': match}, {'$group': group}]
+    rows = []
+    async for row in db.analytics_daily.aggregate(pipeline):
+        keys = row.pop('_id') or {}
+        rows.append({**keys, **row})
+    rows.sort(key=lambda r: tuple(str(r.get(field, '')) for field in group_by))
+    totals = {metric: sum(r[metric] for r in rows) for metric in METRICS}
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'group_by': list(group_by),
+        'rows': rows,
+        'totals': totals,
+    }
+
+
+async def ensure_indexes(db):
+    await db.analytics_daily.create_index([('day', 1), ('subject_id', 1), ('board', 1), ('city', 1)], unique=True)
+    for source in SOURCES:
+        await db[source].create_index('created_at')
@@ -0,0 +1,194 @@
+"""In-process full-text search over materials and updates.
+
+The catalog is small (thousands of documents) and read far more often than
+it is written, so each worker keeps an inverted index in memory instead of
+relying on a ``$text`` index. That way it can also do prefix matching on the
+last word typed. The index is rebuilt lazily:
+
+* ``invalidate()`` is called on every material or update write, both locally
+  and through the invalidation bus from other workers;
+* the next search rebuilds the index;
+* a TTL bounds staleness if an invalidation is ever missed.
+
+Ranking is a small BM25 with title matches weighted above description
+matches. Documents that match every query term rank first. Scoring stops at
+the latency budget and marks the result ``partial``.
+"""
+import asyncio
+import bisect
+import math
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from metrics import REGISTRY
+
+SEARCH_LATENCY = REGISTRY.histogram(
+    'catalog_search_duration_seconds', 'Catalog search query time, excluding index rebuilds.',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+SEARCH_REBUILDS = REGISTRY.counter('catalog_search_rebuilds_total', 'Catalog search index rebuilds.')
+
+TOKEN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from in is it of on or the to with this that these those'.split()
+)
+FIELD_WEIGHTS = {'title': 3.0, 'description': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Shortest last word that is also matched as a prefix
+MIN_PREFIX = 3
+
+
+def stem(token: str) -> str:
+    """Very light English stemming: plural endings only."""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [stem(t) for t in TOKEN.findall((text or '').lower()) if t not in STOPWORDS]
+
+
+@dataclass
+class SearchDoc:
+    kind: str  # 'material' or 'update'
+    id: str
+    title: str
+    subject_id: Optional[str]
+    payload: dict
+    length: float
+
+
+class CatalogSearchIndex:
+    def __init__(self, ttl: float = 300.0, budget_ms: float = 50.0):
+        self.ttl = ttl
+        self.budget_ms = budget_ms
+        self.docs: List[SearchDoc] = []
+        # term -> {doc index: weighted term frequency}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.terms: List[str] = []  # sorted, for prefix lookups
+        self.average_length = 1.0
+        self._built_at: Optional[float] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._generation += 1
+        self._built_at = None
+
+    @property
+    def fresh(self) -> bool:
+        return self._built_at is not None and time.monotonic() - self._built_at < self.ttl
+
+    def build(self, materials: Iterable[dict], updates: Iterable[dict]):
+        docs: List[SearchDoc] = []
+        postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        for kind, source in (('material', materials), ('update', updates)):
+            for item in source:
+                weighted: Dict[str, float] = defaultdict(float)
+                for field, weight in FIELD_WEIGHTS.items():
+                    for token in tokenize(item.get(field)):
+                        weighted[token] += weight
+                index = len(docs)
+                docs.append(SearchDoc(
+                    kind=kind,
+                    id=item['id'],
+                    title=item.get('title', ''),
+                    subject_id=item.get('subject_id'),
+                    payload=item,
+                    length=sum(weighted.values()) or 1.0,
+                ))
+                for token, frequency in weighted.items():
+                    postings[token][index] = frequency
+        self.docs = docs
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+        self.average_length = sum(d.length for d in docs) / len(docs) if docs else 1.0
+        self._built_at = time.monotonic()
+        SEARCH_REBUILDS.inc()
+
+    async def ensure_fresh(self, db):
+        if self.fresh:
+            return
+        async with self._lock:
+            if self.fresh:
+                return
+            generation = self._generation
+            materials = await db.materials.find(
+                {}, {'_id': 0, 'id': 1, 'subject_id': 1, 'title': 1, 'type': 1, 'link': 1, 'description': 1}
+            ).to_list(None)
+            updates = await db.updates.find(
+                {'is_active': True},
+                {'_id': 0, 'id': 1, 'title': 1, 'type': 1, 'link': 1, 'description': 1, 'created_at': 1}
+            ).to_list(None)
+            self.build(materials, updates)
+            if generation != self._generation:
+                self._built_at = None  # a write landed while loading; rebuild next time
+
+    def _expand(self, token: str, prefix: bool) -> List[str]:
+        if not prefix or len(token) < MIN_PREFIX:
+            return [token] if token in self.postings else []
+        start = bisect.bisect_left(self.terms, token)
+        matches = []
+        for term in self.terms[start:]:
+            if not term.startswith(token):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str, subject_ids: Set[str], limit: int = 20) -> dict:
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000
+        raw = TOKEN.findall(query.lower())
+        tokens = tokenize(query)
+        # The last word may still be being typed
+        prefix_last = bool(raw) and not query.endswith(' ')
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        partial = False
+        total_docs = len(self.docs) or 1
+        for position, token in enumerate(tokens):
+            if time.perf_counter() > deadline:
+                partial = True
+                break
+            seen: Set[int] = set()
+            for term in self._expand(token, prefix_last and position == len(tokens) - 1):
+                posting = self.postings[term]
+                idf = math.log(1 + (total_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for index, frequency in posting.items():
+                    doc = self.docs[index]
+                    if doc.kind == 'material' and doc.subject_id not in subject_ids:
+                        continue
+                    norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * doc.length / self.average_length)
+                    scores[index] += idf * frequency * (BM25_K1 + 1) / norm
+                    seen.add(index)
+            for index in seen:
+                matched[index] += 1
+
+        ranked: List[Tuple[int, float, int]] = sorted(
+            ((matched[i], score, i) for i, score in scores.items()),
+            key=lambda item: (-item[0], -item[1], item[2]),
+        )[:limit]
+        results = []
+        for matched_terms, score, index in ranked:
+            doc = self.docs[index]
+            results.append({
+                'kind': doc.kind,
+                **doc.payload,
+                'score': round(score, 3),
+                'matched_all': matched_terms == len(tokens),
+            })
+        elapsed = time.perf_counter() - started
+        SEARCH_LATENCY.observe(value=elapsed)
+        return {
+            'query': query,
+            'results': results,
+            'took_ms': round(elapsed * 1000, 2),
+            'partial': partial,
+        }
+
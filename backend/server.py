@@ -1,27 +1,112 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import json
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional
-from datetime import datetime, timezone, timedelta
-import bcrypt
+from typing import List, Optional, Sequence
+from datetime import date as date_type, datetime, timezone, timedelta
 import jwt
 import razorpay
 import hmac
 import hashlib
+import uuid
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from admission import gates_from_env
+from audit import audit_log_from_env
+from blocking import watchdog_from_env
+from cache import ResponseCache
+from catalog_import import (
+    CatalogImporter,
+    ImportFormatError,
+    detect_format,
+    ensure_indexes as ensure_catalog_indexes,
+)
+from database import admin_client_options, ensure_unique_index, mongo_client_options, routed_databases, unique_enforced
+from entitlements import (
+    ENTITLEMENT_PROJECTION,
+    ActiveSubjects,
+    active_subject_ids,
+    backfill as backfill_entitlements,
+    ensure_indexes as ensure_entitlement_indexes,
+    extend as extend_entitlement,
+    extend_many as extend_entitlements,
+    is_active as is_entitlement_active,
+    move_subject as move_entitlements,
+)
+from etags import (
+    PRIVATE_CACHE_CONTROL,
+    VersionStamps,
+    make_etag,
+    new_stamp,
+    not_modified,
+    public_cache_control,
+    validator_headers,
+)
+from coalesce import SingleFlight
+from compression import CompressionMiddleware
+from fast_json import FastJSONResponse, model_projection, trusted
+from invalidation import InvalidationBus
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    STREAM_BATCH_SIZE,
+    InvalidCursor,
+    fetch_page,
+    stream_json_array,
+)
+from material_views import EVENT_KINDS, MaterialViewCounter, view_report
+from overload import OverloadMiddleware, low_priority_from_env, monitor_from_env
+from metrics import (
+    RAZORPAY_DURATION, REGISTRY,
+    MetricsMiddleware, MongoCommandMetrics, MongoPoolMetrics, timed,
+)
+from slow_queries import QueryContextMiddleware, listener_from_env
+from search_index import CatalogSearchIndex
+from rollups import (
+    DIMENSIONS as ROLLUP_DIMENSIONS,
+    RollupBusy,
+    RollupEngine,
+    ensure_indexes as ensure_rollup_indexes,
+    query_buckets,
+)
+from user_search import (
+    PUBLIC_USER_PROJECTION,
+    backfill_search_keys,
+    ensure_indexes as ensure_user_search_indexes,
+    search_keys,
+    search_users,
+)
+from passwords import PASSWORD_REHASHES, hasher_from_env, report_cost_distribution
+from rate_limit import MemoryRateLimitBackend, MongoRateLimitBackend, client_ip, limiter_from_env
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection (created per worker in the lifespan, see connect_database)
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+slow_query_listener = listener_from_env(mongo_url, os.environ['DB_NAME'], os.environ)
+client = admin_client = None
+# db: primary (auth, payments, writes); catalog_db / analytics_db may read from secondaries;
+# admin_db / analytics_db go through admin_client, whose smaller pool caps admin and bulk work
+db = catalog_db = analytics_db = admin_db = None
+
+def connect_database():
+    """Create this worker's Mongo clients and database handles"""
+    global client, admin_client, db, catalog_db, analytics_db, admin_db
+    listeners = [MongoCommandMetrics(), MongoPoolMetrics(), slow_query_listener]
+    client = AsyncIOMotorClient(mongo_url, event_listeners=listeners, **mongo_client_options(os.environ))
+    db, catalog_db, _ = routed_databases(client, os.environ['DB_NAME'], os.environ)
+    admin_client = AsyncIOMotorClient(mongo_url, event_listeners=listeners, **admin_client_options(os.environ))
+    admin_db, _, analytics_db = routed_databases(admin_client, os.environ['DB_NAME'], os.environ)
 
 # Razorpay client
 razorpay_client = razorpay.Client(auth=(os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_mock'), os.environ.get('RAZORPAY_KEY_SECRET', 'mock_secret')))
@@ -30,8 +115,9 @@ razorpay_client = razorpay.Client(auth=(os.environ.get('RAZORPAY_KEY_ID', 'rzp_t
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
-# Create the main app
-app = FastAPI()
+# bcrypt cost from BCRYPT_ROUNDS (a number, or 'auto' to calibrate to BCRYPT_TARGET_MS)
+password_hasher = hasher_from_env(os.environ)
+
 api_router = APIRouter(prefix="/api")
 
 security = HTTPBearer()
@@ -40,6 +126,67 @@ security = HTTPBearer()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared catalog responses, stored serialized and precompressed
+catalog_cache = ResponseCache(
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', '30')),
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    max_entries=int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '256')),
+)
+# Version stamps behind the catalog and subscription ETags (database bound in the lifespan)
+version_stamps = VersionStamps(None, ttl=float(os.environ.get('CATALOG_CACHE_TTL', '30')))
+CATALOG_CACHE_CONTROL = public_cache_control(
+    edge_max_age=int(os.environ.get('CATALOG_EDGE_MAX_AGE', '30')),
+    stale_while_revalidate=int(os.environ.get('CATALOG_STALE_WHILE_REVALIDATE', '60')),
+)
+# Identical concurrent material list queries share one round trip
+material_reads = SingleFlight('materials')
+
+# Event-loop lag sampler behind the overload middleware (started in the lifespan)
+loop_monitor = monitor_from_env(os.environ)
+# Stack captures of synchronous code holding the loop (BLOCKING_WATCHDOG=true only)
+blocking_watchdog = watchdog_from_env(os.environ)
+
+# Keeps per-worker caches coherent when another worker writes
+invalidation_bus = InvalidationBus()
+
+# Full-text search over materials and updates (per worker, rebuilt on writes)
+search_index = CatalogSearchIndex(
+    ttl=float(os.environ.get('SEARCH_INDEX_TTL', '300')),
+    budget_ms=float(os.environ.get('SEARCH_BUDGET_MS', '50')),
+)
+
+# Daily analytics buckets (database bound in the lifespan)
+ROLLUP_MODE = os.environ.get('ROLLUP_MODE', 'schedule')
+rollup_engine = RollupEngine(
+    None,
+    interval=float(os.environ.get('ROLLUP_INTERVAL_SECONDS', '300')),
+    recent_days=int(os.environ.get('ROLLUP_RECENT_DAYS', '2')),
+)
+
+# Material view / session counts, flushed as $inc upserts (collection bound in the lifespan)
+material_views = MaterialViewCounter(
+    interval=float(os.environ.get('MATERIAL_VIEWS_FLUSH_INTERVAL', '30')),
+    max_keys=int(os.environ.get('MATERIAL_VIEWS_MAX_KEYS', '50000')),
+)
+# Each viewer's active subjects, so event beacons don't query entitlements every time
+viewer_subjects = ActiveSubjects(ttl=float(os.environ.get('MATERIAL_VIEWS_ENTITLEMENT_TTL', '60')))
+
+# Audit trail of admin mutations and auth events (collection bound in the lifespan)
+audit_log = audit_log_from_env(os.environ)
+
+# Rate limiting for credential endpoints (runs before any DB or bcrypt work)
+if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+    rate_limit_backend = MongoRateLimitBackend(None)  # collection bound in the lifespan
+else:
+    rate_limit_backend = MemoryRateLimitBackend()
+
+login_limiter = limiter_from_env('login', backend=rate_limit_backend, ip_rate='60/60', identifier_rate='10/60')
+register_limiter = limiter_from_env('register', backend=rate_limit_backend, ip_rate='10/60', identifier_rate='3/60')
+admin_login_limiter = limiter_from_env(
+    'admin_login', backend=rate_limit_backend,
+    ip_rate='10/60', identifier_rate='5/60', lockout_threshold=5, lockout_duration=1800
+)
+
 # ============= Models =============
 
 class UserRegister(BaseModel):
@@ -82,6 +229,15 @@ class Subscription(BaseModel):
     end_date: str
     payment_status: str
 
+class MaterialEvent(BaseModel):
+    material_id: str = Field(min_length=1, max_length=100)
+    subject_id: str = Field(min_length=1, max_length=200)
+    type: str  # 'view' when opened, 'session' when closed
+    seconds: float = 0
+
+class MaterialEvents(BaseModel):
+    events: List[MaterialEvent] = Field(max_length=50)
+
 class Material(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -91,6 +247,14 @@ class Material(BaseModel):
     link: str
     description: Optional[str] = None
 
+# Projections matching the response models, so list endpoints can skip
+# response-model validation and serialize the documents directly
+SUBJECT_PROJECTION = model_projection(Subject)
+SUBSCRIPTION_PROJECTION = model_projection(Subscription)
+MATERIAL_PROJECTION = model_projection(Material)
+# List views that don't render descriptions ask for ?fields=summary
+MATERIAL_SUMMARY_PROJECTION = {k: v for k, v in MATERIAL_PROJECTION.items() if k != 'description'}
+
 class PaymentOrder(BaseModel):
     subject_id: str
     amount: int
@@ -106,13 +270,31 @@ class PaymentVerification(BaseModel):
     order_id: str
     signature: str
 
+# ============= Helpers =============
+
+def make_subject_id(board: str, class_name: str, subject_name: str) -> str:
+    """Slug used as a subject's ID, e.g. ``icse-class-10-biology``"""
+    return f"{board.lower()}-{class_name.lower().replace(' ', '-')}-{subject_name.lower()}"
+
+def subject_display_name(subject: dict) -> str:
+    return f"{subject['board']} - {subject['class_name']} - {subject['subject_name']}"
+
 # ============= Auth Functions =============
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return password_hasher.hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return password_hasher.verify(password, hashed)
+
+async def rehash_if_needed(collection, query: dict, password: str, hashed: str, role: str):
+    """Re-hash a just-verified password stored at an outdated bcrypt cost"""
+    if not password_hasher.needs_rehash(hashed):
+        return
+    # Matching on the old hash keeps a concurrent password change from being overwritten
+    result = await collection.update_one({**query, 'password': hashed}, {'$set': {'password': hash_password(password)}})
+    if result.modified_count:
+        PASSWORD_REHASHES.inc(role)
 
 def create_jwt_token(email: str) -> str:
     payload = {
@@ -139,16 +321,56 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+def get_token_email(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Caller's email from the JWT alone, for endpoints that never need the user document"""
+    return decode_jwt_token(credentials.credentials).get('email')
+
+async def catalog_changed(*collections: str):
+    """Drop cached catalog state after a write and publish new version stamps"""
+    cached = [c for c in collections if c in ('subjects', 'updates')]
+    if cached:
+        catalog_cache.invalidate(*cached)
+    if {'materials', 'updates'} & set(collections):
+        search_index.invalidate()
+    await version_stamps.bump(*collections)
+
+async def paged_or_streamed(collection, query: dict, projection: dict, limit: Optional[int],
+                            cursor: Optional[str], stream: bool, headers: dict, stamps: Sequence[str] = ()):
+    """The ?limit / ?cursor page or ?stream=true variant of a list endpoint; None for the plain list
+
+    ``stamps`` name the version stamps behind the response's ETag; the data is read no older than they are.
+    """
+    if limit or cursor:
+        try:
+            async with version_stamps.reading(*stamps) as session:
+                page = await fetch_page(collection, query, projection, limit or DEFAULT_PAGE_SIZE, cursor, session)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return trusted(page, headers=headers)
+    if stream:
+        async def body():
+            # The stream outlives the handler, so it holds its own session
+            async with version_stamps.reading(*stamps) as session:
+                documents = collection.find(query, projection, session=session).batch_size(STREAM_BATCH_SIZE)
+                async for chunk in stream_json_array(documents):
+                    yield chunk
+        return StreamingResponse(body(), media_type='application/json', headers=headers)
+    return None
+
+async def subscriptions_changed(*emails: str):
+    """New ETags for the given users' subscription lists"""
+    await db.users.update_many({'email': {'$in': list(emails)}}, {'$set': {'subscriptions_stamp': new_stamp()}})
+
 # ============= Auth Routes =============
 
 @api_router.post("/auth/register")
-async def register(user_data: UserRegister):
-    # Check if user exists
-    existing_user = await db.users.find_one({'email': user_data.email})
-    if existing_user:
+async def register(user_data: UserRegister, request: Request):
+    await register_limiter.check(client_ip(request), user_data.email)
+    
+    # An indexed lookup is far cheaper than the bcrypt round below; the unique index still settles races
+    if await db.users.find_one({'email': user_data.email}, {'_id': 1}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Create user
     user_doc = {
         'email': user_data.email,
         'password': hash_password(user_data.password),
@@ -157,8 +379,13 @@ async def register(user_data: UserRegister):
         'city': user_data.city,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
+    user_doc['search'] = search_keys(user_doc)
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    audit_log.record('auth.register', user_data.email)
     token = create_jwt_token(user_data.email)
     
     return {
@@ -172,8 +399,10 @@ async def register(user_data: UserRegister):
     }
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
     identifier = credentials.identifier.strip()
+    ip = client_ip(request)
+    await login_limiter.check(ip)
     
     # Check if identifier is email or phone
     # Try to find user by email first, then by phone
@@ -182,12 +411,18 @@ async def login(credentials: UserLogin):
         # Try finding by phone number
         user = await db.users.find_one({'phone': identifier})
     
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    # Limit by account, not by what was typed, so email and phone share one failure count
+    account = user['email'] if user else identifier
+    await login_limiter.check_account(ip, account)
     
-    if not verify_password(credentials.password, user['password']):
+    if not user or not verify_password(credentials.password, user['password']):
+        await login_limiter.record_failure(ip, account)
+        audit_log.record('auth.login_failed', identifier)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    await login_limiter.record_success(ip, account)
+    audit_log.record('auth.login', user['email'])
+    await rehash_if_needed(db.users, {'email': user['email']}, credentials.password, user['password'], 'user')
     token = create_jwt_token(user['email'])
     
     return {
@@ -228,13 +463,17 @@ async def update_profile(
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
-    await db.users.update_one(
+    update_data['search'] = search_keys({**current_user, **update_data})
+    
+    # Update and read back the result in one round trip
+    updated_user = await db.users.find_one_and_update(
         {'email': current_user['email']},
-        {'$set': update_data}
+        {'$set': update_data},
+        projection=PUBLIC_USER_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    
-    # Get updated user
-    updated_user = await db.users.find_one({'email': current_user['email']}, {'_id': 0, 'password': 0})
+    if not updated_user:
+        raise HTTPException(status_code=404, detail="User not found")
     
     return {
         'message': 'Profile updated successfully',
@@ -253,26 +492,52 @@ async def change_password(
     current_user: dict = Depends(get_current_user)
 ):
     """Change user password"""
-    # Verify current password
-    user = await db.users.find_one({'email': current_user['email']})
-    if not verify_password(current_password, user['password']):
+    # Verify current password (get_current_user already loaded the hash)
+    if not verify_password(current_password, current_user['password']):
+        audit_log.record('auth.password_change_failed', current_user['email'])
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
-    # Update password
-    await db.users.update_one(
-        {'email': current_user['email']},
+    # Only replace the hash that was verified, so a concurrent change isn't overwritten
+    result = await db.users.update_one(
+        {'email': current_user['email'], 'password': current_user['password']},
         {'$set': {'password': hash_password(new_password)}}
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=409, detail="Password was changed by another request")
+    audit_log.record('auth.password_changed', current_user['email'])
     
     return {'message': 'Password changed successfully'}
 
 # ============= Subject Routes =============
 
 @api_router.get("/subjects", response_model=List[Subject])
-async def get_subjects():
+async def get_subjects(
+    request: Request,
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    # The stamp is read before the data, so a concurrent write can't produce a stale 304
+    stamp = await version_stamps.get('subjects')
+    etag = make_etag('subjects', stamp)
+    unchanged = not_modified(request, 'subjects', etag, CATALOG_CACHE_CONTROL)
+    if unchanged is not None:
+        return unchanged
+    
     # Only return visible subjects for students
-    subjects = await db.subjects.find({'is_visible': {'$ne': False}}, {'_id': 0}).to_list(100)
-    return subjects
+    query = {'is_visible': {'$ne': False}}
+    headers = validator_headers(etag, CATALOG_CACHE_CONTROL)
+    variant = await paged_or_streamed(
+        catalog_db.subjects, query, SUBJECT_PROJECTION, limit, cursor, stream, headers, stamps=('subjects',))
+    if variant is not None:
+        return variant
+    
+    async def load():
+        async with version_stamps.reading('subjects') as session:
+            return await catalog_db.subjects.find(query, SUBJECT_PROJECTION, session=session).to_list(None)
+    
+    body = await catalog_cache.get_or_load(f'subjects:{stamp}', load)
+    return body.response(request.headers.get('Accept-Encoding', ''), headers)
 
 @api_router.post("/subjects/seed")
 async def seed_subjects():
@@ -288,60 +553,131 @@ async def seed_subjects():
     
     await db.subjects.delete_many({})
     await db.subjects.insert_many(subjects)
+    await catalog_changed('subjects')
+    audit_log.record('subject.seed', None, count=len(subjects))
     
     return {'message': 'Subjects seeded successfully', 'count': len(subjects)}
 
 # ============= Subscription Routes =============
 
 @api_router.get("/subscriptions/my", response_model=List[Subscription])
-async def get_my_subscriptions(current_user: dict = Depends(get_current_user)):
-    subscriptions = await db.subscriptions.find(
-        {'user_email': current_user['email']},
-        {'_id': 0}
-    ).to_list(100)
-    return subscriptions
+async def get_my_subscriptions(
+    request: Request,
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    # Per-user stamp plus a global one for admin-wide rewrites (subject renames)
+    etag = make_etag(
+        'subscriptions',
+        await version_stamps.get('subscriptions'),
+        current_user.get('subscriptions_stamp', '0'),
+    )
+    unchanged = not_modified(request, 'subscriptions', etag, PRIVATE_CACHE_CONTROL)
+    if unchanged is not None:
+        return unchanged
+    
+    query = {'user_email': current_user['email']}
+    headers = validator_headers(etag, PRIVATE_CACHE_CONTROL)
+    variant = await paged_or_streamed(db.subscriptions, query, SUBSCRIPTION_PROJECTION, limit, cursor, stream, headers)
+    if variant is not None:
+        return variant
+    
+    subscriptions = await db.subscriptions.find(query, SUBSCRIPTION_PROJECTION).to_list(None)
+    return trusted(subscriptions, headers=headers)
 
 @api_router.get("/subscriptions/check/{subject_id}")
 async def check_subscription(subject_id: str, current_user: dict = Depends(get_current_user)):
-    subscription = await db.subscriptions.find_one({
-        'user_email': current_user['email'],
-        'subject_id': subject_id,
-        'payment_status': 'completed'
-    }, {'_id': 0})
+    # One entitlement per user and subject, however many purchases renewed it
+    entitlement = await db.entitlements.find_one(
+        {'user_email': current_user['email'], 'subject_id': subject_id},
+        ENTITLEMENT_PROJECTION
+    )
     
-    if not subscription:
+    if not entitlement:
         return {'has_subscription': False}
     
     # Check if subscription is active
-    end_date = datetime.fromisoformat(subscription['end_date'])
-    is_active = end_date > datetime.now(timezone.utc)
+    is_active = is_entitlement_active(entitlement)
     
     return {
         'has_subscription': is_active,
-        'subscription': subscription if is_active else None
+        'subscription': entitlement if is_active else None
     }
 
 # ============= Material Routes =============
 
+@api_router.get("/search")
+async def search_catalog(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search materials of the caller's active subscriptions and active updates"""
+    subject_ids = set(await active_subject_ids(db.entitlements, current_user['email']))
+    
+    await search_index.ensure_fresh(catalog_db)
+    return trusted(search_index.search(q, subject_ids, limit=limit))
+
 @api_router.get("/materials/{subject_id}", response_model=List[Material])
-async def get_materials(subject_id: str, current_user: dict = Depends(get_current_user)):
-    # Check subscription (RLS)
-    subscription = await db.subscriptions.find_one({
-        'user_email': current_user['email'],
-        'subject_id': subject_id,
-        'payment_status': 'completed'
-    })
+async def get_materials(
+    subject_id: str,
+    request: Request,
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    fields: str = Query(default='full', pattern='^(full|summary)$'),
+    current_user: dict = Depends(get_current_user)
+):
+    # Check subscription (RLS): a point lookup on the unique (user_email, subject_id) index
+    entitlement = await db.entitlements.find_one(
+        {'user_email': current_user['email'], 'subject_id': subject_id},
+        {'_id': 0, 'end_date': 1}
+    )
     
-    if not subscription:
+    if not entitlement:
         raise HTTPException(status_code=403, detail="No active subscription for this subject")
     
     # Check if subscription is active
-    end_date = datetime.fromisoformat(subscription['end_date'])
-    if end_date <= datetime.now(timezone.utc):
+    if not is_entitlement_active(entitlement):
         raise HTTPException(status_code=403, detail="Subscription expired")
     
-    materials = await db.materials.find({'subject_id': subject_id}, {'_id': 0}).to_list(100)
-    return materials
+    # Access is checked first: a 304 must never outlive the subscription
+    etag = make_etag('materials', await version_stamps.get('materials'))
+    unchanged = not_modified(request, 'materials', etag, PRIVATE_CACHE_CONTROL)
+    if unchanged is not None:
+        return unchanged
+    
+    query = {'subject_id': subject_id}
+    projection = MATERIAL_SUMMARY_PROJECTION if fields == 'summary' else MATERIAL_PROJECTION
+    headers = validator_headers(etag, PRIVATE_CACHE_CONTROL)
+    variant = await paged_or_streamed(
+        catalog_db.materials, query, projection, limit, cursor, stream, headers, stamps=('materials',))
+    if variant is not None:
+        return variant
+    
+    async def load():
+        async with version_stamps.reading('materials') as session:
+            return await catalog_db.materials.find(query, projection, session=session).to_list(None)
+    
+    # Students of one subject share a single in-flight query (per stamp: a newer ETag never gets older data)
+    materials = await material_reads.do((subject_id, fields, etag), load)
+    return trusted(materials, headers=headers)
+
+@api_router.post("/materials/events", status_code=202)
+async def record_material_events(batch: MaterialEvents, email: str = Depends(get_token_email)):
+    """Count material views and viewing sessions (in memory; flushed in the background)"""
+    events = [event for event in batch.events if event.type in EVENT_KINDS]
+    # Only subjects the caller is entitled to (usually already loaded); the flush drops made-up materials
+    subject_ids = await viewer_subjects.includes(db.entitlements, email, {e.subject_id for e in events})
+    accepted = 0
+    for event in events:
+        if event.subject_id not in subject_ids:
+            material_views.reject(event.type)
+        elif material_views.record(event.material_id, event.subject_id, event.type, event.seconds):
+            accepted += 1
+    return {'accepted': accepted}
 
 @api_router.post("/materials/seed")
 async def seed_materials():
@@ -375,6 +711,8 @@ async def seed_materials():
     
     await db.materials.delete_many({})
     await db.materials.insert_many(materials)
+    await catalog_changed('materials')
+    audit_log.record('material.seed', None, count=len(materials))
     
     return {'message': 'Materials seeded successfully', 'count': len(materials)}
 
@@ -389,15 +727,16 @@ async def create_payment_order(order_data: PaymentOrder, current_user: dict = De
     
     # Create Razorpay order
     try:
-        razorpay_order = razorpay_client.order.create({
-            'amount': order_data.amount * 100,  # Convert to paise
-            'currency': 'INR',
-            'payment_capture': 1,
-            'notes': {
-                'subject_id': order_data.subject_id,
-                'user_email': current_user['email']
-            }
-        })
+        with timed(RAZORPAY_DURATION, 'order.create'):
+            razorpay_order = razorpay_client.order.create({
+                'amount': order_data.amount * 100,  # Convert to paise
+                'currency': 'INR',
+                'payment_capture': 1,
+                'notes': {
+                    'subject_id': order_data.subject_id,
+                    'user_email': current_user['email']
+                }
+            })
         
         # Store order in database
         payment_doc = {
@@ -421,6 +760,47 @@ async def create_payment_order(order_data: PaymentOrder, current_user: dict = De
         logger.error(f"Error creating Razorpay order: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create payment order")
 
+async def apply_purchase(payment: dict, subject: dict) -> bool:
+    """Extend the buyer's entitlement by one subject duration and record the purchase.
+
+    Safe to call from both the verify endpoint and the webhook: the order is
+    applied once. Returns False when it already had been.
+    """
+    order_id = payment['order_id']
+    details = {
+        'id': f"sub-{order_id}",
+        'order_id': order_id,
+        'subject_name': subject_display_name(subject),
+        'price': payment['amount'],
+        'duration_months': subject['duration_months'],
+        'payment_status': 'completed'
+    }
+    entitlement, starts, _ = await extend_entitlement(
+        db.entitlements, payment['user_email'], payment['subject_id'],
+        subject['duration_months'] * 30, order_id, **details
+    )
+    now = datetime.now(timezone.utc)
+    # Purchase history, one document per order (also written when only the entitlement got through before)
+    try:
+        await db.subscriptions.update_one(
+            {'order_id': order_id},
+            {'$setOnInsert': {
+                **details,
+                'user_email': payment['user_email'],
+                'subject_id': payment['subject_id'],
+                'start_date': (starts or now).isoformat(),
+                'end_date': entitlement['end_date'],
+                'created_at': now.isoformat()
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # verify and the webhook raced; the other one inserted it
+    if starts is None:
+        return False
+    await subscriptions_changed(payment['user_email'])
+    return True
+
 @api_router.post("/payments/webhook")
 async def payment_webhook(request: Request):
     """Handle Razorpay webhook"""
@@ -441,7 +821,6 @@ async def payment_webhook(request: Request):
                 raise HTTPException(status_code=400, detail="Invalid signature")
         
         # Parse payload
-        import json
         event = json.loads(payload)
         
         if event['event'] == 'payment.captured':
@@ -464,25 +843,7 @@ async def payment_webhook(request: Request):
             if not subject:
                 return {'status': 'subject not found'}
             
-            # Create subscription (6 months)
-            start_date = datetime.now(timezone.utc)
-            end_date = start_date + timedelta(days=subject['duration_months'] * 30)
-            
-            subscription_doc = {
-                'id': f"sub-{order_id}",
-                'user_email': payment['user_email'],
-                'subject_id': payment['subject_id'],
-                'subject_name': f"{subject['board']} - {subject['class_name']} - {subject['subject_name']}",
-                'price': payment['amount'],
-                'duration_months': subject['duration_months'],
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'payment_status': 'completed',
-                'order_id': order_id,
-                'created_at': datetime.now(timezone.utc).isoformat()
-            }
-            
-            await db.subscriptions.insert_one(subscription_doc)
+            await apply_purchase(payment, subject)
             
             return {'status': 'success'}
         
@@ -506,7 +867,8 @@ async def verify_payment(
             'razorpay_signature': verification_data.signature
         }
         
-        razorpay_client.utility.verify_payment_signature(params_dict)
+        with timed(RAZORPAY_DURATION, 'verify_payment_signature'):
+            razorpay_client.utility.verify_payment_signature(params_dict)
         
         # Get payment record
         payment = await db.payments.find_one({'order_id': verification_data.order_id})
@@ -524,31 +886,10 @@ async def verify_payment(
         if not subject:
             raise HTTPException(status_code=404, detail="Subject not found")
         
-        # Check if subscription already exists
-        existing_sub = await db.subscriptions.find_one({'order_id': verification_data.order_id})
-        if existing_sub:
+        # The webhook may have applied this order already
+        if not await apply_purchase(payment, subject):
             return {'status': 'success', 'message': 'Subscription already created'}
         
-        # Create subscription
-        start_date = datetime.now(timezone.utc)
-        end_date = start_date + timedelta(days=subject['duration_months'] * 30)
-        
-        subscription_doc = {
-            'id': f"sub-{verification_data.order_id}",
-            'user_email': current_user['email'],
-            'subject_id': payment['subject_id'],
-            'subject_name': f"{subject['board']} - {subject['class_name']} - {subject['subject_name']}",
-            'price': payment['amount'],
-            'duration_months': subject['duration_months'],
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'payment_status': 'completed',
-            'order_id': verification_data.order_id,
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db.subscriptions.insert_one(subscription_doc)
-        
         return {'status': 'success', 'message': 'Payment verified and subscription created'}
         
     except razorpay.errors.SignatureVerificationError:
@@ -588,21 +929,37 @@ async def get_admin_user(credentials: HTTPAuthorizationCredentials = Depends(sec
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Concurrency limits for heavy admin route classes (see admission.py)
+admission_gates = gates_from_env(os.environ)
+
+def admitted(route_class: str):
+    """Dependency holding a ``route_class`` admission slot for the request, taken after admin auth"""
+    async def dependency(admin: dict = Depends(get_admin_user)):
+        async with admission_gates[route_class].slot():
+            yield
+    return dependency
+
 class AdminLoginRequest(BaseModel):
     email: str
     password: str
 
 @api_router.post("/admin/login")
-async def admin_login(credentials: AdminLoginRequest):
+async def admin_login(credentials: AdminLoginRequest, request: Request):
     """Admin login"""
-    admin = await get_or_create_admin()
+    ip = client_ip(request)
+    await admin_login_limiter.check(ip)
+    await admin_login_limiter.check_account(ip, credentials.email)
     
-    if credentials.email != admin['email']:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    admin = await get_or_create_admin()
     
-    if not verify_password(credentials.password, admin['password']):
+    if credentials.email != admin['email'] or not verify_password(credentials.password, admin['password']):
+        await admin_login_limiter.record_failure(ip, credentials.email)
+        audit_log.record('admin.login_failed', credentials.email)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    await admin_login_limiter.record_success(ip, credentials.email)
+    audit_log.record('admin.login', credentials.email)
+    await rehash_if_needed(db.admins, {'email': admin['email']}, credentials.password, admin['password'], 'admin')
     token_payload = {
         'email': credentials.email,
         'role': 'admin',
@@ -628,6 +985,7 @@ async def change_admin_password(
         raise HTTPException(status_code=404, detail="Admin not found")
     
     if not verify_password(data.current_password, admin_record['password']):
+        audit_log.record('admin.password_change_failed', admin['email'])
         raise HTTPException(status_code=401, detail="Current password is incorrect")
     
     if len(data.new_password) < 6:
@@ -638,6 +996,7 @@ async def change_admin_password(
         {'id': admin_record['id']},
         {'$set': {'password': new_password_hash}}
     )
+    audit_log.record('admin.password_changed', admin['email'])
     
     return {'message': 'Password changed successfully'}
 
@@ -653,14 +1012,14 @@ class BoardUpdate(BaseModel):
     full_name: str
     description: str = ""
 
-@api_router.get("/admin/boards")
+@api_router.get("/admin/boards", dependencies=[Depends(admitted('admin'))])
 async def get_all_boards(admin: dict = Depends(get_admin_user)):
     """Get all boards with subject count"""
-    boards = await db.boards.find({}, {'_id': 0}).to_list(1000)
+    boards = await admin_db.boards.find({}, {'_id': 0}).to_list(1000)
     
     # Add subject count for each board
     for board in boards:
-        subject_count = await db.subjects.count_documents({'board': board['name']})
+        subject_count = await admin_db.subjects.count_documents({'board': board['name']})
         board['subject_count'] = subject_count
     
     return boards
@@ -671,11 +1030,6 @@ async def create_board(
     admin: dict = Depends(get_admin_user)
 ):
     """Create new board"""
-    # Check if board already exists
-    existing = await db.boards.find_one({'name': board_data.name.upper()})
-    if existing:
-        raise HTTPException(status_code=400, detail=f"Board {board_data.name} already exists")
-    
     board_id = board_data.name.lower().replace(' ', '-')
     board_doc = {
         'id': board_id,
@@ -685,7 +1039,14 @@ async def create_board(
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.boards.insert_one(board_doc)
+    # The unique name index rejects existing boards (checked here while legacy duplicates block it)
+    if not unique_enforced(db.boards, 'name') and await db.boards.find_one({'name': board_doc['name']}, {'_id': 1}):
+        raise HTTPException(status_code=400, detail=f"Board {board_data.name} already exists")
+    try:
+        await db.boards.insert_one(board_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=f"Board {board_data.name} already exists")
+    audit_log.record('board.create', admin['email'], board_id, name=board_doc['name'])
     
     # Return without _id
     return {
@@ -698,7 +1059,7 @@ async def create_board(
         }
     }
 
-@api_router.put("/admin/boards/{board_id}")
+@api_router.put("/admin/boards/{board_id}", dependencies=[Depends(admitted('bulk'))])
 async def update_board(
     board_id: str,
     board_data: BoardUpdate,
@@ -720,14 +1081,25 @@ async def update_board(
         'updated_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.boards.update_one({'id': board_id}, {'$set': update_data})
+    if (
+        new_name != old_name
+        and not unique_enforced(db.boards, 'name')
+        and await db.boards.find_one({'name': new_name, 'id': {'$ne': board_id}}, {'_id': 1})
+    ):
+        raise HTTPException(status_code=400, detail=f"Board {new_name} already exists")
+    try:
+        await db.boards.update_one({'id': board_id}, {'$set': update_data})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=f"Board {new_name} already exists")
     
     # Update all subjects that use this board
     if old_name != new_name:
-        await db.subjects.update_many(
+        await admin_db.subjects.update_many(
             {'board': old_name},
             {'$set': {'board': new_name}}
         )
+        await catalog_changed('subjects')
+    audit_log.record('board.update', admin['email'], board_id, before={'name': old_name}, after=update_data)
     
     return {'message': 'Board updated successfully'}
 
@@ -747,23 +1119,30 @@ async def delete_board(board_id: str, admin: dict = Depends(get_admin_user)):
         )
     
     await db.boards.delete_one({'id': board_id})
+    audit_log.record('board.delete', admin['email'], board_id)
     return {'message': 'Board deleted successfully'}
 
 # ============= Stats & Other Admin Routes =============
 
-@api_router.get("/admin/stats")
+@api_router.get("/admin/stats", dependencies=[Depends(admitted('admin'))])
 async def get_admin_stats(admin: dict = Depends(get_admin_user)):
     """Get platform statistics"""
-    users_count = await db.users.count_documents({})
-    subjects_count = await db.subjects.count_documents({})
-    subscriptions_count = await db.subscriptions.count_documents({'payment_status': 'completed'})
-    
-    # Calculate total revenue
+    users_count = await analytics_db.users.count_documents({})
+    subjects_count = await analytics_db.subjects.count_documents({})
+    subscriptions_count = await analytics_db.subscriptions.count_documents({'payment_status': 'completed'})
+    
+    # Calculate total revenue, from the daily rollups once they are built
+    if rollup_engine.ready:
+        revenue_source, revenue_field = analytics_db.analytics_daily, '$revenue'
+        match = {}
+    else:
+        revenue_source, revenue_field = analytics_db.payments, '$amount'
+        match = {'status': {'$in': ['verified', 'captured']}}
     pipeline = [
-        {'$match': {'status': {'$in': ['verified', 'captured']}}},
-        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
+        {'$match': match},
+        {'$group': {'_id': None, 'total': {'$sum': revenue_field}}}
     ]
-    revenue_result = await db.payments.aggregate(pipeline).to_list(1)
+    revenue_result = await revenue_source.aggregate(pipeline).to_list(1)
     revenue = revenue_result[0]['total'] if revenue_result else 0
     
     return {
@@ -773,28 +1152,257 @@ async def get_admin_stats(admin: dict = Depends(get_admin_user)):
         'revenue': revenue
     }
 
-@api_router.get("/admin/users")
+def parse_date_param(value: Optional[str], default: date_type) -> date_type:
+    if not value:
+        return default
+    try:
+        return date_type.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+@api_router.get("/admin/analytics", dependencies=[Depends(admitted('admin'))])
+async def get_analytics(
+    start: Optional[str] = Query(default=None, alias='from'),
+    end: Optional[str] = Query(default=None, alias='to'),
+    group_by: str = 'day',
+    subject_id: Optional[str] = None,
+    board: Optional[str] = None,
+    city: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    """Revenue, subscriptions and signups from the daily rollups, for charts"""
+    today = datetime.now(timezone.utc).date()
+    end_day = parse_date_param(end, today)
+    start_day = parse_date_param(start, end_day - timedelta(days=29))
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    dimensions = [d.strip() for d in group_by.split(',') if d.strip()]
+    unknown = [d for d in dimensions if d not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}")
+    
+    result = await query_buckets(
+        analytics_db, start_day, end_day, dimensions,
+        {'subject_id': subject_id, 'board': board, 'city': city}
+    )
+    result['last_run'] = rollup_engine.last_run
+    return trusted(result)
+
+@api_router.get("/admin/materials/views", dependencies=[Depends(admitted('admin'))])
+async def get_material_views(
+    start: Optional[str] = Query(default=None, alias='from'),
+    end: Optional[str] = Query(default=None, alias='to'),
+    subject_id: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    admin: dict = Depends(get_admin_user)
+):
+    """Most viewed materials with session counts and time spent"""
+    today = datetime.now(timezone.utc).date()
+    end_day = parse_date_param(end, today)
+    start_day = parse_date_param(start, end_day - timedelta(days=29))
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    result = await view_report(analytics_db, start_day, end_day, subject_id, limit)
+    result['flush_interval_seconds'] = material_views.interval
+    return trusted(result)
+
+@api_router.post("/admin/analytics/refresh", dependencies=[Depends(admitted('bulk'))])
+async def refresh_analytics(
+    start: Optional[str] = Query(default=None, alias='from'),
+    end: Optional[str] = Query(default=None, alias='to'),
+    admin: dict = Depends(get_admin_user)
+):
+    """Recompute the rollups for a date range (default: today)"""
+    today = datetime.now(timezone.utc).date()
+    end_day = parse_date_param(end, today)
+    start_day = parse_date_param(start, end_day)
+    if not 0 <= (end_day - start_day).days <= 366:
+        raise HTTPException(status_code=400, detail="Refresh at most one year at a time")
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    try:
+        refreshed = await rollup_engine.refresh(days)
+    except RollupBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '5'})
+    return {'message': f'Refreshed {refreshed} days'}
+
+@api_router.get("/admin/users", dependencies=[Depends(admitted('admin'))])
 async def get_all_users(admin: dict = Depends(get_admin_user)):
     """Get all users"""
-    users = await db.users.find({}, {'_id': 0, 'password': 0}).to_list(1000)
-    return users
+    users = await analytics_db.users.find({}, PUBLIC_USER_PROJECTION).to_list(1000)
+    return trusted(users)
+
+@api_router.get("/admin/users/search", dependencies=[Depends(admitted('admin'))])
+async def search_all_users(
+    q: str = '',
+    city: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(default=25, ge=1, le=100),
+    admin: dict = Depends(get_admin_user)
+):
+    """Prefix search on name, email and phone, optionally within a city, paged by cursor"""
+    try:
+        result = await search_users(analytics_db, q, city=city, cursor=cursor, page_size=page_size)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return trusted(result)
 
-@api_router.get("/admin/subscriptions")
+@api_router.get("/admin/subscriptions", dependencies=[Depends(admitted('admin'))])
 async def get_all_subscriptions(admin: dict = Depends(get_admin_user)):
     """Get all subscriptions"""
-    subscriptions = await db.subscriptions.find({}, {'_id': 0}).to_list(1000)
-    return subscriptions
+    subscriptions = await analytics_db.subscriptions.find({}, {'_id': 0}).to_list(1000)
+    return trusted(subscriptions)
+
+class SubscriptionGrant(BaseModel):
+    users: List[str]  # emails or phone numbers
+    subject_ids: List[str]
+    duration_months: Optional[int] = Field(default=None, gt=0)  # defaults to each subject's duration
+    dry_run: bool = False
+
+@api_router.post("/admin/subscriptions/grant", dependencies=[Depends(admitted('bulk'))])
+async def grant_subscriptions(grant: SubscriptionGrant, admin: dict = Depends(get_admin_user)):
+    """Grant or extend subscriptions for many users across subjects in one bulk write"""
+    identifiers = list(dict.fromkeys(i.strip() for i in grant.users if i.strip()))
+    subject_ids = list(dict.fromkeys(s.strip() for s in grant.subject_ids if s.strip()))
+    max_pairs = int(os.environ.get('GRANT_MAX_PAIRS', '20000'))
+    if len(identifiers) * len(subject_ids) > max_pairs:
+        raise HTTPException(status_code=400, detail=f"At most {max_pairs} user-subject pairs per request")
+    
+    users = await admin_db.users.find(
+        {'$or': [{'email': {'$in': identifiers}}, {'phone': {'$in': identifiers}}]},
+        {'_id': 0, 'email': 1, 'phone': 1}
+    ).to_list(None)
+    subjects = await admin_db.subjects.find({'id': {'$in': subject_ids}}, {'_id': 0}).to_list(None)
+    
+    matched = {u['email'] for u in users} | {u['phone'] for u in users if u.get('phone')}
+    emails = list(dict.fromkeys(u['email'] for u in users))
+    subjects_by_id = {subject['id']: subject for subject in subjects}
+    
+    # Extend each entitlement from its current end while it's still running (one bulk write)
+    duration = {sid: grant.duration_months or subject['duration_months'] for sid, subject in subjects_by_id.items()}
+    source = f"grant-{uuid.uuid4().hex[:12]}"
+    extensions = await extend_entitlements(
+        admin_db.entitlements,
+        [(email, sid) for sid in subjects_by_id for email in emails],
+        days={sid: months * 30 for sid, months in duration.items()},
+        source=source,
+        fields={
+            sid: {
+                'id': f"sub-{source}",
+                'order_id': None,
+                'subject_name': subject_display_name(subject),
+                'price': 0,
+                'duration_months': duration[sid],
+                'payment_status': 'completed'
+            }
+            for sid, subject in subjects_by_id.items()
+        },
+        dry_run=grant.dry_run
+    )
+    extended = sum(1 for was_running, _ in extensions.values() if was_running)
+    granted = len(extensions) - extended
+    
+    # Grant history: one document per (user, subject), updated on every grant
+    now = datetime.now(timezone.utc)
+    operations = []
+    for (email, subject_id), (_, end_date) in extensions.items():
+        subject = subjects_by_id[subject_id]
+        duration_months = duration[subject_id]
+        operations.append(UpdateOne(
+            {'user_email': email, 'subject_id': subject['id'], 'source': 'grant'},
+            {
+                '$set': {
+                    'end_date': end_date,
+                    'duration_months': duration_months,
+                    'payment_status': 'completed',
+                    'granted_by': admin['email'],
+                    'updated_at': now.isoformat()
+                },
+                '$setOnInsert': {
+                    'id': f"sub-grant-{str(uuid.uuid4())[:8]}",
+                    'subject_name': subject_display_name(subject),
+                    'price': 0,
+                    'start_date': now.isoformat(),
+                    'created_at': now.isoformat()
+                }
+            },
+            upsert=True
+        ))
+    
+    if operations and not grant.dry_run:
+        await admin_db.subscriptions.bulk_write(operations, ordered=False)
+        await subscriptions_changed(*emails)
+        audit_log.record(
+            'subscription.grant', admin['email'], None,
+            users=emails, subject_ids=list(subjects_by_id), duration_months=grant.duration_months,
+            granted=granted, extended=extended
+        )
+        logger.info(f"{admin['email']} granted {len(operations)} subscriptions")
+    
+    return {
+        'dry_run': grant.dry_run,
+        'users_matched': len(emails),
+        'unknown_users': [i for i in identifiers if i not in matched],
+        'unknown_subjects': [s for s in subject_ids if s not in subjects_by_id],
+        'granted': granted,
+        'extended': extended,
+        'total': len(operations)
+    }
 
-@api_router.get("/admin/payments")
+@api_router.get("/admin/payments", dependencies=[Depends(admitted('admin'))])
 async def get_all_payments(admin: dict = Depends(get_admin_user)):
     """Get all payments"""
-    payments = await db.payments.find({}, {'_id': 0}).to_list(1000)
-    return payments
+    payments = await analytics_db.payments.find({}, {'_id': 0}).to_list(1000)
+    return trusted(payments)
+
+@api_router.get("/admin/rate-limits")
+async def get_rate_limit_metrics(admin: dict = Depends(get_admin_user)):
+    """Rate limiter counters for the credential endpoints"""
+    return [limiter.metrics() for limiter in (login_limiter, register_limiter, admin_login_limiter)]
+
+@api_router.get("/admin/admission")
+async def get_admission_state(admin: dict = Depends(get_admin_user)):
+    """Limits, in-flight and queued requests per admission route class"""
+    return {route_class: gate.snapshot() for route_class, gate in admission_gates.items()}
+
+@api_router.get("/admin/diagnostics")
+async def get_diagnostics(admin: dict = Depends(get_admin_user)):
+    """Event-loop lag and captured blocking calls of this worker"""
+    return {
+        'worker_pid': os.getpid(),
+        'event_loop': loop_monitor.snapshot(),
+        'blocking_calls': blocking_watchdog.snapshot() if blocking_watchdog is not None else {'enabled': False},
+    }
+
+@api_router.get("/admin/slow-queries", dependencies=[Depends(admitted('admin'))])
+async def get_slow_queries(admin: dict = Depends(get_admin_user)):
+    """Recent slow queries and the stored plans of their shapes"""
+    plans = await admin_db.slow_query_plans.find({}, {'_id': 0}).sort('first_seen', -1).to_list(200)
+    return trusted({
+        'threshold_ms': slow_query_listener.threshold_ms,
+        'recent': slow_query_listener.snapshot(),
+        'plans': plans,
+    })
 
-@api_router.post("/admin/cleanup-subjects")
+@api_router.get("/admin/audit", dependencies=[Depends(admitted('admin'))])
+async def get_audit_log(
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    admin: dict = Depends(get_admin_user)
+):
+    """Most recent audit events, optionally for one actor or action"""
+    query = {}
+    if actor:
+        query['actor'] = actor
+    if action:
+        query['action'] = action
+    events = await analytics_db.audit_log.find(query, {'_id': 0}).sort('at', -1).to_list(limit)
+    return {'events': events, 'queued': len(audit_log.queue), 'dropped': audit_log.dropped}
+
+@api_router.post("/admin/cleanup-subjects", dependencies=[Depends(admitted('bulk'))])
 async def cleanup_subjects(admin: dict = Depends(get_admin_user)):
     """Clean up subjects by removing trailing spaces from IDs and names"""
-    subjects = await db.subjects.find({}).to_list(1000)
+    subjects = await admin_db.subjects.find({}).to_list(1000)
     cleaned_count = 0
     
     for subject in subjects:
@@ -808,22 +1416,23 @@ async def cleanup_subjects(admin: dict = Depends(get_admin_user)):
         class_name = subject.get('class_name', '').strip()
         
         # Regenerate ID properly
-        new_id = f"{board.lower()}-{class_name.lower().replace(' ', '-')}-{new_name.lower()}"
+        new_id = make_subject_id(board, class_name, new_name)
         
         if old_id != new_id or old_name != new_name:
             # Update materials and subscriptions first
             if old_id != new_id:
-                await db.materials.update_many(
+                await admin_db.materials.update_many(
                     {'subject_id': old_id},
                     {'$set': {'subject_id': new_id}}
                 )
-                await db.subscriptions.update_many(
+                await admin_db.subscriptions.update_many(
                     {'subject_id': old_id},
                     {'$set': {'subject_id': new_id}}
                 )
+                await move_entitlements(admin_db.entitlements, old_id, new_id)
             
             # Update subject
-            await db.subjects.update_one(
+            await admin_db.subjects.update_one(
                 {'_id': subject['_id']},
                 {'$set': {
                     'id': new_id,
@@ -834,13 +1443,17 @@ async def cleanup_subjects(admin: dict = Depends(get_admin_user)):
             )
             cleaned_count += 1
     
+    if cleaned_count:
+        await catalog_changed('subjects', 'materials', 'subscriptions')
+        audit_log.record('subject.cleanup', admin['email'], None, count=cleaned_count)
+    
     return {'message': f'Cleaned up {cleaned_count} subjects', 'count': cleaned_count}
 
-@api_router.get("/admin/materials")
+@api_router.get("/admin/materials", dependencies=[Depends(admitted('admin'))])
 async def get_all_materials(admin: dict = Depends(get_admin_user)):
     """Get all materials"""
-    materials = await db.materials.find({}, {'_id': 0}).to_list(1000)
-    return materials
+    materials = await admin_db.materials.find({}, {'_id': 0}).to_list(1000)
+    return trusted(materials)
 
 class SubjectCreate(BaseModel):
     board: str
@@ -850,11 +1463,11 @@ class SubjectCreate(BaseModel):
     duration_months: int = 6
     is_visible: bool = True
 
-@api_router.get("/admin/subjects")
+@api_router.get("/admin/subjects", dependencies=[Depends(admitted('admin'))])
 async def get_all_subjects_admin(admin: dict = Depends(get_admin_user)):
     """Get all subjects including hidden ones (admin only)"""
-    subjects = await db.subjects.find({}, {'_id': 0}).to_list(1000)
-    return subjects
+    subjects = await admin_db.subjects.find({}, {'_id': 0}).to_list(1000)
+    return trusted(subjects)
 
 @api_router.post("/admin/subjects")
 async def create_subject(
@@ -867,7 +1480,7 @@ async def create_subject(
     class_name = subject_data.class_name.strip()
     subject_name = subject_data.subject_name.strip()
     
-    subject_id = f"{board.lower()}-{class_name.lower().replace(' ', '-')}-{subject_name.lower()}"
+    subject_id = make_subject_id(board, class_name, subject_name)
     
     subject_doc = {
         'id': subject_id,
@@ -879,7 +1492,17 @@ async def create_subject(
         'is_visible': subject_data.is_visible
     }
     
-    await db.subjects.insert_one(subject_doc)
+    if not unique_enforced(db.subjects, 'id') and await db.subjects.find_one({'id': subject_id}, {'_id': 1}):
+        raise HTTPException(status_code=400, detail=f"Subject {subject_id} already exists")
+    try:
+        await db.subjects.insert_one(subject_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=f"Subject {subject_id} already exists")
+    await catalog_changed('subjects')
+    audit_log.record(
+        'subject.create', admin['email'], subject_id,
+        after={k: v for k, v in subject_doc.items() if k != '_id'}
+    )
     
     # Return without _id
     return {
@@ -912,9 +1535,11 @@ async def toggle_subject_visibility(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Subject not found")
     
+    await catalog_changed('subjects')
+    audit_log.record('subject.visibility', admin['email'], subject_id, is_visible=is_visible)
     return {'message': f'Subject {"shown" if is_visible else "hidden"} successfully'}
 
-@api_router.delete("/admin/subjects/{subject_id}")
+@api_router.delete("/admin/subjects/{subject_id}", dependencies=[Depends(admitted('bulk'))])
 async def delete_subject(subject_id: str, admin: dict = Depends(get_admin_user)):
     """Delete subject"""
     result = await db.subjects.delete_one({'id': subject_id})
@@ -922,7 +1547,9 @@ async def delete_subject(subject_id: str, admin: dict = Depends(get_admin_user))
         raise HTTPException(status_code=404, detail="Subject not found")
     
     # Also delete associated materials
-    await db.materials.delete_many({'subject_id': subject_id})
+    await admin_db.materials.delete_many({'subject_id': subject_id})
+    await catalog_changed('subjects', 'materials')
+    audit_log.record('subject.delete', admin['email'], subject_id)
     
     return {'message': 'Subject deleted successfully'}
 
@@ -939,7 +1566,6 @@ async def create_material(
     admin: dict = Depends(get_admin_user)
 ):
     """Create new material"""
-    import uuid
     material_id = f"mat-{str(uuid.uuid4())[:8]}"
     
     material_doc = {
@@ -952,6 +1578,11 @@ async def create_material(
     }
     
     await db.materials.insert_one(material_doc)
+    await catalog_changed('materials')
+    audit_log.record(
+        'material.create', admin['email'], material_id,
+        after={k: v for k, v in material_doc.items() if k != '_id'}
+    )
     
     # Return without _id
     return {
@@ -966,6 +1597,38 @@ async def create_material(
         }
     }
 
+@api_router.post("/admin/import", dependencies=[Depends(admitted('bulk'))])
+async def import_catalog(
+    request: Request,
+    format: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    """Bulk upsert subjects and materials from a streamed CSV / JSON upload"""
+    try:
+        fmt = detect_format(request.headers.get('content-type', ''), format)
+        importer = CatalogImporter(
+            admin_db,
+            make_subject_id,
+            batch_size=int(os.environ.get('IMPORT_BATCH_SIZE', '1000')),
+            max_rows=int(os.environ.get('IMPORT_MAX_ROWS', '50000')),
+        )
+        report = await importer.run(request.stream(), fmt)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await catalog_changed('subjects', 'materials')
+    
+    logger.info(
+        f"Catalog import by {admin['email']}: {report['rows']} rows, "
+        f"{report['error_count']} errors"
+    )
+    audit_log.record(
+        'catalog.import', admin['email'], None,
+        rows=report['rows'], subjects=report['subjects'], materials=report['materials'],
+        error_count=report['error_count']
+    )
+    return report
+
 @api_router.delete("/admin/materials/{material_id}")
 async def delete_material(material_id: str, admin: dict = Depends(get_admin_user)):
     """Delete material"""
@@ -973,6 +1636,8 @@ async def delete_material(material_id: str, admin: dict = Depends(get_admin_user
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Material not found")
     
+    await catalog_changed('materials')
+    audit_log.record('material.delete', admin['email'], material_id)
     return {'message': 'Material deleted successfully'}
 
 class SubjectUpdate(BaseModel):
@@ -982,7 +1647,7 @@ class SubjectUpdate(BaseModel):
     price: str
     duration_months: int
 
-@api_router.put("/admin/subjects/{subject_id}")
+@api_router.put("/admin/subjects/{subject_id}", dependencies=[Depends(admitted('bulk'))])
 async def update_subject(
     subject_id: str,
     subject_data: SubjectUpdate,
@@ -1006,7 +1671,7 @@ async def update_subject(
         raise HTTPException(status_code=404, detail="Subject not found")
     
     # Generate new ID based on updated data
-    new_subject_id = f"{board.lower()}-{class_name.lower().replace(' ', '-')}-{subject_name.lower()}"
+    new_subject_id = make_subject_id(board, class_name, subject_name)
     
     update_data = {
         'id': new_subject_id,
@@ -1019,14 +1684,15 @@ async def update_subject(
     
     # If ID changed, update materials and subscriptions
     if subject_id != new_subject_id:
-        await db.materials.update_many(
+        await admin_db.materials.update_many(
             {'subject_id': subject_id},
             {'$set': {'subject_id': new_subject_id}}
         )
-        await db.subscriptions.update_many(
+        await admin_db.subscriptions.update_many(
             {'subject_id': subject_id},
             {'$set': {'subject_id': new_subject_id}}
         )
+        await move_entitlements(admin_db.entitlements, subject_id, new_subject_id)
     
     result = await db.subjects.update_one(
         {'id': subject_id},
@@ -1036,6 +1702,14 @@ async def update_subject(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Subject not found")
     
+    if subject_id != new_subject_id:
+        await catalog_changed('subjects', 'materials', 'subscriptions')
+    else:
+        await catalog_changed('subjects')
+    audit_log.record(
+        'subject.update', admin['email'], subject_id,
+        before={field: subject.get(field) for field in update_data}, after=update_data
+    )
     return {'message': 'Subject updated successfully'}
 
 class MaterialUpdate(BaseModel):
@@ -1068,6 +1742,8 @@ async def update_material(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Material not found")
     
+    await catalog_changed('materials')
+    audit_log.record('material.update', admin['email'], material_id, after=update_data)
     return {'message': 'Material updated successfully'}
 
 # ============= Updates/Announcements =============
@@ -1087,19 +1763,30 @@ class UpdateEdit(BaseModel):
     is_pinned: bool = False
 
 @api_router.get("/updates")
-async def get_updates():
+async def get_updates(request: Request):
     """Get all active updates for users (public endpoint)"""
-    updates = await db.updates.find(
-        {'is_active': True},
-        {'_id': 0}
-    ).sort('created_at', -1).limit(20).to_list(20)
-    return updates
-
-@api_router.get("/admin/updates")
+    stamp = await version_stamps.get('updates')
+    etag = make_etag('updates', stamp)
+    unchanged = not_modified(request, 'updates', etag, CATALOG_CACHE_CONTROL)
+    if unchanged is not None:
+        return unchanged
+    
+    async def load():
+        async with version_stamps.reading('updates') as session:
+            return await catalog_db.updates.find(
+                {'is_active': True},
+                {'_id': 0},
+                session=session
+            ).sort('created_at', -1).limit(20).to_list(20)
+    
+    body = await catalog_cache.get_or_load(f'updates:{stamp}', load)
+    return body.response(request.headers.get('Accept-Encoding', ''), validator_headers(etag, CATALOG_CACHE_CONTROL))
+
+@api_router.get("/admin/updates", dependencies=[Depends(admitted('admin'))])
 async def get_all_updates(admin: dict = Depends(get_admin_user)):
     """Get all updates for admin"""
-    updates = await db.updates.find({}, {'_id': 0}).sort('created_at', -1).to_list(100)
-    return updates
+    updates = await admin_db.updates.find({}, {'_id': 0}).sort('created_at', -1).to_list(100)
+    return trusted(updates)
 
 @api_router.post("/admin/updates")
 async def create_update(
@@ -1107,7 +1794,6 @@ async def create_update(
     admin: dict = Depends(get_admin_user)
 ):
     """Create new update/announcement"""
-    import uuid
     update_id = f"upd-{str(uuid.uuid4())[:8]}"
     
     update_doc = {
@@ -1122,6 +1808,8 @@ async def create_update(
     }
     
     await db.updates.insert_one(update_doc)
+    await catalog_changed('updates')
+    audit_log.record('update.create', admin['email'], update_id, title=update_doc['title'])
     
     return {
         'message': 'Update created successfully',
@@ -1160,6 +1848,8 @@ async def edit_update(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Update not found")
     
+    await catalog_changed('updates')
+    audit_log.record('update.edit', admin['email'], update_id, after=update_fields)
     return {'message': 'Update edited successfully'}
 
 @api_router.put("/admin/updates/{update_id}/toggle")
@@ -1168,15 +1858,19 @@ async def toggle_update_status(
     admin: dict = Depends(get_admin_user)
 ):
     """Toggle update active status"""
-    update = await db.updates.find_one({'id': update_id})
+    # Flip the flag server-side (a missing flag counts as active) and read it back atomically
+    update = await db.updates.find_one_and_update(
+        {'id': update_id},
+        [{'$set': {'is_active': {'$eq': [{'$ifNull': ['$is_active', True]}, False]}}}],
+        projection={'is_active': 1},
+        return_document=ReturnDocument.AFTER
+    )
     if not update:
         raise HTTPException(status_code=404, detail="Update not found")
     
-    new_status = not update.get('is_active', True)
-    await db.updates.update_one(
-        {'id': update_id},
-        {'$set': {'is_active': new_status}}
-    )
+    new_status = update['is_active']
+    await catalog_changed('updates')
+    audit_log.record('update.toggle', admin['email'], update_id, is_active=new_status)
     
     return {'message': f'Update {"activated" if new_status else "deactivated"} successfully'}
 
@@ -1190,19 +1884,153 @@ async def delete_update(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Update not found")
     
+    await catalog_changed('updates')
+    audit_log.record('update.delete', admin['email'], update_id)
     return {'message': 'Update deleted successfully'}
 
-# Include router
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# ============= Metrics =============
+
+def collect_app_metrics():
+    yield "# TYPE rate_limit_events_total counter"
+    for limiter in (login_limiter, register_limiter, admin_login_limiter):
+        for event, count in limiter.counters.items():
+            yield f'rate_limit_events_total{{limiter="{limiter.name}",event="{event}"}} {count}'
+    yield "# TYPE catalog_cache_requests_total counter"
+    yield f'catalog_cache_requests_total{{result="hit"}} {catalog_cache.hits}'
+    yield f'catalog_cache_requests_total{{result="miss"}} {catalog_cache.misses}'
+    yield "# TYPE catalog_cache_entries gauge"
+    yield f'catalog_cache_entries {catalog_cache.size()}'
+    yield "# TYPE coalesced_waiters gauge"
+    for group in (catalog_cache.flight, material_reads):
+        yield f'coalesced_waiters{{group="{group.name}"}} {sum(group.in_flight().values())}'
+
+REGISTRY.add_collector(collect_app_metrics)
+
+async def get_metrics(request: Request):
+    """Prometheus scrape endpoint"""
+    metrics_token = os.environ.get('METRICS_TOKEN', '')
+    if metrics_token and request.headers.get('Authorization', '') != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+# ============= App Lifecycle =============
+
+def invalidate_cached(change: dict):
+    """Drop cache entries for the collection a change event belongs to"""
+    catalog_cache.invalidate(change['ns']['coll'])
+
+def forget_version_stamp(change: dict):
+    """Another worker bumped a stamp: re-read it on next use"""
+    name = change.get('documentKey', {}).get('_id')
+    if name:
+        version_stamps.forget(name)
+    else:
+        version_stamps.forget()
+
+for collection in ('subjects', 'materials', 'updates', 'users'):
+    invalidation_bus.subscribe(collection, invalidate_cached)
+invalidation_bus.subscribe('versions', forget_version_stamp)
+for collection in ('materials', 'updates'):
+    invalidation_bus.subscribe(collection, lambda change: search_index.invalidate())
+
+if ROLLUP_MODE == 'changestream':
+    for collection in ('payments', 'subscriptions', 'users'):
+        invalidation_bus.subscribe(collection, rollup_engine.mark_dirty)
+
+async def ensure_unique_indexes(database):
+    """Unique indexes that let create handlers insert directly and catch DuplicateKeyError (subjects.id comes with the catalog indexes)"""
+    await ensure_unique_index(database.users, 'email')
+    await ensure_unique_index(database.boards, 'name')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker setup and teardown"""
+    if db is None:
+        connect_database()
+    if isinstance(rate_limit_backend, MongoRateLimitBackend):
+        rate_limit_backend.collection = db.rate_limits
+        await rate_limit_backend.ensure_indexes()
+    await ensure_catalog_indexes(db)
+    await ensure_unique_indexes(db)
+    # Grant history is upserted by user and subject
+    await db.subscriptions.create_index([('user_email', 1), ('subject_id', 1)])
+    # Access is decided by entitlements; derive any missing ones before serving
+    await ensure_entitlement_indexes(db)
+    await backfill_entitlements(db)
+    # Keyset pages walk materials of a subject in id order
+    await db.materials.create_index([('subject_id', 1), ('id', 1)])
+    await ensure_rollup_indexes(db)
+    await ensure_user_search_indexes(db)
+    audit_log.collection = db.audit_log
+    await audit_log.ensure_indexes()
+    audit_log.start()
+    material_views.collection = db.material_views_daily
+    material_views.materials = catalog_db.materials
+    await material_views.ensure_indexes()
+    material_views.start()
+    loop_monitor.start()
+    if blocking_watchdog is not None:
+        blocking_watchdog.start()
+    search_backfill = asyncio.create_task(backfill_search_keys(db), name='user-search-backfill')
+    password_costs = asyncio.create_task(
+        report_cost_distribution(db, float(os.environ.get('PASSWORD_COST_STATS_INTERVAL', '600'))),
+        name='password-cost-stats'
+    )
+    version_stamps.db = catalog_db
+    # Rollups are bulk aggregations; keep them on the admin pool
+    rollup_engine.db = admin_db
+    if ROLLUP_MODE != 'off':
+        rollup_engine.start()
+    if os.environ.get('INVALIDATION_BUS', 'changestream') == 'changestream':
+        invalidation_bus.start(db)
+    
+    try:
+        yield
+    finally:
+        search_backfill.cancel()
+        password_costs.cancel()
+        await loop_monitor.stop()
+        if blocking_watchdog is not None:
+            await blocking_watchdog.stop()
+        await invalidation_bus.stop()
+        await rollup_engine.stop()
+        # Last, so events from requests finishing during shutdown are still written
+        await material_views.stop()
+        await audit_log.stop()
+        if client is not None:
+            client.close()
+        if admin_client is not None:
+            admin_client.close()
+
+def create_app() -> FastAPI:
+    """Build the ASGI app (``uvicorn server:create_app --factory``)"""
+    app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+    app.add_api_route("/metrics", get_metrics, methods=["GET"], include_in_schema=False)
+    app.include_router(api_router)
+    
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    )
+    
+    # Inside CORS, so browsers can read the 503s it sends
+    app.add_middleware(
+        OverloadMiddleware,
+        monitor=loop_monitor,
+        low_priority=low_priority_from_env(os.environ),
+        retry_after=int(os.environ.get('OVERLOAD_RETRY_AFTER', '5')),
+    )
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    app.add_middleware(QueryContextMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app = create_app()
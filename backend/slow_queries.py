@@ -0,0 +1,232 @@
+"""Slow-query log for MongoDB commands.
+
+``SlowQueryListener`` is a pymongo command listener. Any command slower than
+``SLOW_QUERY_MS`` is logged with its collection, the *shape* of its filter
+(literal values replaced by ``?``) and the API route that issued it. With
+``SLOW_QUERY_EXPLAIN`` enabled, the first occurrence of every new shape is
+also explained (``queryPlanner`` verbosity) on a background thread and the
+plan summary stored in the ``slow_query_plans`` collection, so a collection
+scan such as a missing ``subscriptions.user_email`` index shows up at once.
+
+Motor runs driver calls on executor threads with the caller's context copied,
+so the route is read from a context variable set by
+``QueryContextMiddleware``.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import MongoClient, monitoring
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+current_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('current_scope', default=None)
+
+SLOW_QUERIES = REGISTRY.counter(
+    'mongodb_slow_queries_total', 'MongoDB commands over the slow-query threshold.', ('collection', 'command'))
+
+# Where each command keeps its filter
+FILTER_FIELDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+}
+EXPLAINABLE = ('find', 'aggregate', 'count', 'distinct', 'findAndModify')
+# Driver-internal fields that must not be sent back inside an explain
+INTERNAL_FIELDS = ('lsid', '$db', '$clusterTime', 'txnNumber', '$readPreference', 'readConcern', 'writeConcern')
+
+
+def current_route() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return ''
+    route = scope.get('route')
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}".strip()
+
+
+class QueryContextMiddleware:
+    """Make the current request scope visible to driver-thread listeners."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+def redact(value: Any) -> Any:
+    """Replace literal values with ``?``, keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: redact(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(v, dict) for v in value):
+        return [redact(v) for v in value]
+    return '?'
+
+
+def command_shape(command_name: str, command: dict) -> dict:
+    """Redacted filter / pipeline / sort of a command."""
+    shape: Dict[str, Any] = {}
+    if command_name in FILTER_FIELDS:
+        shape['filter'] = redact(command.get(FILTER_FIELDS[command_name]) or {})
+    elif command_name == 'aggregate':
+        shape['pipeline'] = [
+            {stage: redact(body) if stage == '$match' else '...' for stage, body in step.items()}
+            for step in command.get('pipeline', [])
+        ]
+    elif command_name in ('update', 'delete'):
+        statements = command.get('updates' if command_name == 'update' else 'deletes') or [{}]
+        shape['filter'] = redact(statements[0].get('q') or {})
+    if command.get('sort'):
+        shape['sort'] = list(command['sort'])
+    return shape
+
+
+def summarize_plan(explain: dict) -> dict:
+    """Winning-plan stages (outermost first) and whether it scans the collection."""
+    planner = explain.get('queryPlanner', {})
+    plan = planner.get('winningPlan', {})
+    plan = plan.get('queryPlan', plan)  # SBE plans nest the classic plan
+    stages: List[str] = []
+    indexes: List[str] = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if node.get('stage'):
+            stages.append(node['stage'])
+        if node.get('indexName'):
+            indexes.append(node['indexName'])
+        if 'inputStage' in node:
+            stack.append(node['inputStage'])
+        stack.extend(node.get('inputStages', []))
+    return {'stages': stages, 'indexes': indexes, 'collscan': 'COLLSCAN' in stages}
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(
+        self,
+        threshold_ms: float = 100,
+        explain: bool = False,
+        explain_client_factory: Optional[Callable[[], Any]] = None,
+        db_name: Optional[str] = None,
+        max_recent: int = 200,
+        max_shapes: int = 10_000,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_enabled = explain and explain_client_factory is not None
+        self.explain_client_factory = explain_client_factory
+        self.db_name = db_name
+        self.max_shapes = max_shapes
+        self.recent: deque = deque(maxlen=max_recent)
+        self._pending: Dict[Tuple[int, int], Tuple[str, dict, str]] = {}
+        self._explained = set()
+        self._explain_lock = threading.Lock()
+        self._explain_client = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain') if self.explain_enabled else None
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            return
+        self._pending[(event.request_id, event.operation_id)] = (collection, event.command, current_route())
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop((event.request_id, event.operation_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+        collection, command, route = pending
+        shape = command_shape(event.command_name, command)
+        shape_json = json.dumps(shape, sort_keys=True, default=str)
+        shape_hash = hashlib.sha1(f"{collection}.{event.command_name}:{shape_json}".encode()).hexdigest()[:16]
+
+        SLOW_QUERIES.inc(collection, event.command_name)
+        self.recent.append({
+            'at': datetime.now(timezone.utc).isoformat(),
+            'collection': collection,
+            'command': event.command_name,
+            'shape': shape,
+            'shape_hash': shape_hash,
+            'duration_ms': round(duration_ms, 2),
+            'route': route,
+        })
+        logger.warning(
+            f"Slow query {duration_ms:.1f}ms {collection}.{event.command_name} "
+            f"shape={shape_json} route={route or '-'}"
+        )
+
+        if self.explain_enabled and event.command_name in EXPLAINABLE:
+            with self._explain_lock:
+                if shape_hash in self._explained or len(self._explained) >= self.max_shapes:
+                    return
+                self._explained.add(shape_hash)
+            self._executor.submit(
+                self._explain, collection, event.command_name, command, shape, shape_hash, duration_ms, route
+            )
+
+    def _explain(self, collection, command_name, command, shape, shape_hash, duration_ms, route):
+        try:
+            if self._explain_client is None:
+                self._explain_client = self.explain_client_factory()
+            db = self._explain_client[self.db_name]
+            explained = {k: v for k, v in command.items() if k not in INTERNAL_FIELDS}
+            result = db.command('explain', explained, verbosity='queryPlanner')
+            plan = summarize_plan(result)
+            db.slow_query_plans.update_one(
+                {'shape_hash': shape_hash},
+                {'$setOnInsert': {
+                    'shape_hash': shape_hash,
+                    'collection': collection,
+                    'command': command_name,
+                    'shape': shape,
+                    'route': route,
+                    'duration_ms': round(duration_ms, 2),
+                    'plan': plan,
+                    'first_seen': datetime.now(timezone.utc).isoformat(),
+                }},
+                upsert=True,
+            )
+            if plan['collscan']:
+                logger.warning(f"Slow query shape {shape_hash} on {collection} uses a COLLSCAN: {shape}")
+        except Exception as e:
+            logger.error(f"Explain failed for {collection}.{command_name}: {str(e)}")
+
+    def snapshot(self) -> List[dict]:
+        return list(self.recent)
+
+
+def listener_from_env(mongo_url: str, db_name: str, environ) -> SlowQueryListener:
+    explain = environ.get('SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'
+
+    def explain_client():
+        # Separate synchronous client without listeners, so explains are not re-logged
+        return MongoClient(mongo_url, maxPoolSize=1)
+
+    return SlowQueryListener(
+        threshold_ms=float(environ.get('SLOW_QUERY_MS', '100')),
+        explain=explain,
+        explain_client_factory=explain_client,
+        db_name=db_name,
+    )
@@ -0,0 +1,195 @@
+"""Indexed prefix search over users for the admin panel.
+
+A ``$text`` index only matches whole words, and a collated index can't serve
+a regex. Instead every user document carries normalized search keys under
+``search``:
+
+* ``search.name`` — the lowercased full name plus each of its words;
+* ``search.email`` — the lowercased email;
+* ``search.phone`` — the phone number's digits, both with and without the
+  country code;
+* ``search.city`` — the lowercased city.
+
+An anchored, case-sensitive regex on these fields (``^pri``) becomes a bounded
+index range scan.
+
+With a search term, up to ``max_count`` matching users are read straight off
+the index range (a bounded candidate set) and ranked: exact matches first,
+then matches at the start of the full name, email or phone, then matches at
+the start of a later word, ties by name and email. Pages walk that ranked list
+with a keyset cursor on ``(rank, name, email)``, so page 2 continues the
+ranking rather than restarting it. Without a term there is nothing to rank:
+pages follow ``email`` (unique and indexed) with a keyset cursor, as in
+``pagination``, so browsing reaches every user.
+"""
+import json
+import re
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# What admins see of a user
+PUBLIC_USER_PROJECTION = {'_id': 0, 'password': 0, 'search': 0, 'subscriptions_stamp': 0}
+# Enough to rank a candidate
+RANK_PROJECTION = {'_id': 0, 'email': 1, 'name': 1, 'search': 1}
+NATIONAL_DIGITS = 10
+PHONE_LIKE = re.compile(r'[\d\s+()-]+')
+
+
+def normalize(value: Optional[str]) -> str:
+    return ' '.join((value or '').lower().split())
+
+
+def phone_digits(phone: Optional[str]) -> List[str]:
+    digits = re.sub(r'\D', '', phone or '')
+    if not digits:
+        return []
+    keys = [digits]
+    if len(digits) > NATIONAL_DIGITS:
+        keys.append(digits[-NATIONAL_DIGITS:])
+    return keys
+
+
+def search_keys(user: dict) -> Dict[str, object]:
+    """The ``search`` subdocument for a user."""
+    name = normalize(user.get('name'))
+    words = name.split()
+    return {
+        'name': list(dict.fromkeys([name] + words)) if name else [],
+        'email': (user.get('email') or '').strip().lower(),
+        'phone': phone_digits(user.get('phone')),
+        'city': normalize(user.get('city')),
+    }
+
+
+def build_query(term: str, city: Optional[str] = None) -> dict:
+    """Mongo filter for a prefix search, routed to the matching index."""
+    term = normalize(term)
+    clauses = []
+    if term:
+        prefix = {'$regex': f"^{re.escape(term)}"}
+        digits = re.sub(r'\D', '', term)
+        if '@' in term:
+            clauses = [{'search.email': prefix}]
+        elif digits and PHONE_LIKE.fullmatch(term):
+            clauses = [{'search.phone': {'$regex': f"^{digits}"}}]
+        else:
+            clauses = [{'search.name': prefix}, {'search.email': prefix}]
+    query: dict = {}
+    if len(clauses) == 1:
+        query.update(clauses[0])
+    elif clauses:
+        query['$or'] = clauses
+    if city:
+        query['search.city'] = normalize(city)
+    return query
+
+
+def rank(user: dict, term: str) -> int:
+    """0 = exact, 1 = starts the full name / email / phone, 2 = starts a later word."""
+    term = normalize(term)
+    if not term:
+        return 0
+    keys = user.get('search') or search_keys(user)
+    full_name = keys['name'][0] if keys['name'] else ''
+    digits = re.sub(r'\D', '', term)
+    if term in (full_name, keys['email']) or (digits and digits in keys['phone']):
+        return 0
+    if full_name.startswith(term) or keys['email'].startswith(term) or (
+            digits and any(p.startswith(digits) for p in keys['phone'])):
+        return 1
+    return 2
+
+
+def rank_key(user: dict, term: str) -> list:
+    """Position of ``user`` in the ranked results; also the keyset cursor."""
+    return [rank(user, term), normalize(user.get('name')), user.get('email', '')]
+
+
+def decode_rank_cursor(cursor: str) -> list:
+    try:
+        key = json.loads(decode_cursor(cursor))
+    except ValueError:
+        raise InvalidCursor('Invalid cursor')
+    if not (isinstance(key, list) and len(key) == 3 and isinstance(key[0], int)
+            and all(isinstance(part, str) for part in key[1:])):
+        raise InvalidCursor('Invalid cursor')
+    return key
+
+
+async def search_users(db, term: str, city: Optional[str] = None, cursor: Optional[str] = None,
+                       page_size: int = 25, max_count: int = 1000) -> dict:
+    """One page of matching users after ``cursor``; raises ``InvalidCursor`` for a bad one."""
+    if not normalize(term):
+        return await browse_users(db, city, cursor, page_size, max_count)
+    query = build_query(term, city)
+    # Read in index order without a sort, so a one-letter prefix stays a bounded range scan
+    candidates = await db.users.find(query, RANK_PROJECTION).limit(max_count).to_list(max_count)
+    ranked = sorted(rank_key(user, term) for user in candidates)
+    if cursor:
+        after = decode_rank_cursor(cursor)
+        ranked = [key for key in ranked if key > after]
+    has_more = len(ranked) > page_size
+    page = ranked[:page_size]
+    emails = [key[2] for key in page]
+    users = await db.users.find({'email': {'$in': emails}}, PUBLIC_USER_PROJECTION).to_list(len(emails))
+    position = {email: i for i, email in enumerate(emails)}
+    users.sort(key=lambda u: position[u['email']])
+    return {
+        'results': users,
+        'next_cursor': encode_cursor(json.dumps(page[-1])) if has_more else None,
+        'page_size': page_size,
+        'total': len(candidates),
+        'total_is_estimate': len(candidates) >= max_count,
+        'has_more': has_more,
+    }
+
+
+async def browse_users(db, city: Optional[str] = None, cursor: Optional[str] = None,
+                       page_size: int = 25, max_count: int = 1000) -> dict:
+    """Every user (optionally of one city) in email order, a page after ``cursor``."""
+    query = build_query('', city)
+    page_query = {**query, 'email': {'$gt': decode_cursor(cursor)}} if cursor else query
+    # One extra document tells whether another page follows
+    users = await db.users.find(page_query, PUBLIC_USER_PROJECTION).sort('email', 1).limit(
+        page_size + 1).to_list(page_size + 1)
+    has_more = len(users) > page_size
+    users = users[:page_size]
+    # Counting stops at max_count so browsing a large user base stays cheap
+    total = await db.users.count_documents(query, limit=max_count)
+    return {
+        'results': users,
+        'next_cursor': encode_cursor(users[-1]['email']) if has_more else None,
+        'page_size': page_size,
+        'total': total,
+        'total_is_estimate': total >= max_count,
+        'has_more': has_more,
+    }
+
+
+async def backfill_search_keys(db, batch_size: int = 1000) -> int:
+    """Add ``search`` keys to users created before search existed."""
+    updated = 0
+    batch = []
+    fields = {'_id': 1, 'email': 1, 'name': 1, 'phone': 1, 'city': 1}
+    async for user in db.users.find({'search': {'$exists': False}}, fields):
+        batch.append(UpdateOne({'_id': user['_id']}, {'$set': {'search': search_keys(user)}}))
+        if len(batch) >= batch_size:
+            await db.users.bulk_write(batch, ordered=False)
+            updated += len(batch)
+            batch = []
+    if batch:
+        await db.users.bulk_write(batch, ordered=False)
+        updated += len(batch)
+    return updated
+
+
+async def ensure_indexes(db):
+    await db.users.create_index([('search.name', 1), ('search.city', 1)])
+    await db.users.create_index([('search.email', 1), ('search.city', 1)])
+    await db.users.create_index([('search.phone', 1), ('search.city', 1)])
+    await db.users.create_index([('search.city', 1), ('search.name', 1)])
+    # Browsing walks users in email order (the unique email index covers the unfiltered case)
+    await db.users.create_index([('search.city', 1), ('email', 1)])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Per-request CPU cost of response-model validation vs. the trusted fast path.
+
+Mounts two otherwise identical list routes in-process and drives them through
+an ASGI transport:
+
+* ``/validated`` declares ``response_model=List[Subject]`` and returns raw
+  dicts, like the endpoints did before (validation + jsonable_encoder + json).
+* ``/trusted`` returns ``trusted(...)`` (orjson, no re-validation).
+
+Usage:
+    python benchmarks/bench_serialization.py [--docs 100] [--requests 500]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'neuron_bench')
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from fast_json import FastJSONResponse, trusted  # noqa: E402
+from server import Subject  # noqa: E402
+
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def make_docs(count: int) -> List[dict]:
+    return [
+        {
+            'id': f"cbse-class-10-subject-{i}",
+            'board': 'CBSE',
+            'class_name': 'Class 10',
+            'subject_name': f"Subject {i}",
+            'price': 500 + i,
+            'duration_months': 6,
+        }
+        for i in range(count)
+    ]
+
+
+def build_app(docs: List[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/validated', response_model=List[Subject], response_class=JSONResponse)
+    async def validated():
+        return docs
+
+    @app.get('/trusted', response_model=List[Subject])
+    async def trusted_route():
+        return trusted(docs)
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int) -> float:
+    for _ in range(20):  # warm up
+        await client.get(path)
+    start = time.process_time()
+    for _ in range(requests):
+        response = await client.get(path)
+        assert response.status_code == 200
+    return (time.process_time() - start) / requests * 1e6
+
+
+async def main(docs: int, requests: int):
+    app = build_app(make_docs(docs))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        a = await client.get('/validated')
+        b = await client.get('/trusted')
+        assert a.json() == b.json(), 'fast path must produce identical output'
+
+        validated = await measure(client, '/validated', requests)
+        fast = await measure(client, '/trusted', requests)
+
+    print(f"encoder: {FastJSONResponse.__name__}, {docs} docs/response, {requests} requests")
+    print(f"  response_model validation : {validated:9.1f} us CPU/request")
+    print(f"  trusted fast path         : {fast:9.1f} us CPU/request")
+    print(f"  saved                     : {validated - fast:9.1f} us ({(1 - fast / validated) * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.docs, args.requests))
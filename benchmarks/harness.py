@@ -0,0 +1,247 @@
+"""Run the FastAPI app fully in process, without Mongo or Razorpay.
+
+* ``mongomock-motor`` stands in for MongoDB,
+* ``FakeRazorpayClient`` stands in for the Razorpay SDK (orders are created
+  locally; signatures are real HMACs so verification costs the same), and
+* requests go through ``httpx.ASGITransport`` straight into ``server.app``.
+
+Used by the load scenarios in ``benchmarks/load.py`` and by the tests.
+"""
+import hashlib
+import hmac
+import itertools
+import os
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'neuron_bench')
+os.environ.setdefault('RAZORPAY_KEY_SECRET', 'bench_secret')
+os.environ.setdefault('RAZORPAY_WEBHOOK_SECRET', 'bench_webhook_secret')
+# The harness spreads virtual users over many client IPs
+os.environ.setdefault('RATE_LIMIT_TRUST_FORWARDED', 'true')
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+import razorpay  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+import server  # noqa: E402
+from database import ensure_unique_index  # noqa: E402
+from entitlements import backfill as backfill_entitlements, ensure_indexes as ensure_entitlement_indexes  # noqa: E402
+
+RAZORPAY_SECRET = os.environ['RAZORPAY_KEY_SECRET']
+WEBHOOK_SECRET = os.environ['RAZORPAY_WEBHOOK_SECRET']
+DEFAULT_PASSWORD = 'bench-password'
+
+
+class _FakeOrders:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def create(self, data: dict) -> dict:
+        return {'id': f"order_bench{next(self._ids):08d}", 'amount': data['amount'], 'currency': data['currency']}
+
+
+class _FakeUtility:
+    def verify_payment_signature(self, params: dict) -> bool:
+        expected = sign_payment(params['razorpay_order_id'], params['razorpay_payment_id'])
+        if not hmac.compare_digest(expected, params['razorpay_signature']):
+            raise razorpay.errors.SignatureVerificationError('Razorpay Signature Verification Failed')
+        return True
+
+
+class FakeRazorpayClient:
+    """Offline replacement for ``razorpay.Client``."""
+
+    def __init__(self):
+        self.order = _FakeOrders()
+        self.utility = _FakeUtility()
+
+
+def sign_payment(order_id: str, payment_id: str) -> str:
+    return hmac.new(RAZORPAY_SECRET.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def sign_webhook(body: bytes) -> str:
+    return hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+@dataclass
+class Dataset:
+    users: List[dict] = field(default_factory=list)
+    subjects: List[dict] = field(default_factory=list)
+    tokens: List[str] = field(default_factory=list)
+    admin_token: str = ''
+
+
+def install_fakes():
+    """Point ``server`` at a fresh in-memory database and the fake Razorpay client."""
+    server.db = AsyncMongoMockClient()[os.environ['DB_NAME']]
+    # No replica set here: every route class reads the same in-memory database
+    server.catalog_db = server.analytics_db = server.admin_db = server.db
+    server.razorpay_client = FakeRazorpayClient()
+    server.version_stamps.db = server.db
+    server.version_stamps.forget()
+    server.rollup_engine.db = server.db
+    server.audit_log.collection = server.db.audit_log
+    server.audit_log.queue.clear()
+    server.material_views.collection = server.db.material_views_daily
+    server.material_views.materials = server.db.materials
+    server.material_views.pending.clear()
+    server.viewer_subjects.forget()
+    server.rollup_engine.ready = False
+    server.catalog_cache.invalidate()
+    server.search_index.invalidate()
+    return server.db
+
+
+async def seed(db, users: int = 200, subjects: int = 30, materials_per_subject: int = 20,
+               subscriptions_per_user: int = 3, updates: int = 30) -> Dataset:
+    """Fill the stand-in database with a realistic catalog and user base."""
+    now = datetime.now(timezone.utc)
+    # One bcrypt hash shared by every user keeps seeding fast; verify cost is unchanged
+    password_hash = server.hash_password(DEFAULT_PASSWORD)
+    data = Dataset()
+
+    boards = ['CBSE', 'ICSE', 'STATE']
+    for i in range(subjects):
+        board = boards[i % len(boards)]
+        data.subjects.append({
+            'id': f"{board.lower()}-class-10-subject{i}",
+            'board': board,
+            'class_name': 'Class 10',
+            'subject_name': f"Subject{i}",
+            'price': 500 + 10 * i,
+            'duration_months': 6,
+            'is_visible': True,
+        })
+    await db.subjects.insert_many([dict(s) for s in data.subjects])
+    await db.boards.insert_many([
+        {'id': b.lower(), 'name': b, 'full_name': b, 'description': ''} for b in boards
+    ])
+
+    await db.materials.insert_many([
+        {
+            'id': f"mat-{i}-{j}",
+            'subject_id': subject['id'],
+            'title': f"Chapter {j} notes",
+            'type': 'pdf' if j % 3 else 'video',
+            'link': f"https://drive.google.com/file/d/{i}x{j}/preview",
+            'description': 'Comprehensive notes covering all main concepts ' * 3,
+        }
+        for i, subject in enumerate(data.subjects)
+        for j in range(materials_per_subject)
+    ])
+
+    user_docs, subscription_docs, payment_docs = [], [], []
+    for i in range(users):
+        email = f"student{i}@bench.test"
+        user_docs.append({
+            'email': email,
+            'password': password_hash,
+            'name': f"Student {i}",
+            'phone': f"+91 90000{i:05d}",
+            'city': ['Mumbai', 'Delhi', 'Pune', 'Kolkata'][i % 4],
+            'created_at': (now - timedelta(days=i % 90)).isoformat(),
+        })
+        user_docs[-1]['search'] = server.search_keys(user_docs[-1])
+        for k in range(subscriptions_per_user):
+            subject = data.subjects[(i + k) % len(data.subjects)]
+            order_id = f"order_seed{i}x{k}"
+            subscription_docs.append({
+                'id': f"sub-{order_id}",
+                'user_email': email,
+                'subject_id': subject['id'],
+                'subject_name': f"{subject['board']} - {subject['class_name']} - {subject['subject_name']}",
+                'price': subject['price'],
+                'duration_months': 6,
+                'start_date': now.isoformat(),
+                'end_date': (now + timedelta(days=180)).isoformat(),
+                'payment_status': 'completed',
+                'order_id': order_id,
+                'created_at': now.isoformat(),
+            })
+            payment_docs.append({
+                'order_id': order_id,
+                'user_email': email,
+                'subject_id': subject['id'],
+                'amount': subject['price'],
+                'currency': 'INR',
+                'status': 'verified',
+                'created_at': now.isoformat(),
+            })
+        data.users.append(user_docs[-1])
+        data.tokens.append(server.create_jwt_token(email))
+    await db.users.insert_many(user_docs)
+    if subscription_docs:
+        await db.subscriptions.insert_many(subscription_docs)
+        await db.payments.insert_many(payment_docs)
+
+    await db.updates.insert_many([
+        {
+            'id': f"upd-{i}",
+            'title': f"Announcement {i}",
+            'description': 'Exam schedule and revision tips for this week.',
+            'type': 'announcement',
+            'link': '',
+            'is_pinned': i == 0,
+            'is_active': True,
+            'created_at': (now - timedelta(hours=i)).isoformat(),
+        }
+        for i in range(updates)
+    ])
+
+    # Same unique indexes as production, so create handlers see duplicate keys
+    await server.ensure_unique_indexes(db)
+    await ensure_unique_index(db.subjects, 'id')
+    # Access is checked against entitlements, derived from the subscriptions above
+    await ensure_entitlement_indexes(db)
+    await backfill_entitlements(db)
+
+    data.admin_token = jwt.encode(
+        {'email': server.DEFAULT_ADMIN_EMAIL, 'role': 'admin', 'exp': now + timedelta(days=1)},
+        server.JWT_SECRET, algorithm=server.JWT_ALGORITHM,
+    )
+    return data
+
+
+COMMANDS = (
+    'find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many', 'delete_one',
+    'delete_many', 'find_one_and_update', 'bulk_write', 'aggregate', 'count_documents',
+)
+
+
+@contextmanager
+def count_commands(db) -> Iterator[List[Tuple[str, str]]]:
+    """Record every ``(collection, command)`` the app sends while the block runs."""
+    calls: List[Tuple[str, str]] = []
+    collection_type = type(db['users'])
+    originals = {name: getattr(collection_type, name) for name in COMMANDS}
+
+    def counting(name, original):
+        def command(self, *args, **kwargs):
+            calls.append((self.name, name))
+            return original(self, *args, **kwargs)
+        return command
+
+    for name, original in originals.items():
+        setattr(collection_type, name, counting(name, original))
+    try:
+        yield calls
+    finally:
+        for name, original in originals.items():
+            setattr(collection_type, name, original)
+
+
+def client(**kwargs) -> httpx.AsyncClient:
+    """An HTTP client wired straight into the ASGI app."""
+    transport = httpx.ASGITransport(app=server.app)
+    return httpx.AsyncClient(transport=transport, base_url='http://neuron.test', **kwargs)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Offline load scenarios against the in-process app.
+
+Each scenario runs ``--concurrency`` virtual users for ``--iterations`` loops
+each and reports throughput and p50/p95/p99 request latency. Results can be
+saved as a baseline and later runs compared against it:
+
+    python benchmarks/load.py --save-baseline
+    python benchmarks/load.py --compare --max-regression 20
+
+Scenarios: login_storm, dashboard_bootstrap, materials_viewing,
+checkout_webhook, admin_browsing (``--scenario`` picks a subset).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import harness  # noqa: E402
+
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[int, int] = {}
+
+    async def call(self, coro: Awaitable, expected=(200,)):
+        start = time.perf_counter()
+        response = await coro
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        if response.status_code not in expected:
+            self.errors += 1
+        return response
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def auth(token: str) -> dict:
+    return {'Authorization': f"Bearer {token}"}
+
+
+def random_ip() -> str:
+    return f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+
+
+# ============= Scenarios =============
+
+async def login_storm(client, data: harness.Dataset, rec: Recorder):
+    user = random.choice(data.users)
+    await rec.call(client.post(
+        '/api/auth/login',
+        json={'identifier': user['email'], 'password': harness.DEFAULT_PASSWORD},
+        headers={'X-Forwarded-For': random_ip()},
+    ))
+
+
+async def dashboard_bootstrap(client, data: harness.Dataset, rec: Recorder):
+    headers = auth(random.choice(data.tokens))
+    await asyncio.gather(
+        rec.call(client.get('/api/auth/me', headers=headers)),
+        rec.call(client.get('/api/subjects', headers={'Accept-Encoding': 'gzip, br'})),
+        rec.call(client.get('/api/subscriptions/my', headers=headers)),
+        rec.call(client.get('/api/updates', headers={'Accept-Encoding': 'gzip, br'})),
+    )
+
+
+async def materials_viewing(client, data: harness.Dataset, rec: Recorder):
+    index = random.randrange(len(data.users))
+    headers = auth(data.tokens[index])
+    subject = data.subjects[index % len(data.subjects)]
+    await rec.call(client.get(f"/api/subscriptions/check/{subject['id']}", headers=headers))
+    await rec.call(client.get(f"/api/materials/{subject['id']}", headers=headers))
+
+
+async def checkout_webhook(client, data: harness.Dataset, rec: Recorder):
+    index = random.randrange(len(data.users))
+    headers = auth(data.tokens[index])
+    subject = random.choice(data.subjects)
+    order = await rec.call(client.post(
+        '/api/payments/create-order',
+        json={'subject_id': subject['id'], 'amount': subject['price']},
+        headers=headers,
+    ))
+    order_id = order.json()['order_id']
+    payment_id = f"pay_{order_id[6:]}"
+    if random.random() < 0.5:
+        await rec.call(client.post('/api/payments/verify', headers=headers, json={
+            'payment_id': payment_id,
+            'order_id': order_id,
+            'signature': harness.sign_payment(order_id, payment_id),
+        }))
+    else:
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': payment_id, 'order_id': order_id}}},
+        }).encode()
+        await rec.call(client.post(
+            '/api/payments/webhook', content=body,
+            headers={'X-Razorpay-Signature': harness.sign_webhook(body), 'Content-Type': 'application/json'},
+        ))
+
+
+async def admin_browsing(client, data: harness.Dataset, rec: Recorder):
+    headers = {**auth(data.admin_token), 'Accept-Encoding': 'gzip, br'}
+    path = random.choice([
+        '/api/admin/stats', '/api/admin/users', '/api/admin/subscriptions',
+        '/api/admin/payments', '/api/admin/materials', '/api/admin/subjects', '/api/admin/boards',
+    ])
+    await rec.call(client.get(path, headers=headers))
+
+
+SCENARIOS: Dict[str, Callable] = {
+    'login_storm': login_storm,
+    'dashboard_bootstrap': dashboard_bootstrap,
+    'materials_viewing': materials_viewing,
+    'checkout_webhook': checkout_webhook,
+    'admin_browsing': admin_browsing,
+}
+
+
+# ============= Runner =============
+
+async def run_scenario(name: str, data: harness.Dataset, concurrency: int, iterations: int) -> dict:
+    scenario = SCENARIOS[name]
+    rec = Recorder()
+    async with harness.client() as client:
+        async def virtual_user():
+            for _ in range(iterations):
+                await scenario(client, data, rec)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(rec.latencies)
+    return {
+        'requests': len(latencies),
+        'errors': rec.errors,
+        'statuses': {str(k): v for k, v in sorted(rec.statuses.items())},
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run(names: List[str], concurrency: int, iterations: int, users: int) -> Dict[str, dict]:
+    results = {}
+    for name in names:
+        # Fresh data per scenario so writes from one don't skew the next
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=users)
+        results[name] = await run_scenario(name, data, concurrency, iterations)
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_regression: float) -> List[str]:
+    """Return human-readable regressions beyond ``max_regression`` percent."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - max_regression / 100):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} rps")
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if previous[key] and current[key] > previous[key] * (1 + max_regression / 100):
+                regressions.append(f"{name}: {key} {previous[key]} -> {current[key]}")
+    return regressions
+
+
+def print_report(results: Dict[str, dict], baseline: Dict[str, dict]):
+    print(f"{'scenario':<22}{'reqs':>7}{'errs':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+        if name in baseline:
+            b = baseline[name]
+            print(f"{'  baseline':<22}{'':>13}{b['throughput_rps']:>10}{b['p50_ms']:>10}{b['p95_ms']:>10}{b['p99_ms']:>10}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Offline load scenarios against the in-process app.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='run only these scenarios')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help='exit non-zero on regressions vs. the baseline')
+    parser.add_argument('--max-regression', type=float, default=20.0, help='allowed regression in percent')
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.scenario or list(SCENARIOS), args.concurrency, args.iterations, args.users))
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2) + '\n')
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.compare:
+        regressions = compare(results, baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Per-call cost of the auth and hot helper functions.
+
+Run with pytest-benchmark and keep the JSON so CI can compare runs:
+
+    python -m pytest benchmarks/test_microbenchmarks.py --benchmark-autosave \\
+        --benchmark-storage=benchmarks/results
+    python -m pytest benchmarks/test_microbenchmarks.py --benchmark-storage=benchmarks/results \\
+        --benchmark-compare --benchmark-compare-fail=mean:15%
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+
+from benchmarks import harness  # noqa: E402,F401  (sets up sys.path and env)
+import entitlements  # noqa: E402
+import server  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+EMAIL = 'student@bench.test'
+
+
+class StubUsers:
+    """Just enough of a Motor collection for ``get_current_user``."""
+
+    def __init__(self, user: dict):
+        self.user = user
+
+    async def find_one(self, query, projection=None):
+        return dict(self.user) if query.get('email') == self.user['email'] else None
+
+
+class StubDB:
+    def __init__(self, user: dict):
+        self.users = StubUsers(user)
+
+
+@pytest.fixture(scope='module')
+def password_hash():
+    return server.hash_password(PASSWORD)
+
+
+@pytest.fixture(scope='module')
+def token():
+    return server.create_jwt_token(EMAIL)
+
+
+@pytest.fixture
+def stub_db(monkeypatch, password_hash):
+    user = {'email': EMAIL, 'password': password_hash, 'name': 'Student', 'phone': '+91 9000000000', 'city': 'Pune'}
+    monkeypatch.setattr(server, 'db', StubDB(user))
+
+
+def test_hash_password(benchmark):
+    benchmark.pedantic(server.hash_password, args=(PASSWORD,), rounds=5, iterations=1)
+
+
+def test_verify_password(benchmark, password_hash):
+    assert benchmark.pedantic(server.verify_password, args=(PASSWORD, password_hash), rounds=5, iterations=1)
+
+
+def test_create_jwt_token(benchmark):
+    benchmark(server.create_jwt_token, EMAIL)
+
+
+def test_decode_jwt_token(benchmark, token):
+    assert benchmark(server.decode_jwt_token, token)['email'] == EMAIL
+
+
+def test_make_subject_id(benchmark):
+    assert benchmark(server.make_subject_id, 'ICSE', 'Class 10', 'Biology') == 'icse-class-10-biology'
+
+
+def test_is_entitlement_active(benchmark):
+    entitlement = {
+        'user_email': EMAIL,
+        'subject_id': 'icse-class-10-biology',
+        'end_date': (datetime.now(timezone.utc) + timedelta(days=90)).isoformat(),
+    }
+    assert benchmark(entitlements.is_active, entitlement)
+
+
+def test_get_current_user(benchmark, stub_db, token):
+    credentials = HTTPAuthorizationCredentials(scheme='Bearer', credentials=token)
+    loop = asyncio.new_event_loop()
+    try:
+        user = benchmark(lambda: loop.run_until_complete(server.get_current_user(credentials)))
+    finally:
+        loop.close()
+    assert user['email'] == EMAIL
@@ -51,6 +51,11 @@ const getEmbedUrl = (link, type) => {
   return link;
 };
 
+// Analytics only: failures are ignored and never shown to the student
+const recordMaterialEvents = (events) => {
+  axios.post(`${API}/materials/events`, { events }).catch(() => {});
+};
+
 const MaterialViewer = () => {
   const { user } = React.useContext(AuthContext);
   const { subjectId } = useParams();
@@ -63,6 +68,21 @@ const MaterialViewer = () => {
     fetchMaterials();
   }, [subjectId]);
 
+  useEffect(() => {
+    // Count the view now and the session (with time spent) when the material is closed
+    if (!selectedMaterial) return undefined;
+    const openedAt = Date.now();
+    recordMaterialEvents([{ material_id: selectedMaterial.id, subject_id: subjectId, type: 'view' }]);
+    return () => {
+      recordMaterialEvents([{
+        material_id: selectedMaterial.id,
+        subject_id: subjectId,
+        type: 'session',
+        seconds: Math.round((Date.now() - openedAt) / 1000),
+      }]);
+    };
+  }, [selectedMaterial, subjectId]);
+
   useEffect(() => {
     // Disable right-click on the entire page when viewing materials
     const handleContextMenu = (e) => {
@@ -5,24 +5,55 @@ import { toast } from 'sonner';
 import { Card, CardContent, CardHeader, CardTitle } from '../../../components/ui/card';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '../../../components/ui/table';
 import { Input } from '../../../components/ui/input';
-import { Search, User, Mail, Phone, MapPin, Calendar } from 'lucide-react';
+import { Button } from '../../../components/ui/button';
+import { Search, User, Mail, Phone, MapPin, Calendar, ChevronLeft, ChevronRight } from 'lucide-react';
+
+const PAGE_SIZE = 25;
+const SEARCH_DELAY_MS = 300;
 
 const UsersTab = () => {
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [cityFilter, setCityFilter] = useState('');
+  const [page, setPage] = useState(1);
+  // cursors[i] fetches page i + 1; the server pages by cursor so browsing never skips or repeats users
+  const [cursors, setCursors] = useState([null]);
+  const [total, setTotal] = useState(0);
+  const [totalIsEstimate, setTotalIsEstimate] = useState(false);
+  const [hasMore, setHasMore] = useState(false);
+
+  // Search runs on the server; wait for typing to pause before querying
+  useEffect(() => {
+    const timer = setTimeout(() => fetchUsers(), SEARCH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [searchTerm, cityFilter, page]);
 
   useEffect(() => {
-    fetchUsers();
-  }, []);
+    setPage(1);
+    setCursors([null]);
+  }, [searchTerm, cityFilter]);
 
   const fetchUsers = async () => {
+    setLoading(true);
     try {
       const token = localStorage.getItem('admin_token');
-      const response = await axios.get(`${API}/admin/users`, {
-        headers: { Authorization: `Bearer ${token}` }
+      const response = await axios.get(`${API}/admin/users/search`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: {
+          q: searchTerm.trim(),
+          city: cityFilter.trim() || undefined,
+          cursor: cursors[page - 1] || undefined,
+          page_size: PAGE_SIZE
+        }
       });
-      setUsers(response.data);
+      setUsers(response.data.results);
+      setTotal(response.data.total);
+      setTotalIsEstimate(response.data.total_is_estimate);
+      setHasMore(response.data.has_more);
+      if (response.data.next_cursor) {
+        setCursors((known) => [...known.slice(0, page), response.data.next_cursor]);
+      }
     } catch (error) {
       toast.error('Failed to load users');
     } finally {
@@ -30,24 +61,32 @@ const UsersTab = () => {
     }
   };
 
-  const filteredUsers = users.filter(user =>
-    user.email?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    user.name?.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  const firstShown = (page - 1) * PAGE_SIZE + 1;
 
   return (
     <Card className="shadow-lg border border-gray-200">
       <CardHeader className="border-b bg-gray-50/50">
         <div className="flex flex-col sm:flex-row sm:items-center justify-between gap-4">
           <CardTitle className="text-xl font-semibold text-gray-800">User Management</CardTitle>
-          <div className="relative w-full sm:w-72">
-            <Search className="absolute left-3 top-2.5 h-4 w-4 text-gray-400" />
-            <Input
-              placeholder="Search by name or email..."
-              value={searchTerm}
-              onChange={(e) => setSearchTerm(e.target.value)}
-              className="pl-9 h-9"
-            />
+          <div className="flex flex-col sm:flex-row gap-2 w-full sm:w-auto">
+            <div className="relative w-full sm:w-72">
+              <Search className="absolute left-3 top-2.5 h-4 w-4 text-gray-400" />
+              <Input
+                placeholder="Search by name, email or phone..."
+                value={searchTerm}
+                onChange={(e) => setSearchTerm(e.target.value)}
+                className="pl-9 h-9"
+              />
+            </div>
+            <div className="relative w-full sm:w-44">
+              <MapPin className="absolute left-3 top-2.5 h-4 w-4 text-gray-400" />
+              <Input
+                placeholder="City"
+                value={cityFilter}
+                onChange={(e) => setCityFilter(e.target.value)}
+                className="pl-9 h-9"
+              />
+            </div>
           </div>
         </div>
       </CardHeader>
@@ -56,7 +95,7 @@ const UsersTab = () => {
           <div className="flex items-center justify-center py-12">
             <div className="animate-spin rounded-full h-8 w-8 border-t-2 border-b-2 border-purple-600"></div>
           </div>
-        ) : filteredUsers.length === 0 ? (
+        ) : users.length === 0 ? (
           <div className="text-center py-12 text-gray-500">
             <User className="w-12 h-12 mx-auto mb-3 text-gray-300" />
             <p>No users found</p>
@@ -99,8 +138,8 @@ const UsersTab = () => {
                 </TableRow>
               </TableHeader>
               <TableBody>
-                {filteredUsers.map((user, index) => (
-                  <TableRow key={index} className="hover:bg-gray-50/50">
+                {users.map((user) => (
+                  <TableRow key={user.email} className="hover:bg-gray-50/50">
                     <TableCell className="font-medium text-gray-900 py-4">{user.name || '-'}</TableCell>
                     <TableCell className="text-gray-600">{user.email}</TableCell>
                     <TableCell className="text-gray-600">{user.phone || '-'}</TableCell>
@@ -118,9 +157,19 @@ const UsersTab = () => {
             </Table>
           </div>
         )}
-        {filteredUsers.length > 0 && (
-          <div className="px-4 py-3 border-t bg-gray-50/50 text-sm text-gray-500">
-            Showing {filteredUsers.length} of {users.length} users
+        {users.length > 0 && (
+          <div className="flex items-center justify-between px-4 py-3 border-t bg-gray-50/50 text-sm text-gray-500">
+            <span>
+              Showing {firstShown}-{firstShown + users.length - 1} of {total}{totalIsEstimate ? '+' : ''} users
+            </span>
+            <div className="flex gap-2">
+              <Button variant="outline" size="sm" disabled={page === 1 || loading} onClick={() => setPage(page - 1)}>
+                <ChevronLeft className="w-4 h-4" />
+              </Button>
+              <Button variant="outline" size="sm" disabled={!hasMore || loading} onClick={() => setPage(page + 1)}>
+                <ChevronRight className="w-4 h-4" />
+              </Button>
+            </div>
           </div>
         )}
       </CardContent>
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from benchmarks import harness
+
+# Seed sizes for ``run``; a module overrides some of them with its own ``seed`` fixture
+SEED_DEFAULTS = dict(users=2, subjects=2, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+
+
+@pytest.fixture
+def seed():
+    return {}
+
+
+@pytest.fixture
+def run(seed):
+    """Run ``scenario(client, db, data)`` against a freshly seeded in-memory app.
+
+    Keyword arguments override the seed sizes for a single call.
+    """
+    def runner(scenario, **sizes):
+        async def wrapper():
+            db = harness.install_fakes()
+            data = await harness.seed(db, **{**SEED_DEFAULTS, **seed, **sizes})
+            async with harness.client() as client:
+                return await scenario(client, db, data)
+
+        return asyncio.run(wrapper())
+
+    return runner
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks import harness
+from admission import ADMISSION_REJECTIONS, AdmissionGate, gates_from_env
+
+server = harness.server
+
+
+def test_gate_queues_then_rejects():
+    async def scenario():
+        gate = AdmissionGate('unit', concurrency=1, max_queue=1, timeout=0.05)
+        order = []
+
+        async def worker(name, hold):
+            async with gate.slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(worker('first', 0.02))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(worker('second', 0))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as full:
+            await gate.acquire()
+        await asyncio.gather(first, second)
+        return order, full.value, gate.snapshot()
+
+    before = ADMISSION_REJECTIONS.value('unit', 'queue_full')
+    order, rejection, snapshot = asyncio.run(scenario())
+    assert order == ['first', 'second']
+    assert rejection.status_code == 503
+    assert rejection.headers['Retry-After'] == '1'
+    assert ADMISSION_REJECTIONS.value('unit', 'queue_full') == before + 1
+    assert snapshot['in_flight'] == 0 and snapshot['queued'] == 0
+
+
+def test_queued_request_times_out():
+    async def scenario():
+        gate = AdmissionGate('unit', concurrency=1, max_queue=4, timeout=0.01)
+        await gate.acquire()
+        with pytest.raises(HTTPException):
+            await gate.acquire()
+        gate.release()
+        await gate.acquire()  # the timed-out waiter didn't take the slot
+        return gate.snapshot()
+
+    before = ADMISSION_REJECTIONS.value('unit', 'timeout')
+    snapshot = asyncio.run(scenario())
+    assert snapshot['in_flight'] == 1 and snapshot['queued'] == 0
+    assert ADMISSION_REJECTIONS.value('unit', 'timeout') == before + 1
+
+
+def test_limits_from_env():
+    gates = gates_from_env({'ADMISSION_BULK_CONCURRENCY': '2', 'ADMISSION_ADMIN_TIMEOUT': '1.5'})
+    assert gates['bulk'].concurrency == 2
+    assert gates['admin'].timeout == 1.5
+    assert gates['admin'].concurrency == 4
+
+
+def test_busy_bulk_class_rejects_admin_work_but_not_students(monkeypatch):
+    monkeypatch.setitem(server.admission_gates, 'bulk', AdmissionGate('bulk', concurrency=1, max_queue=0, timeout=1))
+
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=2, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        async with harness.client() as client:
+            async with server.admission_gates['bulk'].slot():  # a cleanup already running
+                rejected = await client.post('/api/admin/cleanup-subjects', headers=admin)
+                anonymous = await client.post('/api/admin/cleanup-subjects')
+                student = await client.get('/api/subjects')
+                report = await client.get('/api/admin/users', headers=admin)
+            admitted = await client.post('/api/admin/cleanup-subjects', headers=admin)
+        return rejected, anonymous, student, report, admitted
+
+    rejected, anonymous, student, report, admitted = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert 'Retry-After' in rejected.headers
+    assert anonymous.status_code == 403  # authentication runs before admission
+    assert student.status_code == 200
+    assert report.status_code == 200
+    assert admitted.status_code == 200
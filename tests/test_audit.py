@@ -0,0 +1,98 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect
+
+from benchmarks import harness
+from audit import AUDIT_EVENTS, AuditLog
+
+server = harness.server
+
+
+class FakeCollection:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect('primary stepped down')
+        self.batches.append(list(documents))
+
+
+def test_full_batches_are_written_without_waiting_for_the_timer():
+    async def scenario():
+        collection = FakeCollection()
+        log = AuditLog(collection, batch_size=100, flush_interval=3600)
+        log.start()
+        for i in range(250):
+            log.record('subject.update', 'admin@x.test', f"s{i}")
+        await asyncio.sleep(0.01)
+        before_stop = [len(b) for b in collection.batches]
+        await log.stop()
+        return before_stop, [len(b) for b in collection.batches], len(log.queue)
+
+    before_stop, batches, left = asyncio.run(scenario())
+    # The first 100 woke the writer; the rest are flushed on shutdown
+    assert before_stop and before_stop[0] == 100
+    assert sum(batches) == 250
+    assert max(batches) <= 100
+    assert left == 0
+
+
+def test_partial_batches_are_written_on_the_interval():
+    async def scenario():
+        collection = FakeCollection()
+        log = AuditLog(collection, batch_size=100, flush_interval=0.02)
+        log.start()
+        log.record('auth.login', 'a@x.test')
+        await asyncio.sleep(0.1)
+        written = sum(len(b) for b in collection.batches)
+        await log.stop()
+        return written
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_queue_is_bounded_and_failed_batches_are_retried():
+    async def scenario():
+        collection = FakeCollection(failures=1)
+        log = AuditLog(collection, batch_size=10, max_queue=20)
+        dropped_before = AUDIT_EVENTS.value('dropped')
+        for i in range(25):
+            log.record('auth.login', f"u{i}@x.test")
+        first = await log.flush()
+        queued_after_failure = len(log.queue)
+        second = await log.flush()
+        return first, queued_after_failure, second, log.dropped, AUDIT_EVENTS.value('dropped') - dropped_before
+
+    first, queued, second, dropped, counted = asyncio.run(scenario())
+    assert (first, queued, second) == (0, 20, 20)
+    assert dropped == counted == 5
+
+
+def test_admin_mutations_and_logins_are_audited():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        async with harness.client() as client:
+            await client.post('/api/auth/login', json={'identifier': data.users[0]['email'], 'password': 'wrong'})
+            await client.post('/api/auth/login', json={
+                'identifier': data.users[0]['email'], 'password': harness.DEFAULT_PASSWORD})
+            await client.put(f"/api/admin/subjects/{data.subjects[0]['id']}/visibility",
+                             json={'is_visible': False}, headers=admin)
+            queued = len(server.audit_log.queue)
+            await server.audit_log.flush()
+            events = (await client.get('/api/admin/audit', headers=admin)).json()['events']
+        return data, queued, events
+
+    data, queued, events = asyncio.run(scenario())
+    assert queued == 3
+    assert [e['action'] for e in events] == ['subject.visibility', 'auth.login', 'auth.login_failed']
+    visibility = events[0]
+    assert visibility['actor'] == server.DEFAULT_ADMIN_EMAIL
+    assert visibility['target'] == data.subjects[0]['id']
+    assert visibility['details'] == {'is_visible': False}
+    assert visibility['route'].startswith('PUT /api/admin/subjects/')
+    assert visibility['ip']
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from benchmarks import harness
+from blocking import BlockingWatchdog, watchdog_from_env
+
+server = harness.server
+
+
+def hold_the_loop(seconds):
+    time.sleep(seconds)
+
+
+def test_watchdog_captures_a_stall_once():
+    async def scenario():
+        watchdog = BlockingWatchdog(threshold=0.03, interval=0.005)
+        watchdog.start()
+        await asyncio.sleep(0.02)
+        hold_the_loop(0.15)
+        await asyncio.sleep(0.02)
+        await watchdog.stop()
+        return watchdog.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot['stalls'] == 1
+    [report] = snapshot['reports']
+    assert report['count'] == 1
+    assert report['max_ms'] >= 30
+    assert any('hold_the_loop' in line for line in report['stack'])
+
+
+def test_watchdog_is_off_by_default():
+    assert watchdog_from_env({}) is None
+    assert watchdog_from_env({'BLOCKING_WATCHDOG': 'true', 'BLOCKING_THRESHOLD_MS': '50'}).threshold == 0.05
+
+
+def test_diagnostics_name_the_handler_and_request(monkeypatch):
+    watchdog = BlockingWatchdog(threshold=0.03, interval=0.005)
+    monkeypatch.setattr(server, 'blocking_watchdog', watchdog)
+    original_hash = server.password_hasher.hash
+
+    def slow_hash(password):
+        hold_the_loop(0.15)  # stands in for a costly bcrypt round
+        return original_hash(password)
+
+    monkeypatch.setattr(server.password_hasher, 'hash', slow_hash)
+
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        server.UserRegister(email='warm@example.com', password='pw', name='W', phone='1', city='Pune')  # lazy imports
+        watchdog.start()
+        try:
+            async with harness.client() as client:
+                await client.post('/api/auth/register', json={
+                    'email': 'slow@example.com', 'password': 'pw', 'name': 'S', 'phone': '+91 95555', 'city': 'Pune'})
+                await asyncio.sleep(0.02)
+                return (await client.get('/api/admin/diagnostics',
+                                         headers={'Authorization': f"Bearer {data.admin_token}"})).json()
+        finally:
+            await watchdog.stop()
+
+    diagnostics = asyncio.run(scenario())
+    [report] = [r for r in diagnostics['blocking_calls']['reports'] if r['route'] == 'POST /api/auth/register']
+    assert diagnostics['blocking_calls']['enabled'] is True
+    assert report['handler'] == 'server.register'
+    assert report['blocked_in'] == 'server.hash_password'
+    assert report['route'] == 'POST /api/auth/register'
+    assert 'lag_ms' in diagnostics['event_loop']
@@ -0,0 +1,29 @@
+from benchmarks import harness  # noqa: F401 - puts backend/ on sys.path
+import cache
+from cache import ResponseCache
+
+
+def test_set_evicts_expired_and_superseded_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    responses = ResponseCache(ttl=30, max_entries=10)
+    responses.set('subjects:1', [1])
+    now[0] += 20
+    responses.set('subjects:2', [2])  # a write bumped the stamp
+    now[0] += 15
+    responses.set('updates:1', [])
+    assert responses.get('subjects:2') is not None
+    # The old stamp's entry expired and went with the next set, not just out of reach of get
+    assert responses.size() == 2
+    assert responses.get('subjects:1') is None
+
+
+def test_least_recently_used_entries_go_first_beyond_the_cap():
+    responses = ResponseCache(ttl=30, max_entries=2)
+    responses.set('a', 'a')
+    responses.set('b', 'b')
+    responses.get('a')
+    responses.set('c', 'c')
+    assert responses.size() == 2
+    assert responses.get('b') is None
+    assert responses.get('a') is not None and responses.get('c') is not None
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+
+from benchmarks import harness
+from catalog_import import CatalogImporter, json_array_rows
+
+server = harness.server
+
+
+def admin_headers(data, content_type):
+    return {'Authorization': f"Bearer {data.admin_token}", 'Content-Type': content_type}
+
+
+async def chunked(body: bytes, size: int = 7):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def run_import(body, content_type, chunk_size=7):
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        async with harness.client() as client:
+            response = await client.post(
+                '/api/admin/import', content=chunked(body, chunk_size),
+                headers=admin_headers(data, content_type),
+            )
+        return response, db
+
+    return asyncio.run(scenario())
+
+
+def test_csv_import_upserts_and_reports_bad_rows():
+    body = (
+        'kind,board,class_name,subject_name,price,title,type,link,description\n'
+        'subject,CBSE,Class 12,Physics,900,,,,\n'
+        'material,CBSE,Class 12,Physics,,Optics,pdf,https://x/1,"Rays,\n lenses"\n'
+        'material,CBSE,Class 12,Physics,,Waves,audio,https://x/2,\n'
+        'material,ICSE,Class 9,Art,,Colour,pdf,https://x/3,\n'
+        'subject,CBSE,Class 12,Physics,950,,,,\n'
+    ).encode()
+    response, db = run_import(body, 'text/csv')
+    report = response.json()
+
+    assert response.status_code == 200
+    assert report['rows'] == 5
+    assert report['subjects'] == {'inserted': 1, 'updated': 1}
+    assert report['materials'] == {'inserted': 1, 'updated': 0}
+    assert [e['row'] for e in report['errors']] == [3, 4]
+
+    async def check():
+        subject = await db.subjects.find_one({'id': 'cbse-class-12-physics'})
+        material = await db.materials.find_one({'title': 'Optics'})
+        return subject, material
+
+    subject, material = asyncio.run(check())
+    assert subject['price'] == 950
+    assert material['subject_id'] == 'cbse-class-12-physics'
+    assert material['description'] == 'Rays,\n lenses'
+    assert material['id'].startswith('mat-')
+
+
+def test_json_array_import_is_decoded_incrementally():
+    rows = [
+        {'kind': 'subject', 'board': 'STATE', 'class_name': 'Class 8', 'subject_name': 'Maths', 'price': 400},
+        {'kind': 'material', 'subject_id': 'state-class-8-maths', 'title': 'Algebra', 'type': 'video', 'link': 'l'},
+        {'kind': 'board'},
+    ]
+    response, _ = run_import(json.dumps(rows, indent=2).encode(), 'application/json', chunk_size=5)
+    report = response.json()
+    assert report['rows'] == 3
+    assert report['materials']['inserted'] == 1
+    assert report['errors'] == [{'row': 3, 'error': "kind must be 'subject' or 'material'"}]
+
+
+def test_malformed_json_rows_are_reported_and_skipped():
+    body = (
+        '[{"kind": "subject", "board": "STATE", "class_name": "Class 8", "subject_name": "Maths", "price": 400},'
+        ' {"kind": "material", "title": "Broken" "type": "pdf"},'
+        ' {"kind": "material", "title": "Unclosed", "note": {"a": 1, ' + 'x' * 200 + ','
+        ' {"kind": "material", "subject_id": "state-class-8-maths", "title": "Algebra", "type": "pdf", "link": "l"}]'
+    ).encode()
+
+    async def rows():
+        return [row async for row in json_array_rows(chunked(body, 16), max_row_chars=100)]
+
+    numbers, parsed, errors = zip(*asyncio.run(rows()))
+    assert numbers == (1, 2, 3, 4)
+    assert parsed[0]['subject_name'] == 'Maths'
+    assert parsed[1] is parsed[2] is None
+    # Decoding picks up again at the next row
+    assert parsed[3]['title'] == 'Algebra'
+    assert errors[1] == "invalid JSON: Expecting ',' delimiter"
+    assert errors[2] == 'row is malformed or longer than 100 characters'
+
+
+def test_rows_that_leave_fields_out_keep_the_stored_values():
+    rows = [
+        {'kind': 'subject', 'board': 'CBSE', 'class_name': 'Class 10', 'subject_name': 'Subject0', 'price': 999},
+        {'kind': 'material', 'id': 'mat-0-0', 'subject_id': 'cbse-class-10-subject0', 'title': 'Renamed',
+         'type': 'pdf', 'link': 'https://x/renamed'},
+        {'kind': 'subject', 'board': 'CBSE', 'class_name': 'Class 11', 'subject_name': 'New', 'price': 100},
+    ]
+
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        await db.subjects.update_one({'id': 'cbse-class-10-subject0'}, {'$set': {'is_visible': False}})
+        await db.materials.update_one({'id': 'mat-0-0'}, {'$set': {'description': 'Kept'}})
+        async with harness.client() as client:
+            await client.post('/api/admin/import', content=json.dumps(rows).encode(),
+                              headers=admin_headers(data, 'application/json'))
+        return (
+            await db.subjects.find_one({'id': 'cbse-class-10-subject0'}),
+            await db.subjects.find_one({'id': 'cbse-class-11-new'}),
+            await db.materials.find_one({'id': 'mat-0-0'}),
+        )
+
+    existing, created, material = asyncio.run(scenario())
+    assert (existing['price'], existing['is_visible']) == (999, False)
+    assert (created['is_visible'], created['duration_months']) == (True, 6)
+    assert (material['title'], material['description']) == ('Renamed', 'Kept')
+
+
+def test_unknown_format_is_rejected():
+    response, _ = run_import(b'<xml/>', 'application/xml')
+    assert response.status_code == 400
+
+
+class CountingCollection:
+    def __init__(self):
+        self.batches = []
+
+    async def distinct(self, field):
+        return ['cbse-class-10-subject0']
+
+    async def bulk_write(self, operations, ordered=True):
+        self.batches.append(len(operations))
+        return type('Result', (), {'bulk_api_result': {'nUpserted': len(operations), 'nModified': 0}})()
+
+
+class CountingDB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+def test_ten_thousand_rows_parse_and_batch_quickly():
+    # mongomock scans on every upsert, so time the importer against a counting stub
+    db = CountingDB(subjects=CountingCollection(), materials=CountingCollection())
+    lines = ['kind,subject_id,title,type,link']
+    lines += [f"material,cbse-class-10-subject0,Note {i},pdf,https://x/{i}" for i in range(10_000)]
+    body = ('\n'.join(lines) + '\n').encode()
+    importer = CatalogImporter(db, server.make_subject_id, batch_size=1000)
+
+    start = time.perf_counter()
+    report = asyncio.run(importer.run(chunked(body, 64 * 1024), 'csv'))
+    elapsed = time.perf_counter() - start
+
+    assert report['materials']['inserted'] == 10_000
+    assert db['materials'].batches == [1000] * 10
+    assert elapsed < 5
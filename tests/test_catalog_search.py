@@ -0,0 +1,63 @@
+import asyncio
+
+from benchmarks import harness
+from search_index import CatalogSearchIndex, tokenize
+
+server = harness.server
+
+MATERIALS = [
+    {'id': 'm1', 'subject_id': 'bio', 'title': 'Photosynthesis notes', 'type': 'pdf', 'link': 'l1',
+     'description': 'Light and dark reactions'},
+    {'id': 'm2', 'subject_id': 'bio', 'title': 'Respiration', 'type': 'video', 'link': 'l2',
+     'description': 'Compared with photosynthesis'},
+    {'id': 'm3', 'subject_id': 'chem', 'title': 'Photosynthesis in chemistry', 'type': 'pdf', 'link': 'l3',
+     'description': ''},
+]
+UPDATES = [
+    {'id': 'u1', 'title': 'Biology notes released', 'type': 'announcement', 'link': '', 'description': 'New notes'},
+]
+
+
+def build():
+    index = CatalogSearchIndex()
+    index.build(MATERIALS, UPDATES)
+    return index
+
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize('The Notes of Batteries') == ['note', 'battery']
+
+
+def test_ranking_prefers_all_terms_and_titles_within_owned_subjects():
+    results = build().search('photosynthesis notes', {'bio'})['results']
+    assert [r['id'] for r in results] == ['m1', 'u1', 'm2']
+    assert results[0]['matched_all'] is True
+    assert 'm3' not in [r['id'] for r in results]
+
+
+def test_last_word_matches_as_prefix_while_typing():
+    index = build()
+    assert [r['id'] for r in index.search('photos', {'bio'})['results']] == ['m1', 'm2']
+    assert index.search('photos ', {'bio'})['results'] == []
+
+
+def test_search_endpoint_is_scoped_and_refreshed_on_writes():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=4, materials_per_subject=2, subscriptions_per_user=1, updates=2)
+        owned = data.subjects[0]['id']
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        async with harness.client() as client:
+            first = (await client.get('/api/search', params={'q': 'chapter notes'}, headers=headers)).json()
+            await client.post('/api/admin/materials', headers=admin, json={
+                'subject_id': owned, 'title': 'Electrostatics formula sheet', 'type': 'pdf', 'link': 'x',
+            })
+            second = (await client.get('/api/search', params={'q': 'electrostatics'}, headers=headers)).json()
+        return owned, first, second
+
+    owned, first, second = asyncio.run(scenario())
+    materials = [r for r in first['results'] if r['kind'] == 'material']
+    assert materials and {r['subject_id'] for r in materials} == {owned}
+    assert [r['title'] for r in second['results']] == ['Electrostatics formula sheet']
+    assert second['partial'] is False
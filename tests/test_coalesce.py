@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from benchmarks import harness
+from coalesce import SingleFlight
+
+server = harness.server
+
+
+def test_thousand_concurrent_identical_calls_share_one_load():
+    async def scenario():
+        flight = SingleFlight('test')
+        loads = 0
+        release = asyncio.Event()
+
+        async def loader():
+            nonlocal loads
+            loads += 1
+            await release.wait()
+            return ['subject']
+
+        callers = [asyncio.create_task(flight.do('subjects', loader)) for _ in range(1000)]
+        await asyncio.sleep(0)
+        waiting = flight.waiters('subjects')
+        release.set()
+        results = await asyncio.gather(*callers)
+        return loads, waiting, results, flight.in_flight()
+
+    loads, waiting, results, in_flight = asyncio.run(scenario())
+    assert loads == 1
+    assert waiting == 1000
+    assert all(r == ['subject'] for r in results)
+    assert in_flight == {}
+
+
+def test_cancelled_callers_do_not_cancel_the_shared_load():
+    async def scenario():
+        flight = SingleFlight('test')
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return 42
+
+        callers = [asyncio.create_task(flight.do('k', loader)) for _ in range(1000)]
+        await asyncio.sleep(0)
+        for task in callers[:999]:
+            task.cancel()
+        await asyncio.sleep(0)
+        remaining = flight.waiters('k')
+        release.set()
+        return remaining, await callers[-1], [t.cancelled() for t in callers[:999]]
+
+    remaining, result, cancelled = asyncio.run(scenario())
+    assert remaining == 1
+    assert result == 42
+    assert all(cancelled)
+
+
+def test_last_cancelled_caller_cancels_the_load_and_releases_the_key():
+    async def scenario():
+        flight = SingleFlight('test')
+        started = []
+
+        async def slow():
+            started.append(1)
+            await asyncio.sleep(3600)
+
+        callers = [asyncio.create_task(flight.do('k', slow)) for _ in range(10)]
+        await asyncio.sleep(0)
+        for task in callers:
+            task.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        released = flight.in_flight()
+
+        async def fast():
+            return 'fresh'
+
+        return released, await flight.do('k', fast), len(started)
+
+    released, fresh, started = asyncio.run(scenario())
+    assert released == {}
+    assert fresh == 'fresh'
+    assert started == 1
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def scenario():
+        flight = SingleFlight('test')
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise RuntimeError('mongo down')
+
+        results = await asyncio.gather(*(flight.do('k', failing) for _ in range(1000)), return_exceptions=True)
+        await asyncio.gather(*(flight.do('k', failing) for _ in range(10)), return_exceptions=True)
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert calls == 2
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.parametrize('path', ['/api/subjects', '/api/updates', 'materials'])
+def test_endpoints_issue_one_query_for_concurrent_requests(path, monkeypatch):
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=2, materials_per_subject=3, subscriptions_per_user=1, updates=3)
+        url = f"/api/materials/{data.subjects[0]['id']}" if path == 'materials' else path
+        collection = {'materials': 'materials', '/api/subjects': 'subjects', '/api/updates': 'updates'}[path]
+        finds = []
+        collection_type = type(db[collection])
+        original = collection_type.find
+
+        def counting_find(self, *args, **kwargs):
+            if self.name == collection:
+                finds.append(1)
+            return original(self, *args, **kwargs)
+
+        monkeypatch.setattr(collection_type, 'find', counting_find)
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        async with harness.client() as client:
+            responses = await asyncio.gather(*(client.get(url, headers=headers) for _ in range(200)))
+        return finds, responses
+
+    finds, responses = asyncio.run(scenario())
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.content for r in responses}) == 1
+    assert len(finds) == 1
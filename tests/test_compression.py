@@ -0,0 +1,131 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+
+from benchmarks import harness  # noqa: F401 - puts backend/ on sys.path
+from compression import CompressionMiddleware, PrecompressedBody, brotli, choose_encoding
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('GZIP ; q=0.5', 'gzip'),
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip;q=0.8', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=nonsense', None),
+    ('*', 'br'),
+    ('*;q=0.1, br;q=0', 'gzip'),
+])
+def test_choose_encoding_honours_q_values(header, expected):
+    assert choose_encoding(header, ('br', 'gzip')) == expected
+
+
+def test_choose_encoding_only_offers_available_encodings():
+    assert choose_encoding('br', ('gzip',)) is None
+    assert choose_encoding('br, gzip', ('gzip',)) == 'gzip'
+
+
+def decompress(body, encoding):
+    return brotli.decompress(body) if encoding == 'br' else gzip.decompress(body)
+
+
+def test_precompressed_body_picks_a_variant():
+    raw = b'{"items":[' + b','.join(b'{"n":%d}' % i for i in range(500)) + b']}'
+    body = PrecompressedBody(raw)
+    gz = body.response('gzip', {'ETag': '"1"'})
+    assert gz.headers['content-encoding'] == 'gzip'
+    assert gz.headers['vary'] == 'Accept-Encoding'
+    assert gz.headers['etag'] == '"1"'
+    assert gzip.decompress(gz.body) == raw
+    plain = body.response('')
+    assert 'content-encoding' not in plain.headers
+    assert plain.body == raw
+    assert PrecompressedBody(b'{}').variants == {}
+
+
+def run_middleware(messages, accept_encoding='gzip, br', minimum_size=100):
+    async def app(scope, receive, send):
+        for message in messages:
+            await send(message)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, None, send))
+    start, bodies = sent[0], sent[1:]
+    headers = {k.decode(): v.decode() for k, v in start['headers']}
+    return start, headers, bodies
+
+
+def start(content_type='application/json', *extra, status=200, length=None):
+    headers = [(b'content-type', content_type.encode())] + list(extra)
+    if length is not None:
+        headers.append((b'content-length', str(length).encode()))
+    return {'type': 'http.response.start', 'status': status, 'headers': headers}
+
+
+def test_single_body_is_compressed_with_its_length():
+    payload = b'{"a":"' + b'x' * 2000 + b'"}'
+    _, headers, bodies = run_middleware([
+        start(length=len(payload)),
+        {'type': 'http.response.body', 'body': payload},
+    ], accept_encoding='gzip')
+    assert headers['content-encoding'] == 'gzip'
+    assert headers['vary'] == 'Accept-Encoding'
+    assert int(headers['content-length']) == len(bodies[0]['body'])
+    assert gzip.decompress(bodies[0]['body']) == payload
+
+
+def test_streamed_body_drops_content_length_and_flushes_each_chunk():
+    chunks = [b'[' + b'{"n":1},' * 50, b'{"n":2},' * 50, b'{"n":3}]']
+    messages = [start()] + [
+        {'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    _, headers, bodies = run_middleware(messages, accept_encoding='gzip')
+    assert headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in headers
+    assert [b['more_body'] for b in bodies] == [True, True, False]
+    # Every chunk is sync-flushed, so a client can decode what it has so far
+    partial = zlib.decompressobj(31).decompress(bodies[0]['body'])
+    assert partial == chunks[0]
+    assert gzip.decompress(b''.join(b['body'] for b in bodies)) == b''.join(chunks)
+
+
+@pytest.mark.parametrize('response_start, body, encoding, varies', [
+    (start(length=20), b'{"small":"body"}', None, True),
+    (start('image/png', length=5000), b'\x89PNG' + b'\0' * 4996, None, False),
+    (start('application/json', (b'content-encoding', b'br'), length=5000), b'x' * 5000, 'br', True),
+    (start(status=304), b'', None, True),
+], ids=['below-minimum', 'not-compressible', 'already-encoded', 'not-modified'])
+def test_passthrough_leaves_the_body_alone(response_start, body, encoding, varies):
+    _, headers, bodies = run_middleware([response_start, {'type': 'http.response.body', 'body': body}])
+    assert headers.get('content-encoding') == encoding
+    assert bodies[0]['body'] == body
+    assert ('vary' in headers) is varies
+
+
+def test_no_acceptable_encoding_still_varies():
+    payload = b'{"a":"' + b'x' * 2000 + b'"}'
+    _, headers, bodies = run_middleware(
+        [start(length=len(payload)), {'type': 'http.response.body', 'body': payload}], accept_encoding='identity'
+    )
+    assert 'content-encoding' not in headers
+    assert headers['vary'] == 'Accept-Encoding'
+    assert bodies[0]['body'] == payload
+
+
+@pytest.mark.skipif(brotli is None, reason='brotli not installed')
+def test_brotli_preferred_when_available():
+    payload = b'{"a":"' + b'y' * 2000 + b'"}'
+    _, headers, bodies = run_middleware([start(), {'type': 'http.response.body', 'body': payload}])
+    assert headers['content-encoding'] == 'br'
+    assert decompress(bodies[0]['body'], 'br') == payload
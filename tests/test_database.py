@@ -0,0 +1,127 @@
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from benchmarks import harness
+from database import (
+    admin_client_options,
+    ensure_unique_index,
+    mongo_client_options,
+    read_preference_from_env,
+    routed_databases,
+    unique_enforced,
+)
+
+server = harness.server
+
+
+def test_client_options_from_env():
+    options = mongo_client_options({
+        'MONGO_MAX_POOL_SIZE': '50',
+        'MONGO_WAIT_QUEUE_TIMEOUT_MS': '250',
+        'MONGO_COMPRESSORS': 'zlib',
+        'MONGO_ZLIB_LEVEL': '3',
+    })
+    assert options['maxPoolSize'] == 50
+    assert options['waitQueueTimeoutMS'] == 250
+    assert options['compressors'] == 'zlib'
+    assert options['zlibCompressionLevel'] == 3
+
+
+def test_admin_client_has_its_own_pool_budget():
+    options = admin_client_options({'MONGO_MAX_POOL_SIZE': '100', 'MONGO_MIN_POOL_SIZE': '20',
+                                    'ADMIN_MONGO_MAX_POOL_SIZE': '8'})
+    assert options['maxPoolSize'] == 8
+    assert options['minPoolSize'] == 0
+    assert options['waitQueueTimeoutMS'] == 5000
+
+
+def test_read_preference_defaults_to_bounded_secondary_preferred():
+    preference = read_preference_from_env({}, 'catalog')
+    assert isinstance(preference, SecondaryPreferred)
+    assert preference.max_staleness == 90
+
+    assert read_preference_from_env({'CATALOG_MAX_STALENESS_SECONDS': '10'}, 'catalog').max_staleness == 90
+    assert isinstance(read_preference_from_env({'ANALYTICS_READ_PREFERENCE': 'primary'}, 'analytics'), Primary)
+
+
+def test_routed_databases_on_replica_set_uri():
+    client = AsyncIOMotorClient('mongodb://rs-a:27017,rs-b:27017/?replicaSet=rs0', connect=False)
+    primary, catalog, analytics = routed_databases(client, 'neuron', {'ANALYTICS_MAX_STALENESS_SECONDS': '300'})
+
+    assert primary.read_preference.mongos_mode == 'primary'
+    assert catalog.read_preference.mongos_mode == 'secondaryPreferred'
+    assert analytics.read_preference.max_staleness == 300
+    client.close()
+
+
+def test_handlers_read_from_their_route_class(monkeypatch):
+    """Lagging 'secondary' data is visible to catalog reads but never to auth/payment reads."""
+    async def scenario():
+        harness.install_fakes()
+        primary = server.db
+        secondary = AsyncMongoMockClient()['neuron_secondary']
+        monkeypatch.setattr(server, 'catalog_db', secondary)
+        monkeypatch.setattr(server, 'analytics_db', secondary)
+
+        subject = {'id': 'cbse-class-10-physics', 'board': 'CBSE', 'class_name': 'Class 10',
+                   'subject_name': 'Physics', 'price': 600, 'duration_months': 6, 'is_visible': True}
+        await primary.subjects.insert_one(dict(subject))  # not replicated yet
+        await primary.users.insert_one({'email': 'a@b.test', 'name': 'A', 'phone': '1', 'city': 'Pune',
+                                        'password': server.hash_password('pw')})
+        token = server.create_jwt_token('a@b.test')
+
+        async with harness.client() as client:
+            subjects = (await client.get('/api/subjects')).json()
+            me = await client.get('/api/auth/me', headers={'Authorization': f"Bearer {token}"})
+        return subjects, me.status_code
+
+    subjects, me_status = asyncio.run(scenario())
+    assert subjects == []
+    assert me_status == 200
+
+
+def test_duplicates_defer_the_unique_index_and_are_logged(caplog):
+    async def scenario():
+        db = AsyncMongoMockClient()['unique']
+        await db.users.insert_many([{'email': 'a@example.com'}, {'email': 'a@example.com'}, {'email': 'b@example.com'}])
+        built = await ensure_unique_index(db.users, 'email')
+        deferred = unique_enforced(db.users, 'email')
+        indexes = await db.users.index_information()
+        await db.users.delete_one({'email': 'a@example.com'})
+        # mongomock reports the plain-vs-unique option conflict without its code, so drop it here
+        await db.users.drop_index('email_1')
+        rebuilt = await ensure_unique_index(db.users, 'email')
+        return built, deferred, indexes, rebuilt, unique_enforced(db.users, 'email')
+
+    built, deferred, indexes, rebuilt, enforced = asyncio.run(scenario())
+    assert built is False and deferred is False
+    assert "'a@example.com' (2x)" in caplog.text
+    assert 'b@example.com' not in caplog.text
+    # A plain index keeps lookups fast meanwhile
+    assert 'unique' not in indexes['email_1']
+    assert rebuilt is True and enforced is True
+
+
+def test_create_handlers_check_first_while_the_index_is_deferred():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        # A legacy database where update_board once let two boards share a name
+        await db.boards.drop_index('name_1')
+        await db.boards.insert_many([{'id': 'old-a', 'name': 'OLD'}, {'id': 'old-b', 'name': 'OLD'}])
+        await server.ensure_unique_indexes(db)
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        async with harness.client() as client:
+            statuses = [
+                (await client.post('/api/admin/boards', json={'name': 'old', 'full_name': 'x'}, headers=admin)).status_code,
+                (await client.put('/api/admin/boards/old-a', json={'name': 'CBSE', 'full_name': 'x'}, headers=admin)).status_code,
+                (await client.post('/api/admin/boards', json={'name': 'new', 'full_name': 'x'}, headers=admin)).status_code,
+            ]
+        return statuses, unique_enforced(db.boards, 'name')
+
+    statuses, enforced = asyncio.run(scenario())
+    assert enforced is False
+    assert statuses == [400, 400, 200]
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import harness
+
+import entitlements
+
+server = harness.server
+
+
+async def buy(client, token, subject, via='verify'):
+    headers = {'Authorization': f"Bearer {token}"}
+    order = (await client.post('/api/payments/create-order', headers=headers, json={
+        'subject_id': subject['id'], 'amount': subject['price'],
+    })).json()
+    order_id = order['order_id']
+    payment_id = f"pay_{order_id[6:]}"
+    responses = []
+    if via in ('verify', 'both'):
+        responses.append((await client.post('/api/payments/verify', headers=headers, json={
+            'payment_id': payment_id, 'order_id': order_id, 'signature': harness.sign_payment(order_id, payment_id),
+        })).json())
+    if via in ('webhook', 'both'):
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': payment_id, 'order_id': order_id}}},
+        }).encode()
+        responses.append((await client.post('/api/payments/webhook', content=body, headers={
+            'X-Razorpay-Signature': harness.sign_webhook(body), 'Content-Type': 'application/json',
+        })).json())
+    return responses
+
+
+def test_renewal_extends_the_single_entitlement_from_its_end(run):
+    async def scenario(client, db, data):
+        # user 1 owns subject 1 through the seed; buying it again early adds a full period on top
+        email, subject = data.users[1]['email'], data.subjects[1]
+        before = await db.entitlements.find_one({'user_email': email, 'subject_id': subject['id']})
+        await buy(client, data.tokens[1], subject)
+        after = await db.entitlements.find({'user_email': email, 'subject_id': subject['id']}).to_list(None)
+        history = await db.subscriptions.count_documents({'user_email': email, 'subject_id': subject['id']})
+        return before, after, history
+
+    before, after, history = run(scenario)
+    assert len(after) == 1
+    added = datetime.fromisoformat(after[0]['end_date']) - datetime.fromisoformat(before['end_date'])
+    assert added == timedelta(days=180)
+    assert history == 2
+
+
+def test_verify_and_webhook_for_one_payment_count_once(run):
+    async def scenario(client, db, data):
+        email, subject = data.users[0]['email'], data.subjects[1]
+        responses = await buy(client, data.tokens[0], subject, via='both')
+        entitlement = await db.entitlements.find_one({'user_email': email, 'subject_id': subject['id']})
+        history = await db.subscriptions.count_documents({'user_email': email, 'subject_id': subject['id']})
+        return responses, entitlement, history
+
+    responses, entitlement, history = run(scenario)
+    assert responses[0]['message'] == 'Payment verified and subscription created'
+    assert responses[1] == {'status': 'success'}
+    assert history == 1
+    assert len(entitlement['sources']) == 1
+    days = (datetime.fromisoformat(entitlement['end_date']) - datetime.now(timezone.utc)).days
+    assert days == 179
+
+
+def test_access_check_is_one_entitlement_lookup(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.tokens[1]}"}
+        with harness.count_commands(db) as commands:
+            check = (await client.get(f"/api/subscriptions/check/{data.subjects[1]['id']}", headers=headers)).json()
+        return check, commands
+
+    check, commands = run(scenario)
+    assert check['has_subscription'] is True
+    # Same shape as the subscription document this endpoint used to return
+    assert check['subscription']['order_id'] == 'order_seed1x0'
+    assert check['subscription']['payment_status'] == 'completed'
+    assert {'id', 'price', 'duration_months', 'start_date', 'end_date'} <= set(check['subscription'])
+    assert 'sources' not in check['subscription']
+    assert [c for c in commands if c[0] != 'users'] == [('entitlements', 'find_one')]
+
+
+def test_backfill_keeps_the_latest_end_and_is_incremental(run):
+    async def scenario(client, db, data):
+        email, subject_id = data.users[0]['email'], data.subjects[0]['id']
+        now = datetime.now(timezone.utc)
+        await db.entitlements.delete_many({})
+        await db.migrations.delete_many({})
+        await db.subscriptions.insert_many([
+            {'id': f"sub-old-{i}", 'user_email': email, 'subject_id': subject_id, 'payment_status': 'completed',
+             'start_date': now.isoformat(), 'end_date': (now + timedelta(days=days)).isoformat(),
+             'created_at': now.isoformat()}
+            for i, days in enumerate((30, 400, 90))
+        ])
+        first = await entitlements.backfill(db)
+        second = await entitlements.backfill(db)
+        entitlement = await db.entitlements.find_one({'user_email': email, 'subject_id': subject_id})
+        total = await db.entitlements.count_documents({})
+        return first, second, entitlement, total, now
+
+    first, second, entitlement, total, now = run(scenario)
+    assert first > 3
+    # The second run only revisits subscriptions written since the first (within the overlap window)
+    assert 0 < second <= first
+    assert total == 2
+    assert entitlement['end_date'] == (now + timedelta(days=400)).isoformat()
+    assert {'sub-old-0', 'sub-old-1', 'sub-old-2'} <= set(entitlement['sources'])
+
+
+def test_concurrent_extensions_are_all_applied(run):
+    async def scenario(client, db, data):
+        email, subject_id = data.users[0]['email'], data.subjects[1]['id']
+        results = await asyncio.gather(*(
+            entitlements.extend(db.entitlements, email, subject_id, 10, f"order-{i}") for i in range(3)
+        ))
+        entitlement = await db.entitlements.find_one({'user_email': email, 'subject_id': subject_id})
+        return results, entitlement
+
+    results, entitlement = run(scenario)
+    assert all(starts is not None for _, starts, _ in results)
+    # The first writer started a new period; the ones that retried extended it
+    assert sorted(running for _, _, running in results) == [False, True, True]
+    days = (datetime.fromisoformat(entitlement['end_date']) - datetime.now(timezone.utc)).days
+    assert days == 29
+    assert sorted(entitlement['sources']) == ['order-0', 'order-1', 'order-2']
+
+
+def test_startup_removes_duplicate_history_from_before_the_order_index(monkeypatch):
+    monkeypatch.setenv('INVALIDATION_BUS', 'off')
+    monkeypatch.setattr(server, 'ROLLUP_MODE', 'off')
+
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        await db.subscriptions.drop_index('order_id_1')
+        # What verify and the webhook each used to insert for one payment
+        seeded = await db.subscriptions.find_one({}, {'_id': 0})
+        webhook = {**seeded, 'id': f"sub-{seeded['order_id']}", 'created_at': datetime.now(timezone.utc).isoformat()}
+        await db.subscriptions.insert_one(webhook)
+        async with server.lifespan(server.app):
+            history = await db.subscriptions.find({}, {'_id': 0, 'id': 1, 'order_id': 1}).to_list(None)
+            indexes = await db.subscriptions.index_information()
+            async with harness.client() as client:
+                check = (await client.get(
+                    f"/api/subscriptions/check/{data.subjects[0]['id']}",
+                    headers={'Authorization': f"Bearer {data.tokens[0]}"},
+                )).json()
+        return seeded, history, indexes, check
+
+    seeded, history, indexes, check = asyncio.run(scenario())
+    # The first (verify) copy is kept
+    assert history == [{'id': seeded['id'], 'order_id': seeded['order_id']}]
+    assert indexes['order_id_1']['unique'] is True
+    assert check['has_subscription'] is True
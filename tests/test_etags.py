@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+from bson import Timestamp
+from pymongo.read_preferences import SecondaryPreferred
+
+from benchmarks import harness
+from etags import VersionStamps, etag_matches
+
+server = harness.server
+
+
+@pytest.fixture
+def seed():
+    return {'materials_per_subject': 2, 'updates': 2}
+
+
+def test_etag_matching_is_weak_and_handles_lists():
+    assert etag_matches('W/"subjects-abc"', 'W/"subjects-abc"')
+    assert etag_matches('"subjects-abc"', 'W/"subjects-abc"')
+    assert etag_matches('W/"x", W/"subjects-abc"', 'W/"subjects-abc"')
+    assert etag_matches('*', 'W/"subjects-abc"')
+    assert not etag_matches('W/"subjects-abd"', 'W/"subjects-abc"')
+    assert not etag_matches(None, 'W/"subjects-abc"')
+
+
+@pytest.mark.parametrize('path', ['/api/subjects', '/api/updates', '/api/subscriptions/my', 'materials'])
+def test_matching_if_none_match_gets_304_without_loading(run, path, monkeypatch):
+    async def scenario(client, db, data):
+        url = f"/api/materials/{data.subjects[0]['id']}" if path == 'materials' else path
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        first = await client.get(url, headers=headers)
+
+        collection = {'materials': 'materials', '/api/subjects': 'subjects',
+                      '/api/updates': 'updates', '/api/subscriptions/my': 'subscriptions'}[path]
+        server.catalog_cache.invalidate()  # a cache hit would hide a load
+        finds = []
+        collection_type = type(db[collection])
+        original = collection_type.find
+
+        def counting_find(self, *args, **kwargs):
+            if self.name == collection:
+                finds.append(1)
+            return original(self, *args, **kwargs)
+
+        monkeypatch.setattr(collection_type, 'find', counting_find)
+        second = await client.get(url, headers={**headers, 'If-None-Match': first.headers['etag']})
+        return first, second, finds
+
+    first, second, finds = run(scenario)
+    assert first.status_code == 200
+    assert first.headers['etag'].startswith('W/"')
+    assert second.status_code == 304
+    assert second.content == b''
+    assert second.headers['etag'] == first.headers['etag']
+    assert finds == []
+
+
+def test_public_and_private_cache_control(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        return (
+            await client.get('/api/subjects'),
+            await client.get('/api/subscriptions/my', headers=headers),
+        )
+
+    subjects, mine = run(scenario)
+    assert subjects.headers['cache-control'].startswith('public')
+    assert 's-maxage=' in subjects.headers['cache-control']
+    assert mine.headers['cache-control'] == 'private, no-cache'
+
+
+def test_writes_change_the_etag(run):
+    async def scenario(client, db, data):
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        before = (await client.get('/api/subjects')).headers['etag']
+        await client.put(f"/api/admin/subjects/{data.subjects[0]['id']}/visibility",
+                         json={'is_visible': False}, headers=admin)
+        after = await client.get('/api/subjects', headers={'If-None-Match': before})
+
+        updates_before = (await client.get('/api/updates')).headers['etag']
+        await client.post('/api/admin/updates', json={'title': 'New', 'description': 'd'}, headers=admin)
+        updates_after = await client.get('/api/updates', headers={'If-None-Match': updates_before})
+        return before, after, updates_before, updates_after
+
+    before, after, updates_before, updates_after = run(scenario)
+    assert after.status_code == 200
+    assert after.headers['etag'] != before
+    assert len(after.json()) == 1
+    assert updates_after.status_code == 200
+    assert updates_after.json()[0]['title'] == 'New'
+
+
+def test_grant_changes_only_the_granted_users_subscription_etag(run):
+    async def scenario(client, db, data):
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        mine = [{'Authorization': f"Bearer {token}"} for token in data.tokens]
+        etags = [(await client.get('/api/subscriptions/my', headers=h)).headers['etag'] for h in mine]
+        await client.post('/api/admin/subscriptions/grant', headers=admin, json={
+            'users': [data.users[0]['email']], 'subject_ids': [data.subjects[1]['id']]})
+        return [
+            (await client.get('/api/subscriptions/my', headers={**h, 'If-None-Match': etag})).status_code
+            for h, etag in zip(mine, etags)
+        ]
+
+    assert run(scenario) == [200, 304]
+
+
+def test_revoked_access_is_not_answered_with_304(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        url = f"/api/materials/{data.subjects[0]['id']}"
+        etag = (await client.get(url, headers=headers)).headers['etag']
+        await db.entitlements.delete_many({'user_email': data.users[0]['email']})
+        return (await client.get(url, headers={**headers, 'If-None-Match': etag})).status_code
+
+    assert run(scenario) == 403
+
+
+class FakeSession:
+    def __init__(self, clock):
+        self.clock = clock
+        self.cluster_time = self.operation_time = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def advance_cluster_time(self, cluster_time):
+        self.cluster_time = cluster_time
+
+    def advance_operation_time(self, operation_time):
+        self.operation_time = operation_time
+
+
+class SecondaryReads:
+    """A catalog handle on a replica set: each read reports the member's operation time."""
+
+    read_preference = SecondaryPreferred(max_staleness=90)
+
+    def __init__(self):
+        self.client = self
+        self.versions = self
+        self.clock = [Timestamp(100, 1)]
+
+    async def start_session(self, causal_consistency=False):
+        assert causal_consistency
+        return FakeSession(self.clock)
+
+    async def find_one(self, query, session=None):
+        session.operation_time = self.clock[0]
+        session.cluster_time = {'clusterTime': self.clock[0]}
+        return {'_id': query['_id'], 'stamp': 'abc'}
+
+
+def test_guarded_reads_wait_for_the_stamps_cluster_time():
+    async def scenario():
+        handle = SecondaryReads()
+        stamps = VersionStamps(handle, ttl=0)
+        await stamps.get('subjects')
+        # A later read answered by a member further behind must not move the time back
+        handle.clock[0] = Timestamp(90, 1)
+        await stamps.get('subjects')
+        async with stamps.reading('subjects') as session:
+            guarded = session.operation_time, session.cluster_time
+        primary = VersionStamps(harness.install_fakes())
+        async with primary.reading('subjects') as none:
+            pass
+        return guarded, none
+
+    (operation_time, cluster_time), none = asyncio.run(scenario())
+    assert operation_time == Timestamp(100, 1)
+    assert cluster_time == {'clusterTime': Timestamp(100, 1)}
+    # Reads from the primary are never behind a stamp: no session
+    assert none is None
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from benchmarks import harness
+from fast_json import OrjsonResponse, StdlibJSONResponse, dumps, model_projection, orjson, trusted
+
+server = harness.server
+
+
+def previous_output(model, docs):
+    """What the route returned when FastAPI still validated against ``response_model``"""
+    return jsonable_encoder(TypeAdapter(List[model]).validate_python(docs))
+
+
+def test_model_projection_selects_exactly_the_model_fields():
+    assert model_projection(server.Material) == {
+        '_id': 0, 'id': 1, 'subject_id': 1, 'title': 1, 'type': 1, 'link': 1, 'description': 1,
+    }
+
+
+def test_trusted_bodies_match_for_both_encoders():
+    content = [{'id': 'a', 'title': 'Ünïcode – notes', 'price': 499, 'description': None}]
+    response = trusted(content, status_code=201, headers={'ETag': '"1"'})
+    assert response.status_code == 201
+    assert response.headers['etag'] == '"1"'
+    assert json.loads(response.body) == content
+    assert json.loads(dumps(content)) == content
+    assert StdlibJSONResponse(content).body == json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode()
+    if orjson is not None:
+        assert OrjsonResponse(content).body == StdlibJSONResponse(content).body
+
+
+def test_list_endpoints_return_what_the_response_model_did():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=2, subjects=3, materials_per_subject=2, subscriptions_per_user=2, updates=1)
+        # Extra stored fields must still be dropped, as response-model filtering did
+        await db.subjects.update_many({}, {'$set': {'internal_note': 'x'}})
+        await db.materials.update_many({}, {'$set': {'uploaded_by': 'admin'}})
+        email, subject_id = data.users[0]['email'], data.subjects[0]['id']
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        async with harness.client() as client:
+            subjects = (await client.get('/api/subjects')).json()
+            subscriptions = (await client.get('/api/subscriptions/my', headers=headers)).json()
+            materials = (await client.get(f"/api/materials/{subject_id}", headers=headers)).json()
+        stored = (
+            await db.subjects.find({}, {'_id': 0}).to_list(None),
+            await db.subscriptions.find({'user_email': email}, {'_id': 0}).to_list(None),
+            await db.materials.find({'subject_id': subject_id}, {'_id': 0}).to_list(None),
+        )
+        return (subjects, subscriptions, materials), stored
+
+    (subjects, subscriptions, materials), (stored_subjects, stored_subscriptions, stored_materials) = asyncio.run(scenario())
+    assert materials
+    assert sorted(subjects, key=lambda s: s['id']) == sorted(
+        previous_output(server.Subject, stored_subjects), key=lambda s: s['id']
+    )
+    assert subscriptions == previous_output(server.Subscription, stored_subscriptions)
+    assert materials == previous_output(server.Material, stored_materials)
@@ -0,0 +1,74 @@
+import asyncio
+
+from pymongo.errors import OperationFailure
+
+from benchmarks import harness
+from invalidation import InvalidationBus
+
+server = harness.server
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = list(events)
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.events:
+            await asyncio.sleep(3600)
+        event = self.events.pop(0)
+        self.resume_token = event['_id']
+        return event
+
+
+class FakeDB:
+    def __init__(self, stream=None, error=None):
+        self.stream = stream
+        self.error = error
+        self.calls = []
+
+    def watch(self, pipeline, resume_after=None):
+        self.calls.append(resume_after)
+        if self.error:
+            raise self.error
+        return self.stream
+
+
+def test_change_events_invalidate_catalog_cache():
+    async def scenario():
+        server.catalog_cache.set('subjects', [])
+        server.catalog_cache.set('updates', [])
+        db = FakeDB(FakeStream([{'_id': {'_data': '1'}, 'ns': {'db': 'x', 'coll': 'subjects'}, 'operationType': 'update'}]))
+        bus = InvalidationBus()
+        bus.subscribe('subjects', server.invalidate_cached)
+        bus.start(db)
+        await asyncio.sleep(0.01)
+        await bus.stop()
+        return bus
+
+    bus = asyncio.run(scenario())
+    assert server.catalog_cache.get('subjects') is None
+    assert server.catalog_cache.get('updates') is not None
+    assert bus._resume_token == {'_data': '1'}
+    server.catalog_cache.invalidate()
+
+
+def test_standalone_server_stops_the_bus():
+    async def scenario():
+        bus = InvalidationBus()
+        bus.subscribe('subjects', lambda change: None)
+        bus.start(FakeDB(error=OperationFailure('not a replica set', code=40573)))
+        await asyncio.sleep(0.01)
+        return bus
+
+    bus = asyncio.run(scenario())
+    assert bus._task.done() and not bus.running
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from benchmarks import harness, load
+
+
+@pytest.mark.parametrize('scenario', sorted(load.SCENARIOS))
+def test_scenario_runs_offline_without_errors(scenario):
+    results = asyncio.run(load.run([scenario], concurrency=2, iterations=1, users=4))
+    result = results[scenario]
+    assert result['requests'] > 0
+    assert result['errors'] == 0, result['statuses']
+    assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {'s': {'throughput_rps': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0}}
+    ok = {'s': {'throughput_rps': 95.0, 'p50_ms': 11.0, 'p95_ms': 21.0, 'p99_ms': 33.0}}
+    slow = {'s': {'throughput_rps': 50.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 60.0}}
+
+    assert load.compare(ok, baseline, max_regression=20) == []
+    assert len(load.compare(slow, baseline, max_regression=20)) == 2
+
+
+def test_fake_razorpay_rejects_bad_signature():
+    client = harness.FakeRazorpayClient()
+    order = client.order.create({'amount': 50000, 'currency': 'INR'})
+    good = harness.sign_payment(order['id'], 'pay_1')
+
+    assert client.utility.verify_payment_signature({
+        'razorpay_order_id': order['id'], 'razorpay_payment_id': 'pay_1', 'razorpay_signature': good,
+    })
+    with pytest.raises(harness.razorpay.errors.SignatureVerificationError):
+        client.utility.verify_payment_signature({
+            'razorpay_order_id': order['id'], 'razorpay_payment_id': 'pay_1', 'razorpay_signature': 'bad',
+        })
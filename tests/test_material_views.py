@@ -0,0 +1,159 @@
+import asyncio
+
+from benchmarks import harness
+from entitlements import ActiveSubjects
+from material_views import MATERIAL_VIEW_EVENTS, MAX_SESSION_SECONDS, MaterialViewCounter
+
+server = harness.server
+
+
+class CountingCollection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append(operations)
+        if self.fail:
+            raise RuntimeError('down')
+
+
+def test_events_are_aggregated_into_one_upsert_per_material_and_day():
+    async def scenario():
+        collection = CountingCollection()
+        counter = MaterialViewCounter(collection)
+        for _ in range(1000):
+            counter.record('mat-1', 'sub-1', 'view')
+        counter.record('mat-1', 'sub-1', 'session', seconds=120)
+        counter.record('mat-2', 'sub-1', 'session', seconds=10 ** 9)
+        written = await counter.flush()
+        return collection.calls, written, counter.pending
+
+    calls, written, pending = asyncio.run(scenario())
+    assert len(calls) == 1 and written == 2
+    updates = {op._filter['material_id']: op._doc['$inc'] for op in calls[0]}
+    assert updates['mat-1'] == {'views': 1000, 'sessions': 1, 'seconds': 120}
+    assert updates['mat-2'] == {'sessions': 1, 'seconds': MAX_SESSION_SECONDS}
+    assert pending == {}
+
+
+def test_failed_flush_keeps_the_counts_and_keys_are_bounded():
+    async def scenario():
+        counter = MaterialViewCounter(CountingCollection(fail=True), max_keys=2)
+        results = [counter.record(f"mat-{i}", 'sub-1', 'view') for i in range(3)]
+        await counter.flush()
+        counter.record('mat-0', 'sub-1', 'view')
+        return results, {key[0]: counts['views'] for key, counts in counter.pending.items()}
+
+    results, pending = asyncio.run(scenario())
+    assert results == [True, True, False]
+    assert pending == {'mat-0': 2, 'mat-1': 1}
+
+
+class FindCounter:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+
+        async def cursor():
+            for document in self.documents:
+                yield document
+
+        return cursor()
+
+
+def test_flush_checks_all_pending_materials_in_one_query():
+    async def scenario():
+        collection = CountingCollection()
+        materials = FindCounter([{'id': 'mat-1', 'subject_id': 'sub-1'}, {'id': 'mat-2', 'subject_id': 'sub-1'}])
+        counter = MaterialViewCounter(collection, materials)
+        for material_id, subject_id in [('mat-1', 'sub-1'), ('mat-2', 'sub-2'), ('made-up', 'sub-1')] * 3:
+            counter.record(material_id, subject_id, 'view')
+        written = await counter.flush()
+        return collection.calls, written, materials.queries
+
+    rejected = MATERIAL_VIEW_EVENTS.value('view', 'rejected')
+    calls, written, queries = asyncio.run(scenario())
+    assert len(queries) == 1
+    assert sorted(queries[0]['id']['$in']) == ['made-up', 'mat-1', 'mat-2']
+    assert written == 1
+    assert [op._filter['material_id'] for op in calls[0]] == ['mat-1']
+    assert MATERIAL_VIEW_EVENTS.value('view', 'rejected') == rejected + 6
+
+
+def test_entitlements_are_loaded_again_only_for_a_new_subject():
+    async def scenario():
+        entitlements = FindCounter([{'subject_id': 'sub-1'}])
+        subjects = ActiveSubjects()
+        results = [
+            await subjects.includes(entitlements, 'a@x.test', {'sub-1'}),
+            await subjects.includes(entitlements, 'a@x.test', {'sub-1'}),
+            await subjects.includes(entitlements, 'a@x.test', {'sub-1', 'sub-2'}),
+        ]
+        return results, len(entitlements.queries)
+
+    results, queries = asyncio.run(scenario())
+    assert results == [{'sub-1'}] * 3
+    assert queries == 2
+
+
+def test_viewer_events_reach_the_admin_report():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=2, subjects=1, materials_per_subject=2, subscriptions_per_user=1, updates=1)
+        subject_id = data.subjects[0]['id']
+        async with harness.client() as client:
+            for token in data.tokens:
+                response = await client.post('/api/materials/events', headers={'Authorization': f"Bearer {token}"}, json={
+                    'events': [
+                        {'material_id': 'mat-0-1', 'subject_id': subject_id, 'type': 'view'},
+                        {'material_id': 'mat-0-1', 'subject_id': subject_id, 'type': 'session', 'seconds': 30},
+                        {'material_id': 'mat-0-0', 'subject_id': subject_id, 'type': 'bogus'},
+                        # Not in the catalog, or filed under the wrong subject
+                        {'material_id': 'made-up', 'subject_id': subject_id, 'type': 'view'},
+                        {'material_id': 'mat-0-0', 'subject_id': 'other-subject', 'type': 'view'},
+                    ]
+                })
+            anonymous = await client.post('/api/materials/events', json={'events': []})
+            rejected = MATERIAL_VIEW_EVENTS.value('view', 'rejected')
+            await server.material_views.flush()
+            rejected = MATERIAL_VIEW_EVENTS.value('view', 'rejected') - rejected
+            await server.material_views.flush()  # nothing pending: no second write
+            report = (await client.get(
+                '/api/admin/materials/views', headers={'Authorization': f"Bearer {data.admin_token}"}
+            )).json()
+        return response, anonymous, report, rejected, await db.material_views_daily.count_documents({})
+
+    response, anonymous, report, rejected, documents = asyncio.run(scenario())
+    assert response.status_code == 202
+    # The made-up material passes the entitlement check and is dropped by the flush
+    assert response.json() == {'accepted': 3}
+    assert rejected == 2
+    assert anonymous.status_code == 403
+    assert documents == 1
+    [row] = report['materials']
+    assert row['material_id'] == 'mat-0-1'
+    assert (row['views'], row['sessions'], row['seconds']) == (2, 2, 60)
+    assert row['average_session_seconds'] == 30
+    assert row['title'] == 'Chapter 1 notes'
+
+
+def test_events_outside_the_callers_entitlements_are_not_counted():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        await db.entitlements.delete_many({})
+        async with harness.client() as client:
+            response = await client.post('/api/materials/events', headers={
+                'Authorization': f"Bearer {data.tokens[0]}"
+            }, json={'events': [{'material_id': 'mat-0-0', 'subject_id': data.subjects[0]['id'], 'type': 'view'}]})
+        return response.json(), dict(server.material_views.pending)
+
+    rejected = MATERIAL_VIEW_EVENTS.value('view', 'rejected')
+    result, pending = asyncio.run(scenario())
+    assert result == {'accepted': 0}
+    assert pending == {}
+    assert MATERIAL_VIEW_EVENTS.value('view', 'rejected') == rejected + 1
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from benchmarks import harness
+from metrics import HTTP_REQUESTS, Histogram, Registry, timed
+
+server = harness.server
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram('job_seconds', 'Job durations.', ('queue',), buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.1, 0.7, 3.0):
+        histogram.observe('default', value=value)
+    assert histogram.count('default') == 4
+    assert histogram.count('other') == 0
+    assert histogram.render() == [
+        '# HELP job_seconds Job durations.',
+        '# TYPE job_seconds histogram',
+        # Buckets are sorted, and a value equal to a bound falls in that bucket (le = "less or equal")
+        'job_seconds_bucket{queue="default",le="0.1"} 2',
+        'job_seconds_bucket{queue="default",le="0.5"} 2',
+        'job_seconds_bucket{queue="default",le="1.0"} 3',
+        'job_seconds_bucket{queue="default",le="+Inf"} 4',
+        'job_seconds_sum{queue="default"} 3.85',
+        'job_seconds_count{queue="default"} 4',
+    ]
+
+
+def test_unlabelled_series_and_label_escaping():
+    registry = Registry()
+    waits = registry.histogram('wait_seconds', 'Waits.', buckets=(1.0,))
+    errors = registry.counter('errors_total', 'Errors.', ('reason',))
+    registry.add_collector(lambda: ['custom_total 7'])
+    waits.observe(value=0.5)
+    errors.inc('bad "quote"\\path\nnext')
+    errors.inc('timeout', amount=2)
+    lines = registry.render().splitlines()
+    assert 'wait_seconds_bucket{le="1.0"} 1' in lines
+    assert 'wait_seconds_sum 0.5' in lines
+    assert 'wait_seconds_count 1' in lines
+    assert 'errors_total{reason="bad \\"quote\\"\\\\path\\nnext"} 1.0' in lines
+    assert 'errors_total{reason="timeout"} 2.0' in lines
+    assert lines[-1] == 'custom_total 7'
+    assert registry.render().endswith('\n')
+
+
+def test_timed_adds_the_outcome_label():
+    histogram = Histogram('call_seconds', 'Calls.', ('operation', 'outcome'))
+    with timed(histogram, 'create'):
+        pass
+    with pytest.raises(ValueError):
+        with timed(histogram, 'create'):
+            raise ValueError
+    assert histogram.count('create', 'ok') == 1
+    assert histogram.count('create', 'error') == 1
+
+
+def test_requests_are_labelled_by_route_template():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        route = '/api/materials/{subject_id}'
+        before = HTTP_REQUESTS.value('GET', route, '200')
+        async with harness.client() as client:
+            await client.get(f"/api/materials/{data.subjects[0]['id']}", headers={
+                'Authorization': f"Bearer {data.tokens[0]}",
+            })
+            body = (await client.get('/metrics')).text
+        return before, HTTP_REQUESTS.value('GET', route, '200'), body
+
+    before, after, body = asyncio.run(scenario())
+    assert after == before + 1
+    assert 'http_requests_total{method="GET",route="/api/materials/{subject_id}",status="200"}' in body
+    assert '# TYPE http_request_duration_seconds histogram' in body
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from benchmarks import harness
+from overload import OVERLOAD_SHED, LoopLagMonitor, OverloadMiddleware, parse_routes
+
+server = harness.server
+
+
+def test_monitor_notices_a_blocked_loop():
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05, hold=5)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        calm = monitor.overloaded
+        time.sleep(0.1)  # a synchronous call hogging the loop
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+        return calm, monitor
+
+    calm, monitor = asyncio.run(scenario())
+    assert not calm
+    assert monitor.overloaded
+    assert monitor.snapshot()['overloaded'] is True
+
+
+def test_payment_routes_are_never_shed():
+    middleware = OverloadMiddleware(None, LoopLagMonitor(), low_priority=parse_routes('POST /api/payments/, GET /api/admin/'))
+    assert middleware.sheddable('POST', '/api/payments/verify') is None
+    assert middleware.sheddable('POST', '/api/payments/webhook') is None
+    assert middleware.sheddable('POST', '/api/payments/create-order') == '/api/payments/'
+    assert middleware.sheddable('GET', '/api/admin/users') == '/api/admin/'
+    assert middleware.sheddable('GET', '/api/subjects') is None
+
+
+def test_overloaded_worker_sheds_low_priority_requests(monkeypatch):
+    monkeypatch.setattr(server.loop_monitor, 'overloaded_until', time.monotonic() + 60)
+
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=2, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        async with harness.client() as client:
+            return (
+                await client.get('/api/admin/users', headers=admin),
+                await client.get('/api/updates'),
+                await client.get('/api/subjects'),
+                await client.post('/api/payments/webhook', content=b'{}', headers={'X-Razorpay-Signature': 'bad'}),
+            )
+
+    before = OVERLOAD_SHED.value('GET /api/admin/')
+    admin_list, updates, subjects, webhook = asyncio.run(scenario())
+    assert admin_list.status_code == 503
+    assert admin_list.headers['retry-after'] == '5'
+    assert updates.status_code == 503
+    assert subjects.status_code == 200
+    assert webhook.status_code != 503
+    assert OVERLOAD_SHED.value('GET /api/admin/') == before + 1
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from benchmarks import harness
+from pagination import decode_cursor, encode_cursor
+
+server = harness.server
+
+
+@pytest.fixture
+def seed():
+    return {'users': 1, 'subjects': 150}
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('cbse-class-10-subject1')) == 'cbse-class-10-subject1'
+
+
+def test_plain_list_is_no_longer_capped_at_100(run):
+    async def scenario(client, db, data):
+        return (await client.get('/api/subjects')).json()
+
+    assert len(run(scenario)) == 150
+
+
+def test_pages_cover_every_subject_exactly_once(run):
+    async def scenario(client, db, data):
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'limit': 40, **({'cursor': cursor} if cursor else {})}
+            page = (await client.get('/api/subjects', params=params)).json()
+            seen += [s['id'] for s in page['items']]
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                return seen, pages, [s['id'] for s in data.subjects]
+
+    seen, pages, expected = run(scenario)
+    assert pages == 4
+    assert seen == sorted(expected)
+
+
+def test_bad_cursor_is_rejected(run):
+    async def scenario(client, db, data):
+        return await client.get('/api/subjects', params={'cursor': '%%%'})
+
+    assert run(scenario).status_code == 400
+
+
+def test_streamed_array_matches_the_plain_list(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        url = f"/api/materials/{data.subjects[0]['id']}"
+        plain = (await client.get(url, headers=headers)).json()
+        streamed = await client.get(url, params={'stream': 'true'}, headers=headers)
+        subjects = await client.get('/api/subjects', params={'stream': 'true'})
+        return plain, streamed, subjects
+
+    plain, streamed, subjects = run(scenario, subjects=3, materials_per_subject=450)
+    assert len(plain) == 450
+    assert streamed.headers['content-type'] == 'application/json'
+    assert json.loads(streamed.content) == plain
+    assert len(json.loads(subjects.content)) == 3
+
+
+def test_summary_fields_drop_descriptions(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        url = f"/api/materials/{data.subjects[0]['id']}"
+        return (await client.get(url, params={'fields': 'summary', 'limit': 5}, headers=headers)).json()
+
+    page = run(scenario, subjects=2, materials_per_subject=12)
+    assert len(page['items']) == 5
+    assert page['next_cursor']
+    assert all('description' not in m and m['title'] for m in page['items'])
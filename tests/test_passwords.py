@@ -0,0 +1,51 @@
+import asyncio
+
+import bcrypt
+
+from benchmarks import harness
+from passwords import PASSWORD_COSTS, PasswordHasher, calibrate, hash_cost, hasher_from_env, record_cost_distribution
+
+server = harness.server
+
+
+def test_hash_cost_and_needs_rehash():
+    hasher = PasswordHasher(rounds=10)
+    hashed = hasher.hash('secret')
+    assert hash_cost(hashed) == 10
+    assert hasher.verify('secret', hashed)
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(rounds=11).needs_rehash(hashed)
+    assert hash_cost('not-a-hash') is None
+
+
+def test_rounds_from_env_are_clamped_and_calibrated():
+    assert hasher_from_env({}).rounds == 12
+    assert hasher_from_env({'BCRYPT_ROUNDS': '4'}).rounds == 10
+    assert hasher_from_env({'BCRYPT_ROUNDS': '20', 'BCRYPT_MAX_ROUNDS': '13'}).rounds == 13
+    # A budget no cost can meet falls back to the minimum
+    assert calibrate(target_ms=0.001, min_rounds=10, max_rounds=12) == 10
+    assert 10 <= hasher_from_env({'BCRYPT_ROUNDS': 'auto', 'BCRYPT_MAX_ROUNDS': '11'}).rounds <= 11
+
+
+def test_login_rehashes_outdated_cost_and_reports_distribution(monkeypatch):
+    monkeypatch.setattr(server, 'password_hasher', PasswordHasher(rounds=10))
+    old_hash = bcrypt.hashpw(b'pw-123456', bcrypt.gensalt(rounds=11)).decode()
+
+    async def scenario():
+        db = harness.install_fakes()
+        await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        await db.users.insert_one({'email': 'old@x.test', 'password': old_hash, 'name': 'Old', 'phone': '1', 'city': 'Pune'})
+        async with harness.client() as client:
+            bad = await client.post('/api/auth/login', json={'identifier': 'old@x.test', 'password': 'wrong'})
+            unchanged = (await db.users.find_one({'email': 'old@x.test'}))['password']
+            ok = await client.post('/api/auth/login', json={'identifier': 'old@x.test', 'password': 'pw-123456'})
+        stored = (await db.users.find_one({'email': 'old@x.test'}))['password']
+        await record_cost_distribution(db)
+        return bad.status_code, unchanged, ok.status_code, stored
+
+    bad, unchanged, ok, stored = asyncio.run(scenario())
+    assert bad == 401 and unchanged == old_hash
+    assert ok == 200
+    assert hash_cost(stored) == 10 and bcrypt.checkpw(b'pw-123456', stored.encode())
+    assert PASSWORD_COSTS.value('user', '10') == 2  # seeded user + rehashed one
+    assert PASSWORD_COSTS.value('user', '11') == 0
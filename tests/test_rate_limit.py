@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from benchmarks import harness
+from rate_limit import MemoryRateLimitBackend, MongoRateLimitBackend, RateLimiter
+
+server = harness.server
+
+
+def backends():
+    return [MemoryRateLimitBackend(), MongoRateLimitBackend(AsyncMongoMockClient()['rate_limit_test'].rate_limits)]
+
+
+@pytest.mark.parametrize('backend', backends(), ids=['memory', 'mongo'])
+def test_token_bucket_refills_over_time(backend):
+    async def scenario():
+        fresh = await backend.peek('k', 2, 0.5, 100.0)
+        burst = [await backend.take('k', 2, 0.5, 100.0) for _ in range(3)]
+        # Peeking never takes a token
+        peeked = [await backend.peek('k', 2, 0.5, 101.0) for _ in range(2)]
+        later = await backend.take('k', 2, 0.5, 102.0)
+        return fresh, burst, peeked, later
+
+    fresh, burst, peeked, later = asyncio.run(scenario())
+    assert fresh == 0.0
+    assert peeked == [pytest.approx(1.0), pytest.approx(1.0)]
+    assert burst[:2] == [0.0, 0.0]
+    assert burst[2] == pytest.approx(2.0)
+    # Two seconds at half a token per second buys exactly one more attempt
+    assert later == 0.0
+
+
+@pytest.mark.parametrize('backend', backends(), ids=['memory', 'mongo'])
+def test_failures_slide_out_of_the_window_and_locks_expire(backend):
+    async def scenario():
+        counts = [await backend.add_failure('k', 10, now) for now in (1.0, 2.0, 12.5)]
+        await backend.clear_failures('k')
+        cleared = await backend.add_failure('k', 10, 13.0)
+        await backend.lock('k', 50.0)
+        return counts, cleared, await backend.locked_until('k', 40.0), await backend.locked_until('k', 60.0)
+
+    counts, cleared, locked, expired = asyncio.run(scenario())
+    assert counts == [1, 2, 1]
+    assert cleared == 1
+    assert locked == 50.0
+    assert expired == 0.0
+
+
+def test_memory_backend_evicts_locks_with_the_other_state():
+    backend = MemoryRateLimitBackend(max_keys=3)
+
+    async def scenario():
+        for i in range(10):
+            await backend.take(f"ip{i}", 1, 1.0, 0.0)
+            await backend.lock(f"ip{i}", 100.0)
+
+    asyncio.run(scenario())
+    assert backend.size() == 6
+    assert list(backend._locks) == ['ip7', 'ip8', 'ip9']
+
+
+def test_lockout_is_per_client_and_account():
+    limiter = RateLimiter('test', lockout_threshold=3)
+
+    async def scenario():
+        for _ in range(3):
+            await limiter.record_failure('10.0.0.1', ' Owner@X.test')
+        with pytest.raises(HTTPException) as locked:
+            await limiter.check_account('10.0.0.1', 'owner@x.test')
+        await limiter.check_account('10.0.0.2', 'owner@x.test')
+        await limiter.check_account('10.0.0.1', 'other@x.test')
+        return locked.value
+
+    locked = asyncio.run(scenario())
+    assert locked.status_code == 429
+    assert int(locked.headers['Retry-After']) > 0
+    assert limiter.counters['lockouts'] == 1
+    assert limiter.counters['locked_out'] == 1
+
+
+def test_admin_lockout_does_not_reach_other_clients(monkeypatch):
+    monkeypatch.setattr(server, 'admin_login_limiter', RateLimiter(
+        'admin_login', ip_rate='100/60', identifier_rate='100/60', lockout_threshold=5, lockout_duration=1800,
+    ))
+
+    async def scenario():
+        harness.install_fakes()
+        body = {'email': server.DEFAULT_ADMIN_EMAIL, 'password': 'wrong'}
+        async with harness.client() as client:
+            attacker = [
+                (await client.post('/api/admin/login', json=body, headers={'X-Forwarded-For': '203.0.113.9'})).status_code
+                for _ in range(6)
+            ]
+            owner = await client.post('/api/admin/login', json=body, headers={'X-Forwarded-For': '198.51.100.1'})
+        return attacker, owner.status_code
+
+    attacker, owner = asyncio.run(scenario())
+    assert attacker == [401] * 5 + [429]
+    # The admin's own address still reaches the password check
+    assert owner == 401
+
+
+def test_email_and_phone_share_one_lockout(monkeypatch):
+    monkeypatch.setattr(server, 'login_limiter', RateLimiter(
+        'login', ip_rate='100/60', identifier_rate='100/60', lockout_threshold=4,
+    ))
+
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, subscriptions_per_user=0, updates=1)
+        user = await db.users.find_one({'email': data.users[0]['email']})
+        headers = {'X-Forwarded-For': '203.0.113.9'}
+        async with harness.client() as client:
+            statuses = []
+            for identifier in (user['email'], user['phone']) * 2 + (user['phone'],):
+                response = await client.post('/api/auth/login', headers=headers, json={
+                    'identifier': identifier, 'password': 'wrong',
+                })
+                statuses.append(response.status_code)
+            correct = await client.post('/api/auth/login', headers=headers, json={
+                'identifier': user['email'], 'password': harness.DEFAULT_PASSWORD,
+            })
+        return statuses, correct.status_code
+
+    statuses, correct = asyncio.run(scenario())
+    assert statuses == [401, 401, 401, 401, 429]
+    assert correct == 429
+
+
+def owner_survives_a_flood(path, limiter_name, attacker_body, owner_body, monkeypatch, **limits):
+    """The attacker fails from one address until limited; the owner then signs in from theirs."""
+    monkeypatch.setattr(server, limiter_name, RateLimiter(limiter_name.replace('_limiter', ''), **limits))
+
+    async def scenario():
+        db = harness.install_fakes()
+        await harness.seed(db, users=1, subjects=1, materials_per_subject=1, subscriptions_per_user=0, updates=1)
+        async with harness.client() as client:
+            async def attempt(body, ip):
+                return (await client.post(path, json=body, headers={'X-Forwarded-For': ip})).status_code
+
+            before = await attempt(owner_body, '198.51.100.1')
+            flood = [await attempt(attacker_body, '203.0.113.9') for _ in range(12)]
+            after = await attempt(owner_body, '198.51.100.1')
+            stranger = await attempt(owner_body, '192.0.2.77')
+        return before, flood, after, stranger
+
+    return asyncio.run(scenario())
+
+
+def test_flooding_the_admin_email_does_not_lock_the_admin_out(monkeypatch):
+    email = server.DEFAULT_ADMIN_EMAIL
+    before, flood, after, stranger = owner_survives_a_flood(
+        '/api/admin/login', 'admin_login_limiter',
+        {'email': email, 'password': 'wrong'}, {'email': email, 'password': 'admin123'}, monkeypatch,
+        # Production settings
+        ip_rate='10/60', identifier_rate='5/60', lockout_threshold=5, lockout_duration=1800,
+    )
+    assert before == 200
+    assert flood[:5] == [401] * 5 and set(flood[5:]) == {429}
+    # The admin's own client is trusted; a client the account was never used from waits for the refill
+    assert after == 200
+    assert stranger == 429
+
+
+def test_flooding_a_student_account_does_not_lock_the_student_out(monkeypatch):
+    email = 'student0@bench.test'
+    before, flood, after, _ = owner_survives_a_flood(
+        '/api/auth/login', 'login_limiter',
+        {'identifier': email, 'password': 'wrong'}, {'identifier': email, 'password': harness.DEFAULT_PASSWORD},
+        monkeypatch, ip_rate='60/60', identifier_rate='10/60',
+    )
+    assert before == 200
+    assert flood[:10] == [401] * 10 and set(flood[10:]) == {429}
+    assert after == 200
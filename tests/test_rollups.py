@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from benchmarks import harness
+
+server = harness.server
+
+
+def test_backfill_buckets_and_query_api():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=8, subjects=3, materials_per_subject=1, subscriptions_per_user=2, updates=1)
+        await server.rollup_engine.tick()
+        headers = {'Authorization': f"Bearer {data.admin_token}"}
+        async with harness.client() as client:
+            today = datetime.now(timezone.utc).date()
+            by_board = (await client.get(
+                '/api/admin/analytics', headers=headers,
+                params={'from': (today - timedelta(days=100)).isoformat(), 'group_by': 'board'},
+            )).json()
+            by_city = (await client.get(
+                '/api/admin/analytics', headers=headers,
+                params={'from': (today - timedelta(days=100)).isoformat(), 'group_by': 'city', 'board': 'CBSE'},
+            )).json()
+            stats = (await client.get('/api/admin/stats', headers=headers)).json()
+            bad = await client.get('/api/admin/analytics', headers=headers, params={'group_by': 'email'})
+        revenue = sum(p['amount'] for p in await db.payments.find().to_list(None))
+        return data, by_board, by_city, stats, bad, revenue
+
+    data, by_board, by_city, stats, bad, revenue = asyncio.run(scenario())
+    assert by_board['totals']['revenue'] == revenue
+    assert by_board['totals']['subscriptions'] == 16
+    assert by_board['totals']['new_users'] == 8
+    assert {row['board'] for row in by_board['rows']} == {'', 'CBSE', 'ICSE', 'STATE'}
+    assert by_city['totals']['revenue'] == next(r['revenue'] for r in by_board['rows'] if r['board'] == 'CBSE')
+    assert stats['revenue'] == revenue
+    assert bad.status_code == 400
+
+
+def test_refresh_replaces_a_day_and_tracks_dirty_days():
+    async def scenario():
+        db = harness.install_fakes()
+        await harness.seed(db, users=2, subjects=1, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        engine = server.rollup_engine
+        await engine.tick()
+        today = datetime.now(timezone.utc).date()
+        before = await db.analytics_daily.count_documents({'day': today.isoformat()})
+        await db.payments.update_many({}, {'$set': {'status': 'refunded'}})
+        engine.mark_dirty({'documentKey': {'_id': ObjectId()}})
+        dirty = set(engine.dirty)
+        await engine.tick()
+        buckets = await db.analytics_daily.find({'day': today.isoformat()}).to_list(None)
+        return before, dirty, buckets, engine.dirty
+
+    before, dirty, buckets, remaining = asyncio.run(scenario())
+    assert before > 0
+    assert dirty == {datetime.now(timezone.utc).date()}
+    assert sum(b['revenue'] for b in buckets) == 0
+    assert sum(b['subscriptions'] for b in buckets) == 2
+    assert remaining == set()
+
+
+def test_lease_is_exclusive_until_it_expires():
+    async def scenario():
+        db = harness.install_fakes()
+        first = server.rollup_engine
+        second = server.RollupEngine(db, interval=60)
+        got_first = await first.acquire_lease()
+        got_second = await second.acquire_lease()
+        await db.rollup_state.update_one({'_id': 'lease'}, {'$set': {'expires_at': datetime(2000, 1, 1)}})
+        got_second_later = await second.acquire_lease()
+        return got_first, got_second, got_second_later
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+
+def test_refreshes_of_one_day_take_turns():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=2, subjects=1, materials_per_subject=1, subscriptions_per_user=1, updates=1)
+        engine = server.rollup_engine
+        today = datetime.now(timezone.utc).date()
+        async with engine.claim_day(today):
+            # e.g. the scheduled refresh on the lease holder, while an admin asks for the same day
+            waiting = asyncio.create_task(engine.refresh_day(today))
+            await asyncio.sleep(0.3)
+            blocked = not waiting.done() and await db.analytics_daily.count_documents({}) == 0
+        buckets = await asyncio.wait_for(waiting, 5)
+
+        impatient = server.RollupEngine(db, claim_timeout=0.2)
+        async with engine.claim_day(today):
+            async with harness.client() as client:
+                server.rollup_engine = impatient
+                try:
+                    busy = await client.post('/api/admin/analytics/refresh', headers={
+                        'Authorization': f"Bearer {data.admin_token}"})
+                finally:
+                    server.rollup_engine = engine
+        released = await db.rollup_state.count_documents({'_id': {'$regex': '^day:'}})
+        return blocked, buckets, busy, released
+
+    blocked, buckets, busy, released = asyncio.run(scenario())
+    assert blocked
+    assert buckets > 0
+    assert busy.status_code == 503
+    assert busy.headers['retry-after'] == '5'
+    assert released == 0
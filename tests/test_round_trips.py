@@ -0,0 +1,96 @@
+import pytest
+
+from benchmarks import harness
+
+server = harness.server
+
+
+@pytest.fixture
+def seed():
+    return {'subjects': 3, 'updates': 2}
+
+
+def commands(calls, collection):
+    return [command for name, command in calls if name == collection]
+
+
+def test_register_checks_the_email_before_hashing(run, monkeypatch):
+    hashed = []
+    original = server.hash_password
+    monkeypatch.setattr(server, 'hash_password', lambda password: hashed.append(password) or original(password))
+
+    async def scenario(client, db, data):
+        body = {'email': 'new.student@example.com', 'password': 'pw', 'name': 'New', 'phone': '+91 91111', 'city': 'Pune'}
+        with harness.count_commands(db) as calls:
+            first = await client.post('/api/auth/register', json=body)
+        again = await client.post('/api/auth/register', json=body)
+        return first, again, calls
+
+    first, again, calls = run(scenario)
+    assert first.status_code == 200
+    assert commands(calls, 'users') == ['find_one', 'insert_one']
+    assert again.status_code == 400
+    assert again.json()['detail'] == 'Email already registered'
+    # The repeat was turned away without spending a bcrypt round
+    assert hashed.count('pw') == 1
+
+
+def test_profile_and_password_skip_the_refetch(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.tokens[0]}"}
+        with harness.count_commands(db) as profile_calls:
+            profile = await client.put('/api/auth/update-profile', params={'city': 'Goa'}, headers=headers)
+        with harness.count_commands(db) as password_calls:
+            changed = await client.put('/api/auth/change-password', headers=headers, params={
+                'current_password': harness.DEFAULT_PASSWORD, 'new_password': 'fresh-password'})
+        login = await client.post('/api/auth/login', json={
+            'identifier': data.users[0]['email'], 'password': 'fresh-password'})
+        return profile, profile_calls, changed, password_calls, login
+
+    profile, profile_calls, changed, password_calls, login = run(scenario)
+    assert profile.json()['user']['city'] == 'Goa'
+    assert commands(profile_calls, 'users') == ['find_one', 'find_one_and_update']
+    assert changed.status_code == 200
+    assert commands(password_calls, 'users') == ['find_one', 'update_one']
+    assert login.status_code == 200
+
+
+def test_toggle_flips_in_one_command(run):
+    async def scenario(client, db, data):
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        await db.updates.update_one({'id': 'upd-1'}, {'$unset': {'is_active': ''}})
+        with harness.count_commands(db) as calls:
+            first = await client.put('/api/admin/updates/upd-1/toggle', headers=admin)
+        second = await client.put('/api/admin/updates/upd-1/toggle', headers=admin)
+        missing = await client.put('/api/admin/updates/nope/toggle', headers=admin)
+        return first, second, missing, calls
+
+    first, second, missing, calls = run(scenario)
+    assert commands(calls, 'updates') == ['find_one_and_update']
+    assert first.json()['message'] == 'Update deactivated successfully'  # a missing flag counted as active
+    assert second.json()['message'] == 'Update activated successfully'
+    assert missing.status_code == 404
+
+
+def test_duplicate_boards_and_subjects_are_rejected_by_the_index(run):
+    async def scenario(client, db, data):
+        admin = {'Authorization': f"Bearer {data.admin_token}"}
+        board = {'name': 'igcse', 'full_name': 'IGCSE'}
+        subject = {'board': 'IGCSE', 'class_name': 'Class 9', 'subject_name': 'Physics', 'price': 400}
+        with harness.count_commands(db) as calls:
+            created = [
+                await client.post('/api/admin/boards', json=board, headers=admin),
+                await client.post('/api/admin/subjects', json=subject, headers=admin),
+            ]
+        duplicates = [
+            await client.post('/api/admin/boards', json=board, headers=admin),
+            await client.post('/api/admin/subjects', json=subject, headers=admin),
+            await client.put('/api/admin/boards/cbse', json={'name': 'ICSE', 'full_name': 'x'}, headers=admin),
+        ]
+        return created, duplicates, calls
+
+    created, duplicates, calls = run(scenario)
+    assert [r.status_code for r in created] == [200, 200]
+    assert commands(calls, 'boards') == ['insert_one']
+    assert commands(calls, 'subjects') == ['insert_one']
+    assert [r.status_code for r in duplicates] == [400, 400, 400]
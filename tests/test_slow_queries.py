@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+from benchmarks import harness  # noqa: F401 - puts backend/ on sys.path
+from slow_queries import SlowQueryListener, command_shape, redact, summarize_plan
+
+
+def test_redact_keeps_fields_and_operators_only():
+    query = {'user_email': 'a@x.test', 'end_date': {'$gt': '2026-01-01'}, 'subject_id': {'$in': ['s1', 's2']},
+             '$or': [{'phone': '+91 9'}, {'email': 'b@x.test'}]}
+    assert redact(query) == {
+        '$or': [{'phone': '?'}, {'email': '?'}],
+        'end_date': {'$gt': '?'},
+        'subject_id': {'$in': '?'},
+        'user_email': '?',
+    }
+    assert redact([]) == '?'
+    assert redact(42) == '?'
+
+
+def test_command_shape_per_command():
+    assert command_shape('find', {'find': 'users', 'filter': {'email': 'a@x.test'}, 'sort': {'email': 1}}) == {
+        'filter': {'email': '?'}, 'sort': ['email'],
+    }
+    assert command_shape('count', {'count': 'users', 'query': None}) == {'filter': {}}
+    assert command_shape('aggregate', {'aggregate': 'payments', 'pipeline': [
+        {'$match': {'status': 'captured', 'amount': {'$gte': 100}}},
+        {'$group': {'_id': '$board', 'total': {'$sum': '$amount'}}},
+    ]}) == {'pipeline': [{'$match': {'amount': {'$gte': '?'}, 'status': '?'}}, {'$group': '...'}]}
+    assert command_shape('update', {'update': 'users', 'updates': [
+        {'q': {'email': 'a@x.test'}, 'u': {'$set': {'password': 'secret-hash'}}},
+    ]}) == {'filter': {'email': '?'}}
+    assert command_shape('delete', {'delete': 'sessions', 'deletes': []}) == {'filter': {}}
+    assert command_shape('insert', {'insert': 'users', 'documents': [{'password': 'x'}]}) == {}
+
+
+def test_summarize_plan_walks_nested_stages():
+    explain = {'queryPlanner': {'winningPlan': {'queryPlan': {
+        'stage': 'FETCH',
+        'inputStage': {'stage': 'OR', 'inputStages': [
+            {'stage': 'IXSCAN', 'indexName': 'email_1'},
+            {'stage': 'COLLSCAN'},
+        ]},
+    }}}}
+    plan = summarize_plan(explain)
+    assert plan['stages'][:2] == ['FETCH', 'OR']
+    assert sorted(plan['stages'][2:]) == ['COLLSCAN', 'IXSCAN']
+    assert plan['indexes'] == ['email_1']
+    assert plan['collscan'] is True
+
+
+class FakeExplainDb:
+    def __init__(self):
+        self.explained = []
+        self.slow_query_plans = SimpleNamespace(update_one=lambda *args, **kwargs: None)
+
+    def command(self, name, command, verbosity):
+        self.explained.append(command)
+        return {'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN'}}}
+
+
+def event(request_id, command_name, command, duration_ms):
+    return SimpleNamespace(
+        request_id=request_id, operation_id=request_id, command_name=command_name,
+        command=command, duration_micros=int(duration_ms * 1000),
+    )
+
+
+def test_listener_logs_slow_shapes_without_values_and_explains_each_shape_once():
+    explain_db = FakeExplainDb()
+    listener = SlowQueryListener(
+        threshold_ms=50, explain=True, explain_client_factory=lambda: {'app': explain_db}, db_name='app',
+    )
+    commands = [
+        ('find', {'find': 'users', 'filter': {'email': 'a@x.test'}, 'lsid': {'id': 1}, '$db': 'app'}, 80),
+        ('find', {'find': 'users', 'filter': {'email': 'b@x.test'}, 'lsid': {'id': 2}, '$db': 'app'}, 90),
+        ('find', {'find': 'users', 'filter': {'phone': '+91 9'}}, 10),
+    ]
+    for request_id, (name, command, duration) in enumerate(commands):
+        listener.started(event(request_id, name, command, 0))
+        listener.succeeded(event(request_id, name, command, duration))
+    listener._executor.shutdown(wait=True)
+
+    recent = listener.snapshot()
+    assert [r['duration_ms'] for r in recent] == [80, 90]
+    assert recent[0]['shape'] == {'filter': {'email': '?'}}
+    assert recent[0]['shape_hash'] == recent[1]['shape_hash']
+    assert 'a@x.test' not in repr(recent)
+    # One explain for the shared shape, without the driver's session fields
+    assert explain_db.explained == [{'find': 'users', 'filter': {'email': 'a@x.test'}}]
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks import harness
+
+server = harness.server
+
+
+@pytest.fixture
+def seed():
+    return {'users': 5, 'subjects': 3}
+
+
+def test_grant_creates_extends_and_reports_unknowns(run):
+    async def scenario(client, db, data):
+        headers = {'Authorization': f"Bearer {data.admin_token}"}
+        subject = data.subjects[1]
+        users = [data.users[0]['email'], data.users[1]['phone'], 'nobody@x.test']
+        body = {'users': users, 'subject_ids': [subject['id'], 'missing-subject'], 'duration_months': 2}
+
+        dry = (await client.post('/api/admin/subscriptions/grant', json={**body, 'dry_run': True}, headers=headers)).json()
+        before = await db.subscriptions.count_documents({})
+        result = (await client.post('/api/admin/subscriptions/grant', json=body, headers=headers)).json()
+        after = await db.subscriptions.count_documents({})
+        again = (await client.post('/api/admin/subscriptions/grant', json=body, headers=headers)).json()
+        grants = await db.subscriptions.find({'source': 'grant'}).to_list(None)
+        check = (await client.get(
+            f"/api/subscriptions/check/{subject['id']}", headers={'Authorization': f"Bearer {data.tokens[0]}"}
+        )).json()
+        return dry, before, result, after, again, grants, check
+
+    dry, before, result, after, again, grants, check = run(scenario)
+    # user 1 already owns subject 1 through the seed, user 0 doesn't
+    assert dry == {**result, 'dry_run': True}
+    assert result['unknown_users'] == ['nobody@x.test']
+    assert result['unknown_subjects'] == ['missing-subject']
+    assert (result['granted'], result['extended']) == (1, 1)
+    assert after == before + 2
+    assert (again['granted'], again['extended']) == (0, 2)
+    assert len(grants) == 2
+    assert check['has_subscription'] is True
+    end = datetime.fromisoformat(check['subscription']['end_date'])
+    assert end > datetime.now(timezone.utc) + timedelta(days=110)
+
+
+def test_grant_thousands_of_students_in_one_bulk_write_per_collection(run, monkeypatch):
+    calls = []
+
+    async def scenario(client, db, data):
+        await db.users.insert_many([
+            {'email': f"class{i}@school.test", 'phone': f"+91 8{i:09d}", 'name': 'S', 'city': 'Pune'}
+            for i in range(2000)
+        ])
+        # mongomock upserts scan the collection, so count writes instead of timing them
+        collection_type = type(db.subscriptions)
+        original = collection_type.bulk_write
+
+        def counting_bulk_write(self, operations, *args, **kwargs):
+            calls.append((self.name, len(operations)))
+            return original(self, operations, *args, **kwargs)
+
+        monkeypatch.setattr(collection_type, 'bulk_write', counting_bulk_write)
+        response = await client.post('/api/admin/subscriptions/grant', headers={
+            'Authorization': f"Bearer {data.admin_token}"
+        }, json={'users': [f"class{i}@school.test" for i in range(2000)], 'subject_ids': [data.subjects[0]['id']]})
+        return response.json()
+
+    result = run(scenario)
+    assert result['granted'] == 2000
+    assert calls == [('entitlements', 2000), ('subscriptions', 2000)]
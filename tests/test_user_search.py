@@ -0,0 +1,114 @@
+import asyncio
+
+from benchmarks import harness
+from user_search import backfill_search_keys, build_query, search_keys
+
+server = harness.server
+
+USERS = [
+    {'email': 'priya.sharma@mail.test', 'name': 'Priya Sharma', 'phone': '+91 98765 43210', 'city': 'Pune'},
+    {'email': 'arjun@mail.test', 'name': 'Arjun Priyadarshi', 'phone': '+91 91234 56789', 'city': 'Delhi'},
+    {'email': 'priya@mail.test', 'name': 'Priya', 'phone': '9000000001', 'city': 'Pune'},
+    {'email': 'sharmaji@mail.test', 'name': 'Rohit Kumar', 'phone': '9000000002', 'city': 'Mumbai'},
+]
+
+
+def search(params, backfill=False):
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        await db.users.insert_many([dict(u, password='x', created_at='2025-01-01T00:00:00+00:00') for u in USERS])
+        if backfill:
+            await backfill_search_keys(db, batch_size=2)
+        async with harness.client() as client:
+            response = await client.get(
+                '/api/admin/users/search', params=params, headers={'Authorization': f"Bearer {data.admin_token}"})
+        return response.json()
+
+    return asyncio.run(scenario())
+
+
+def test_search_keys_normalize_name_email_and_phone():
+    keys = search_keys(USERS[0])
+    assert keys['name'] == ['priya sharma', 'priya', 'sharma']
+    assert keys['email'] == 'priya.sharma@mail.test'
+    assert keys['phone'] == ['919876543210', '9876543210']
+    assert build_query('+91 98765') == {'search.phone': {'$regex': '^9198765'}}
+    assert build_query('Priya@', city='Pune ') == {'search.email': {'$regex': '^priya@'}, 'search.city': 'pune'}
+
+
+def test_prefix_search_is_ranked_and_hides_private_fields():
+    result = search({'q': 'priya'}, backfill=True)
+    names = [u['name'] for u in result['results']]
+    # exact, then full-name / email prefixes, then later-word matches
+    assert names == ['Priya', 'Priya Sharma', 'Arjun Priyadarshi']
+    assert all('password' not in u and 'search' not in u for u in result['results'])
+    assert result['total'] == 3
+
+
+def test_city_filter_phone_search_and_pagination():
+    assert [u['name'] for u in search({'q': 'pri', 'city': 'pune'}, backfill=True)['results']] == ['Priya', 'Priya Sharma']
+    assert [u['email'] for u in search({'q': '98765'}, backfill=True)['results']] == ['priya.sharma@mail.test']
+    first = search({'q': 'priya', 'page_size': 2}, backfill=True)
+    # Pages continue the ranking: the exact match leads page 1, the later-word match ends page 2
+    assert [u['name'] for u in first['results']] == ['Priya', 'Priya Sharma']
+    assert first['has_more'] is True
+    page = search({'q': 'priya', 'page_size': 2, 'cursor': first['next_cursor']}, backfill=True)
+    assert [u['name'] for u in page['results']] == ['Arjun Priyadarshi']
+    assert page['has_more'] is False
+    assert page['next_cursor'] is None
+    assert page['total'] == 3
+    assert search({'q': 'priya', 'cursor': 'cHJpeWE'}, backfill=True) == {'detail': 'Invalid cursor'}
+
+
+def test_exact_matches_lead_even_when_they_sort_last_by_email():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=1, subjects=1, materials_per_subject=1, updates=1)
+        await db.users.insert_many([
+            {'email': f"{i:02d}@mail.test", 'name': f"Anand Kumar {i}", 'phone': '', 'city': 'Pune', 'password': 'x'}
+            for i in range(12)
+        ] + [{'email': 'zz@mail.test', 'name': 'Anand', 'phone': '', 'city': 'Pune', 'password': 'x'}])
+        await backfill_search_keys(db)
+        headers = {'Authorization': f"Bearer {data.admin_token}"}
+        names, cursor = [], None
+        async with harness.client() as client:
+            while True:
+                params = {'q': 'anand', 'page_size': 5, **({'cursor': cursor} if cursor else {})}
+                page = (await client.get('/api/admin/users/search', params=params, headers=headers)).json()
+                names += [u['name'] for u in page['results']]
+                cursor = page['next_cursor']
+                if not cursor:
+                    return names
+
+    names = asyncio.run(scenario())
+    assert names[0] == 'Anand'
+    assert names[1:] == sorted(names[1:]) and len(names) == 13
+
+
+def test_browsing_walks_every_user_once():
+    async def scenario():
+        db = harness.install_fakes()
+        data = await harness.seed(db, users=23, subjects=1, materials_per_subject=1, updates=1)
+        headers = {'Authorization': f"Bearer {data.admin_token}"}
+        seen, cursor = [], None
+        async with harness.client() as client:
+            while True:
+                params = {'page_size': 5, **({'cursor': cursor} if cursor else {})}
+                page = (await client.get('/api/admin/users/search', params=params, headers=headers)).json()
+                seen += [u['email'] for u in page['results']]
+                cursor = page['next_cursor']
+                if not cursor:
+                    break
+            bad = await client.get('/api/admin/users/search', params={'cursor': '!!'}, headers=headers)
+        return seen, [u['email'] for u in data.users], bad.status_code
+
+    seen, emails, bad = asyncio.run(scenario())
+    # Every user exactly once
+    assert sorted(seen) == sorted(emails) and len(seen) == len(set(seen))
+    assert bad == 400
+
+
+def test_users_without_search_keys_need_the_backfill():
+    assert search({'q': 'rohit'})['results'] == []
+    assert [u['name'] for u in search({'q': 'rohit'}, backfill=True)['results']] == ['Rohit Kumar']